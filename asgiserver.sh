@@ -0,0 +1,12 @@
+#!/bin/sh
+# Альтернативный профиль: ASGI-сервер uvicorn с несколькими процессами.
+# Включайте, если замер на своей базе (README, «Нагрузочный тест») покажет
+# выигрыш перед wsgiserver.sh.
+source .venv/bin/activate
+PYTHONPATH=. uvicorn mysite.asgi:application \
+    --app-dir mysite \
+    --host 0.0.0.0 \
+    --port ${PORT:-8000} \
+    --workers ${WEB_CONCURRENCY:-4} \
+    --backlog 2048 \
+    --no-access-log
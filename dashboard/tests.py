@@ -1,3 +1,31 @@
+from datetime import date
+from decimal import Decimal
+
+from django.core.cache import cache
 from django.test import TestCase
+from django.urls import reverse
+
+from inventory.models import Inventory, Product, Role, Staff, Warehouse
+from inventory.services import OUTGOING, post_document
+
+
+class RevenueChartTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.manager = Staff.objects.create_user('manager', password='secret', role=Role.objects.create(role_name='Менеджер'))
+        warehouse = Warehouse.objects.create(name='Основной')
+        product = Product.objects.create(product_name='Болт', serial_number='SN-1')
+        Inventory.objects.create(product=product, warehouse=warehouse, quantity=10)
+        post_document(OUTGOING, warehouse, [{'product': product, 'quantity': 3, 'price': Decimal('2.00')}], date=date.today())
+
+    def setUp(self):
+        cache.clear()
 
-# Create your tests here.
+    async def test_revenue_for_last_seven_days(self):
+        await self.async_client.aforce_login(self.manager)
+        response = await self.async_client.get(reverse('revenue-chart-data'))
+        body = response.json()
+        self.assertEqual(len(body['labels']), 7)
+        self.assertEqual(body['labels'][-1], date.today().isoformat())
+        self.assertEqual(Decimal(str(body['data'][-1])), Decimal('6.00'))
+        self.assertEqual(body['data'][:-1], [0] * 6)
@@ -2,6 +2,7 @@ from django.shortcuts import render, redirect
 from django.contrib.auth import logout
 from django.contrib.auth.decorators import login_required, user_passes_test
 # from inventory.models import Stock, Document, OutgoingItem, OutgoingTransaction
+from inventory.models import Transaction
 from django.db.models import Sum, F, ExpressionWrapper, DecimalField
 from datetime import date, timedelta
 from django.http import JsonResponse
@@ -75,24 +76,24 @@ def dashboard_view(request):
 
 @login_required
 @manager_required
-def revenue_chart_data(request):
+async def revenue_chart_data(request):
     """Предоставляет данные для графика выручки."""
     today = date.today()
     start_date = today - timedelta(days=6)
     
     revenue_by_day = { (start_date + timedelta(days=i)).strftime('%Y-%m-%d'): 0 for i in range(7) }
 
-    # sales_data = OutgoingItem.objects.filter(
-    #     outgoing_transaction__document__document_date__date__gte=start_date
-    # ).annotate(
-    #     sale_date=F('outgoing_transaction__document__document_date__date'),
-    #     revenue=ExpressionWrapper(F('quantity') * F('product__selling_price'), output_field=DecimalField())
-    # ).values('sale_date').annotate(daily_revenue=Sum('revenue')).order_by('sale_date')
-
-    # for entry in sales_data:
-    #     day_str = entry['sale_date'].strftime('%Y-%m-%d')
-    #     if day_str in revenue_by_day:
-    #         revenue_by_day[day_str] = entry['daily_revenue']
+    sales_data = Transaction.objects.filter(
+        document__document_type='Расход',
+        document__date__gte=start_date,
+    ).values(sale_date=F('document__date')).annotate(
+        daily_revenue=Sum(F('quantity') * F('price'))
+    ).order_by('sale_date')
+
+    async for entry in sales_data:
+        day_str = entry['sale_date'].strftime('%Y-%m-%d')
+        if day_str in revenue_by_day:
+            revenue_by_day[day_str] = entry['daily_revenue']
             
     labels = list(revenue_by_day.keys())
     data = list(revenue_by_day.values())
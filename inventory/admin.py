@@ -1,9 +1,151 @@
 from django.contrib import admin
+from django.contrib.admin.widgets import AutocompleteSelect
 from django.contrib.auth.admin import UserAdmin
+from django.core.exceptions import ValidationError
+from django.core.paginator import Paginator
+from django.db import connections
+from django.forms.models import BaseInlineFormSet
+from django.utils.functional import cached_property
 from .models import (
     Role, Staff, Warehouse, Supplier, Customer, Product, 
-    Document, Transaction
+    Document, Transaction, Lot, BinLocation, BinStock
 )
+from .services import apply_counterparty_activity, counterparty_activity, refresh_document_totals
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Пагинатор для больших списков админки: на PostgreSQL число строк
+    нефильтрованного списка берется из статистики планировщика (pg_class)
+    вместо COUNT(*) по всей таблице. Точный подсчет остается для списков с
+    фильтром или поиском и для таблиц меньше ESTIMATE_THRESHOLD строк.
+    """
+    ESTIMATE_THRESHOLD = 100_000
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        connection = connections[queryset.db]
+        if connection.vendor == 'postgresql' and not queryset.query.where:
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    'SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass',
+                    [queryset.model._meta.db_table],
+                )
+                row = cursor.fetchone()
+            if row and row[0] >= self.ESTIMATE_THRESHOLD:
+                return row[0]
+        return super().count
+
+
+class PaginatedInlineFormSet(BaseInlineFormSet):
+    """
+    Формсет встроенных строк, показывающий одну страницу строк объекта
+    (?lines_page=N). Сохраняются только строки показанной страницы.
+    """
+    per_page = 50
+    page_number = None
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        ids = self.queryset.order_by('pk').values_list('pk', flat=True)
+        self.page = Paginator(ids, self.per_page).get_page(self.page_number)
+        self.page_range = self.page.paginator.get_elided_page_range(self.page.number)
+        self.queryset = self.queryset.filter(pk__in=list(self.page.object_list)).order_by('pk')
+
+
+class PreloadedAutocompleteSelect(AutocompleteSelect):
+    """
+    AutocompleteSelect, который берет выбранный объект из словаря loaded
+    (строка pk → объект), заполняемого формсетом. Стандартный виджет делает
+    запрос на каждое поле каждой строки. Без loaded или при неизвестном
+    значении работает как стандартный.
+    """
+    loaded = None
+
+    def optgroups(self, name, value, attr=None):
+        selected = [item for item in value if str(item) not in self.choices.field.empty_values]
+        if self.loaded is None or any(str(item) not in self.loaded for item in selected):
+            return super().optgroups(name, value, attr)
+        options = []
+        if not self.is_required and not self.allow_multiple_selected:
+            options.append(self.create_option(name, '', '', False, 0))
+        for item in selected:
+            obj = self.loaded[str(item)]
+            options.append(self.create_option(
+                name, obj.pk, self.choices.field.label_from_instance(obj), True, len(options)
+            ))
+        return [(None, options, 0)]
+
+
+class PreloadedChoicesInlineFormSet(PaginatedInlineFormSet):
+    """
+    Формсет, который заранее собирает выбранные объекты для полей с
+    PreloadedAutocompleteSelect. Объекты сохраненных строк берутся из уже
+    загруженных связей (select_related). Значения, введенные заново, читаются
+    одним запросом на поле для всего формсета.
+    """
+
+    @cached_property
+    def forms(self):
+        forms = super().forms
+        for name, field in self.form.base_fields.items():
+            if isinstance(getattr(field.widget, 'widget', field.widget), PreloadedAutocompleteSelect):
+                self._preload_choices(forms, name, field)
+        return forms
+
+    def _preload_choices(self, forms, name, field):
+        loaded = {}
+        for form in forms:
+            if form.instance.pk is not None and (obj := getattr(form.instance, name)) is not None:
+                loaded[str(obj.pk)] = obj
+        missing = {
+            str(value) for form in forms
+            if (value := form[name].value()) not in field.empty_values and str(value) not in loaded
+        }
+        if missing:
+            loaded.update((str(obj.pk), obj) for obj in field.queryset.filter(pk__in=missing))
+        for form in forms:
+            widget = form.fields[name].widget
+            getattr(widget, 'widget', widget).loaded = loaded
+
+
+class TransactionInlineFormSet(PreloadedChoicesInlineFormSet):
+    """
+    Строки документа в админке. Остатки, outbox и журнал аудита меняет только
+    проведение, поэтому здесь строки не добавляются и не удаляются, а их товар,
+    количество и склад не меняются; правятся цена и контрагент, итоги
+    документа при этом пересчитываются. Строки товаров с учетом партий не
+    меняются вовсе: иначе их распределение по партиям (LotAllocation)
+    разойдется со строкой.
+    """
+    stock_fields = {'product', 'quantity', 'warehouse'}
+
+    def clean(self):
+        super().clean()
+        touched = {
+            form: {form.initial.get('product'), getattr(form.cleaned_data.get('product'), 'pk', None)} - {None}
+            for form in self.forms
+            if form.has_changed() or (form.instance.pk is not None and self._should_delete_form(form))
+        }
+        # Ошибка всего формсета: ошибки удаляемых строк формсет не учитывает.
+        if any(
+            form.instance.pk is None or self._should_delete_form(form) or self.stock_fields & set(form.changed_data)
+            for form in touched
+        ):
+            raise ValidationError(
+                'Состав строк, их товар, количество и склад меняются только проведением документа.',
+                code='stock_line',
+            )
+        tracked = set(
+            Product.objects.filter(pk__in=set().union(*touched.values()), tracks_lots=True)
+            .values_list('pk', flat=True)
+        )
+        if any(product_ids & tracked for product_ids in touched.values()):
+            raise ValidationError(
+                'Строки товаров с учетом партий меняются только проведением документа.', code='tracked_lot'
+            )
+
 
 @admin.register(Role)
 class RoleAdmin(admin.ModelAdmin):
@@ -28,7 +170,8 @@ class WarehouseAdmin(admin.ModelAdmin):
 
 @admin.register(Supplier)
 class SupplierAdmin(admin.ModelAdmin):
-    list_display = ('name',)
+    list_display = ('name', 'lead_time_days')
+    list_editable = ('lead_time_days',)
     search_fields = ('name',)
 
 @admin.register(Customer)
@@ -38,16 +181,103 @@ class CustomerAdmin(admin.ModelAdmin):
 
 @admin.register(Product)
 class ProductAdmin(admin.ModelAdmin):
-    list_display = ('product_name', 'serial_number', 'minimum_stock_level')
+    list_display = ('product_name', 'serial_number', 'minimum_stock_level', 'tracks_lots')
     list_editable = ('minimum_stock_level',)
+    list_filter = ('tracks_lots',)
     search_fields = ('product_name', 'serial_number')
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+class BinStockInline(admin.TabularInline):
+    model = BinStock
+    extra = 1
+    autocomplete_fields = ('product',)
+
+@admin.register(BinLocation)
+class BinLocationAdmin(admin.ModelAdmin):
+    list_display = ('code', 'warehouse', 'zone', 'aisle', 'shelf')
+    list_filter = ('warehouse', 'zone')
+    search_fields = ('code',)
+    ordering = ('warehouse', 'zone', 'aisle', 'shelf')
+    inlines = [BinStockInline]
+
+@admin.register(Lot)
+class LotAdmin(admin.ModelAdmin):
+    list_display = ('lot_number', 'product', 'warehouse', 'expiry_date', 'quantity')
+    list_select_related = ('product', 'warehouse')
+    list_filter = ('warehouse',)
+    search_fields = ('lot_number', 'product__product_name', 'product__serial_number')
+    date_hierarchy = 'expiry_date'
+    autocomplete_fields = ('product', 'warehouse')
+    # Остаток партии меняют только проведения, иначе он разойдется с Inventory.
+    readonly_fields = ('quantity',)
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
 
 class TransactionInline(admin.TabularInline):
     model = Transaction
-    extra = 1
+    # Новые строки добавляет только проведение (TransactionInlineFormSet).
+    extra = 0
+    formset = TransactionInlineFormSet
+    template = 'admin/inventory/document/transaction_inline.html'
+    # Поля выбора подгружают варианты поиском, а не выводят весь каталог
+    # в <select> каждой строки.
+    autocomplete_fields = ('product', 'supplier', 'customer', 'warehouse')
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related('product', 'supplier', 'customer', 'warehouse')
+
+    def formfield_for_foreignkey(self, db_field, request, **kwargs):
+        if db_field.name in self.autocomplete_fields:
+            kwargs['widget'] = PreloadedAutocompleteSelect(db_field, self.admin_site, using=kwargs.get('using'))
+        return super().formfield_for_foreignkey(db_field, request, **kwargs)
+
+    def get_formset(self, request, obj=None, **kwargs):
+        formset = super().get_formset(request, obj, **kwargs)
+        formset.page_number = request.GET.get('lines_page')
+        return formset
 
 @admin.register(Document)
 class DocumentAdmin(admin.ModelAdmin):
-    list_display = ('id', 'document_type', 'date')
+    list_display = ('id', 'document_type', 'date', 'line_count', 'total_quantity', 'total_amount')
     list_filter = ('document_type',)
+    date_hierarchy = 'date'
+    readonly_fields = ('posted_by', 'line_count', 'total_quantity', 'total_amount')
     inlines = [TransactionInline]
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+    def get_readonly_fields(self, request, obj=None):
+        # Смена типа проведенного документа перевернула бы знак его строк в остатках.
+        if obj is not None:
+            return ('document_type',) + self.readonly_fields
+        return self.readonly_fields
+
+    def save_model(self, request, obj, form, change):
+        # Вклад документа в итоги по контрагентам до правки: заголовок и строки
+        # в базе еще прежние. Хранится в самом объекте, а не в общем для всех
+        # запросов экземпляре ModelAdmin.
+        obj.counterparty_activity_before = counterparty_activity(Document.objects.filter(pk=obj.pk)) if change else None
+        super().save_model(request, obj, form, change)
+
+    def save_related(self, request, form, formsets, change):
+        super().save_related(request, form, formsets, change)
+        # Страница изменения админки выполняется в транзакции, поэтому итоги
+        # документа и итоги по контрагентам обновляются атомарно вместе со
+        # строками. В итоги по контрагентам переносится только разница
+        # вклада документа до и после правки.
+        document = form.instance
+        refresh_document_totals(Document.objects.filter(pk=document.pk))
+        apply_counterparty_activity(
+            document.counterparty_activity_before, counterparty_activity(Document.objects.filter(pk=document.pk))
+        )
+
+    def delete_model(self, request, obj):
+        before = counterparty_activity(Document.objects.filter(pk=obj.pk))
+        super().delete_model(request, obj)
+        apply_counterparty_activity(before)
+
+    def delete_queryset(self, request, queryset):
+        before = counterparty_activity(queryset)
+        super().delete_queryset(request, queryset)
+        apply_counterparty_activity(before)
@@ -0,0 +1,93 @@
+import atexit
+import logging
+import os
+import threading
+
+from django.conf import settings
+from django.db import close_old_connections, transaction as db_transaction
+
+from .models import StockAuditRecord
+from .write_queue import write_queue
+
+logger = logging.getLogger(__name__)
+
+
+class AuditLog:
+    """
+    Внутрипроцессный буфер журнала аудита.
+
+    Записи попадают в буфер только после фиксации транзакции проведения
+    (on_commit), а в базу их пишет фоновый поток одним bulk_create — как
+    только набирается AUDIT_LOG_BATCH_SIZE записей или проходит
+    AUDIT_LOG_FLUSH_INTERVAL секунд. Проведение не ждет записи журнала.
+    При штатном завершении процесса остаток буфера записывается (atexit);
+    пачка, которую не удалось записать, возвращается в буфер и пишется снова.
+    """
+
+    def __init__(self):
+        self._buffer = []
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+
+    def record(self, records):
+        """Добавляет записи в буфер после фиксации текущей транзакции."""
+        if records:
+            db_transaction.on_commit(lambda: self._append(records))
+
+    def _append(self, records):
+        with self._lock:
+            self._buffer.extend(records)
+            full = len(self._buffer) >= settings.AUDIT_LOG_BATCH_SIZE
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='inventory-audit-log', daemon=True)
+                self._thread.start()
+        if full:
+            self._wakeup.set()
+
+    def flush(self, direct=False):
+        """
+        Записывает все накопленные записи и возвращает их число. direct —
+        писать в текущем потоке, минуя очередь записи (при завершении
+        процесса ее поток может быть уже недоступен).
+        """
+        # Завершение процесса ждет пачку, которую в этот момент пишет фоновый поток.
+        with self._flush_lock:
+            with self._lock:
+                records, self._buffer = self._buffer, []
+            if not records:
+                return 0
+            try:
+                if direct:
+                    StockAuditRecord.objects.bulk_create(records, batch_size=1000)
+                else:
+                    write_queue.submit(StockAuditRecord.objects.bulk_create, records, batch_size=1000)
+            except Exception:
+                logger.exception('Не удалось записать %d записей журнала аудита', len(records))
+                with self._lock:
+                    self._buffer[:0] = records
+                return 0
+            return len(records)
+
+    def _run(self):
+        while True:
+            self._wakeup.wait(settings.AUDIT_LOG_FLUSH_INTERVAL)
+            self._wakeup.clear()
+            close_old_connections()
+            self.flush()
+
+    def _reset_after_fork(self):
+        # Потоки не переживают fork, а записи родителя запишет сам родитель.
+        self._buffer = []
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+
+
+audit_log = AuditLog()
+atexit.register(audit_log.flush, direct=True)
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=audit_log._reset_after_fork)
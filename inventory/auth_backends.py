@@ -0,0 +1,56 @@
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.backends import ModelBackend
+from django.core.cache import cache
+
+UserModel = get_user_model()
+
+# Сколько держать пользователя в общем кеше (AUTH_CACHE_MAX_AGE = None):
+# сбрасывается он и так при каждом изменении.
+USER_CACHE_TIMEOUT = 3600
+
+
+def user_cache_key(user_id):
+    return f'auth:user:{user_id}'
+
+
+def _timeout():
+    return settings.AUTH_CACHE_MAX_AGE if settings.AUTH_CACHE_MAX_AGE is not None else USER_CACHE_TIMEOUT
+
+
+def forget_users(user_ids):
+    """Сбрасывает закешированных пользователей (после изменения их или их роли)."""
+    cache.delete_many([user_cache_key(user_id) for user_id in user_ids])
+
+
+class CachedModelBackend(ModelBackend):
+    """
+    ModelBackend, который берет пользователя сессии вместе с ролью из кеша
+    вместо двух запросов (пользователь и роль) на каждый запрос, а в
+    асинхронных представлениях — еще двух для шаблона.
+
+    Запись сбрасывается при сохранении и удалении пользователя или его роли
+    (inventory.signals), поэтому смена пароля, роли или блокировка
+    действуют сразу в этом процессе, а при кеше в памяти других воркеров —
+    не позже чем через AUTH_CACHE_MAX_AGE секунд.
+    """
+
+    def get_user(self, user_id):
+        key = user_cache_key(user_id)
+        user = cache.get(key)
+        if user is None:
+            user = UserModel._default_manager.select_related('role').filter(pk=user_id).first()
+            if user is None:
+                return None
+            cache.set(key, user, _timeout())
+        return user if self.user_can_authenticate(user) else None
+
+    async def aget_user(self, user_id):
+        key = user_cache_key(user_id)
+        user = await cache.aget(key)
+        if user is None:
+            user = await UserModel._default_manager.select_related('role').filter(pk=user_id).afirst()
+            if user is None:
+                return None
+            await cache.aset(key, user, _timeout())
+        return user if self.user_can_authenticate(user) else None
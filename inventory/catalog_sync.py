@@ -0,0 +1,82 @@
+"""
+Разностная синхронизация каталога для сканеров с офлайн-каталогом.
+
+Клиент хранит токен прошлой синхронизации и получает только товары,
+сохраненные после него, и удаленные с тех пор товары. Без токена отдается
+весь каталог, и клиент заменяет свой целиком. Ответ — JSON Lines: строка на
+товар ({"id", "product_name", "serial_number", "minimum_stock_level"}) или на
+удаление ({"id", "deleted": true}); последняя строка — {"token": ...} для
+следующего запроса.
+
+Изменения берутся в полуинтервале (токен, сейчас − SETTLE_DELAY]. Метка
+updated_at ставится при сохранении, а видна строка становится только после
+фиксации транзакции. Поэтому самые свежие секунды откладываются до
+следующей синхронизации, иначе строку, которая зафиксировалась позже
+чтения, но с меньшей меткой, клиент не получил бы никогда.
+"""
+import json
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.utils import timezone
+
+from .models import Product, ProductTombstone
+
+SETTLE_DELAY = timedelta(seconds=5)
+# Токен — число микросекунд от EPOCH: точен и не требует экранирования в URL.
+EPOCH = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+CURSOR_CHUNK_SIZE = 2000
+LINES_PER_CHUNK = 500
+
+
+def parse_token(token):
+    """Момент, до которого клиент уже синхронизирован; None — полная выгрузка."""
+    if not token:
+        return None
+    try:
+        return EPOCH + timedelta(microseconds=int(token))
+    except OverflowError:
+        raise ValueError(f'token вне допустимого диапазона: {token}')
+
+
+def make_token(moment):
+    return str((moment - EPOCH) // timedelta(microseconds=1))
+
+
+def catalog_changes(since):
+    """
+    Байтовые куски ответа JSON Lines (по LINES_PER_CHUNK строк) с
+    изменениями каталога после since; последняя строка — новый токен.
+    """
+    until = timezone.now() - SETTLE_DELAY
+    if since is not None and since >= until:
+        # Повтор в пределах SETTLE_DELAY: новых зафиксированных изменений нет.
+        until = since
+    products = Product.objects.filter(updated_at__lte=until).order_by('updated_at', 'id')
+    if since is not None:
+        products = products.filter(updated_at__gt=since)
+        deleted = ProductTombstone.objects.filter(deleted_at__gt=since, deleted_at__lte=until) \
+            .order_by('deleted_at').values_list('product_id', flat=True)
+    else:
+        deleted = []
+
+    lines = []
+    rows = products.values_list('id', 'product_name', 'serial_number', 'minimum_stock_level') \
+        .iterator(chunk_size=CURSOR_CHUNK_SIZE)
+    for product_id, product_name, serial_number, minimum_stock_level in rows:
+        lines.append(json.dumps({
+            'id': product_id,
+            'product_name': product_name,
+            'serial_number': serial_number,
+            'minimum_stock_level': minimum_stock_level,
+        }, ensure_ascii=False))
+        if len(lines) >= LINES_PER_CHUNK:
+            yield _chunk(lines)
+            lines = []
+    for product_id in deleted:
+        lines.append(json.dumps({'id': product_id, 'deleted': True}))
+    lines.append(json.dumps({'token': make_token(until)}))
+    yield _chunk(lines)
+
+
+def _chunk(lines):
+    return ('\n'.join(lines) + '\n').encode()
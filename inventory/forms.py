@@ -1,25 +1,99 @@
+import uuid
+from collections import defaultdict
+
 from django import forms
-from .models import Product, Warehouse
+from django.core.exceptions import ValidationError
+from django.utils.functional import cached_property
+from .models import Customer, Inventory, Product, Supplier, Warehouse
+
+class PrefetchedModelChoiceField(forms.ModelChoiceField):
+    """
+    ModelChoiceField, который ищет выбранный объект в заранее загруженном
+    словаре objects (pk → объект), а не отдельным запросом на каждое поле.
+    """
+    objects = None
+
+    def to_python(self, value):
+        if self.objects is None or value in self.empty_values:
+            return super().to_python(value)
+        try:
+            return self.objects[int(value)]
+        except (KeyError, TypeError, ValueError):
+            raise ValidationError(self.error_messages['invalid_choice'], code='invalid_choice')
 
 class ProductForm(forms.Form):
-    product = forms.ModelChoiceField(queryset=Product.objects.all(), label="Продукт")
+    product = PrefetchedModelChoiceField(queryset=Product.objects.all(), label="Продукт")
     quantity = forms.IntegerField(min_value=1, label="Количество")
     price = forms.DecimalField(max_digits=10, decimal_places=2, label="Цена за единицу")
+    # Обязательны в приходе товаров с учетом партий (проверяется при проведении).
+    lot_number = forms.CharField(max_length=64, required=False, label="Партия")
+    expiry_date = forms.DateField(required=False, label="Годен до", widget=forms.DateInput(attrs={'type': 'date'}))
 
 class BaseProductFormSet(forms.BaseFormSet):
+    """
+    Строки документа. Товары всех строк загружаются одним запросом. Если
+    задан warehouse (расход), clean сверяет запрошенное с остатками склада
+    одним запросом: строки одного товара суммируются, а нехватка
+    показывается в каждой такой строке до проведения документа.
+    """
+    warehouse = None
+
+    @cached_property
+    def products(self):
+        ids = {
+            self.data.get(self.add_prefix(f'{index}-product'))
+            for index in range(self.total_form_count())
+        }
+        return self.form.base_fields['product'].queryset.in_bulk([int(pk) for pk in ids if pk and pk.isdigit()])
+
+    def _construct_form(self, i, **kwargs):
+        form = super()._construct_form(i, **kwargs)
+        if self.is_bound:
+            form.fields['product'].objects = self.products
+        return form
+
     def clean(self):
-        if any(self.errors):
+        if any(self.errors) or self.warehouse is None:
             return
-        # Здесь можно добавить дополнительную логику валидации для всего набора форм
+        lines = [form for form in self.forms if form.cleaned_data]
+        requested = defaultdict(int)
+        for form in lines:
+            requested[form.cleaned_data['product'].pk] += form.cleaned_data['quantity']
+        available = dict(
+            Inventory.objects.filter(warehouse=self.warehouse, product_id__in=requested)
+            .values_list('product_id', 'quantity')
+        )
+        for form in lines:
+            product_id = form.cleaned_data['product'].pk
+            if requested[product_id] > available.get(product_id, 0):
+                form.add_error('quantity', (
+                    f'Недостаточно на складе «{self.warehouse}»: в наличии {available.get(product_id, 0)} шт., '
+                    f'по всем строкам с этим товаром запрошено {requested[product_id]} шт.'
+                ))
 
 ProductFormSet = forms.formset_factory(ProductForm, formset=BaseProductFormSet, extra=1)
 
+def new_idempotency_key():
+    # Ключ выдается при открытии формы, поэтому повторная отправка той же
+    # формы (потеря связи, двойной клик) несет тот же ключ.
+    return uuid.uuid4().hex
+
 class IncomingTransactionForm(forms.Form):
     warehouse = forms.ModelChoiceField(queryset=Warehouse.objects.all(), label="Склад")
+    # Поставщик записывается во все строки документа (итоги по поставщикам).
+    supplier = forms.ModelChoiceField(queryset=Supplier.objects.order_by('name'), required=False, label="Поставщик")
+    idempotency_key = forms.CharField(
+        max_length=64, required=False, widget=forms.HiddenInput, initial=new_idempotency_key
+    )
     products = ProductFormSet
 
 class OutgoingTransactionForm(forms.Form):
     warehouse = forms.ModelChoiceField(queryset=Warehouse.objects.all(), label="Склад")
+    # Клиент записывается во все строки документа (итоги по клиентам).
+    customer = forms.ModelChoiceField(queryset=Customer.objects.order_by('name'), required=False, label="Клиент")
+    idempotency_key = forms.CharField(
+        max_length=64, required=False, widget=forms.HiddenInput, initial=new_idempotency_key
+    )
     products = ProductFormSet
 
 class DocumentForm(forms.Form):
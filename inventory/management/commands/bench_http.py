@@ -0,0 +1,137 @@
+import asyncio
+import statistics
+import time
+from urllib.parse import urlsplit
+
+from django.core.management.base import BaseCommand, CommandError
+
+
+async def _read_response(reader):
+    """Читает один HTTP/1.1-ответ. Возвращает (код, закрыл ли сервер соединение)."""
+    status_line = await reader.readline()
+    if not status_line:
+        raise ConnectionError('Сервер закрыл соединение')
+    status = int(status_line.split()[1])
+
+    length, chunked, close = None, False, False
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b''):
+            break
+        name, _, value = line.decode('latin-1').partition(':')
+        name, value = name.strip().lower(), value.strip().lower()
+        if name == 'content-length':
+            length = int(value)
+        elif name == 'transfer-encoding' and 'chunked' in value:
+            chunked = True
+        elif name == 'connection' and value == 'close':
+            close = True
+
+    if chunked:
+        while True:
+            size = int((await reader.readline()).split(b';')[0], 16)
+            await reader.readexactly(size + 2)
+            if size == 0:
+                break
+    elif length is not None:
+        await reader.readexactly(length)
+    else:
+        await reader.read()
+        close = True
+    return status, close
+
+
+async def _client(host, port, request, deadline, latencies, errors):
+    reader = writer = None
+    while time.perf_counter() < deadline:
+        started = time.perf_counter()
+        try:
+            if writer is None:
+                reader, writer = await asyncio.open_connection(host, port)
+            writer.write(request)
+            status, close = await _read_response(reader)
+        except (OSError, ConnectionError, asyncio.IncompleteReadError, ValueError):
+            errors.append(None)
+            if writer is not None:
+                writer.close()
+            reader = writer = None
+            await asyncio.sleep(0.05)
+            continue
+
+        if 200 <= status < 400:
+            latencies.append(time.perf_counter() - started)
+        else:
+            errors.append(status)
+        if close:
+            writer.close()
+            reader = writer = None
+
+    if writer is not None:
+        writer.close()
+
+
+async def _run_level(url, clients, duration, cookie):
+    parts = urlsplit(url)
+    path = parts.path or '/'
+    if parts.query:
+        path += '?' + parts.query
+    headers = [
+        f'GET {path} HTTP/1.1',
+        f'Host: {parts.netloc}',
+        'Connection: keep-alive',
+    ]
+    if cookie:
+        headers.append(f'Cookie: {cookie}')
+    request = ('\r\n'.join(headers) + '\r\n\r\n').encode('latin-1')
+
+    latencies, errors = [], []
+    deadline = time.perf_counter() + duration
+    await asyncio.gather(*(
+        _client(parts.hostname, parts.port or 80, request, deadline, latencies, errors)
+        for _ in range(clients)
+    ))
+    return latencies, errors
+
+
+class Command(BaseCommand):
+    help = (
+        'Нагрузочный тест: пропускная способность и задержки при заданном числе '
+        'одновременных клиентов. Позволяет сравнить WSGI- и ASGI-развертывание, '
+        'передав адреса одного и того же представления на обоих серверах.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('urls', nargs='+', help='Адреса для проверки (http://host:port/path)')
+        parser.add_argument('--clients', default='50,100,250,500',
+                            help='Уровни конкурентности через запятую')
+        parser.add_argument('--duration', type=float, default=10.0,
+                            help='Длительность каждого уровня в секундах')
+        parser.add_argument('--cookie', default='',
+                            help='Cookie для авторизованных страниц, например "sessionid=..."')
+
+    def handle(self, *args, **options):
+        try:
+            levels = [int(value) for value in options['clients'].split(',')]
+        except ValueError:
+            raise CommandError('--clients должен быть списком целых чисел через запятую')
+
+        header = f"{'клиентов':>9} {'запросов':>9} {'RPS':>9} {'p50, мс':>9} {'p95, мс':>9} {'ошибок':>7}"
+        for url in options['urls']:
+            if urlsplit(url).scheme != 'http':
+                raise CommandError(f'Поддерживается только http://: {url}')
+            self.stdout.write(self.style.MIGRATE_HEADING(url))
+            self.stdout.write(header)
+            for clients in levels:
+                latencies, errors = asyncio.run(
+                    _run_level(url, clients, options['duration'], options['cookie'])
+                )
+                if latencies:
+                    latencies.sort()
+                    p50 = statistics.median(latencies) * 1000
+                    p95 = latencies[int(len(latencies) * 0.95) - 1] * 1000
+                else:
+                    p50 = p95 = 0.0
+                rps = len(latencies) / options['duration']
+                self.stdout.write(
+                    f'{clients:>9} {len(latencies):>9} {rps:>9.1f} {p50:>9.1f} {p95:>9.1f} {len(errors):>7}'
+                )
@@ -0,0 +1,126 @@
+import multiprocessing
+import random
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from decimal import Decimal
+from pathlib import Path
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, OperationalError, connections
+from django.test.utils import override_settings
+
+from inventory.audit import audit_log
+from inventory.models import (
+    Customer, CustomerActivity, Document, Inventory, Product, Role, Staff, StockAuditRecord, StockEvent,
+    Supplier, SupplierActivity, Transaction, Warehouse,
+)
+from inventory.services import INCOMING, OUTGOING, post_document
+
+
+def _post_batch(seed, documents, lines, product_ids, warehouse_id):
+    """Проводит documents документов подряд, чередуя приход и расход."""
+    rnd = random.Random(seed)
+    products = list(Product.objects.filter(pk__in=product_ids))
+    warehouse = Warehouse.objects.get(pk=warehouse_id)
+    stats = {'posted': 0, 'locked': 0, 'failed': 0}
+    try:
+        for number in range(documents):
+            items = [
+                {'product': rnd.choice(products), 'quantity': rnd.randint(1, 3), 'price': Decimal('10.00')}
+                for _ in range(lines)
+            ]
+            try:
+                post_document(INCOMING if number % 2 == 0 else OUTGOING, warehouse, items)
+            except OperationalError as error:
+                stats['locked' if 'locked' in str(error) else 'failed'] += 1
+            except ValidationError:
+                stats['failed'] += 1
+            else:
+                stats['posted'] += 1
+    finally:
+        audit_log.flush()
+        connections.close_all()
+    return stats
+
+
+class Command(BaseCommand):
+    help = (
+        'Бенчмарк одновременных проведений приходов и расходов по одним и тем же '
+        'товарам. Создает временную базу SQLite и прогоняет нагрузку без тюнинга '
+        'и в боевом режиме (SQLITE_TUNED_OPTIONS и очередь записи).'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=8)
+        parser.add_argument('--documents', type=int, default=100, help='Документов на одного исполнителя')
+        parser.add_argument('--lines', type=int, default=5, help='Строк в документе')
+        parser.add_argument('--products', type=int, default=20, help='Число "горячих" товаров')
+        parser.add_argument('--processes', action='store_true',
+                            help='Исполнители — процессы (как воркеры WSGI), а не потоки')
+
+    def handle(self, *args, **options):
+        db_settings = connections.settings[DEFAULT_DB_ALIAS]
+        if db_settings['ENGINE'] != 'django.db.backends.sqlite3':
+            raise CommandError('Бенчмарк предназначен для SQLite.')
+        original = {'NAME': db_settings['NAME'], 'OPTIONS': db_settings.get('OPTIONS', {})}
+
+        self.stdout.write(f"{'режим':<10} {'проведено':>10} {'locked':>8} {'ошибок':>8} {'сек':>8} {'док/с':>8}")
+        try:
+            for tuned in (False, True):
+                with tempfile.TemporaryDirectory() as directory:
+                    connections.close_all()
+                    db_settings['NAME'] = str(Path(directory) / 'bench.sqlite3')
+                    db_settings['OPTIONS'] = dict(settings.SQLITE_TUNED_OPTIONS) if tuned else {}
+                    with override_settings(SERIALIZE_DB_WRITES=tuned):
+                        self._report('боевой' if tuned else 'обычный', self._run(options))
+                    connections.close_all()
+        finally:
+            db_settings.update(original)
+
+    def _run(self, options):
+        with connections[DEFAULT_DB_ALIAS].schema_editor() as editor:
+            for model in (Warehouse, Product, Supplier, Customer, Document, Transaction, Inventory, StockEvent,
+                          SupplierActivity, CustomerActivity, Role, Staff, StockAuditRecord):
+                editor.create_model(model)
+
+        warehouse = Warehouse.objects.create(name='Бенчмарк')
+        Product.objects.bulk_create([
+            Product(product_name=f'Товар {number}', serial_number=f'BENCH-{number}')
+            for number in range(options['products'])
+        ])
+        product_ids = [product.pk for product in Product.objects.all()]
+        Inventory.objects.bulk_create([
+            Inventory(product_id=product_id, warehouse=warehouse, quantity=1_000_000)
+            for product_id in product_ids
+        ])
+        connections.close_all()
+
+        if options['processes']:
+            executor = ProcessPoolExecutor(options['workers'], mp_context=multiprocessing.get_context('fork'))
+        else:
+            executor = ThreadPoolExecutor(options['workers'])
+
+        started = time.perf_counter()
+        with executor:
+            results = list(executor.map(
+                _post_batch,
+                range(options['workers']),
+                [options['documents']] * options['workers'],
+                [options['lines']] * options['workers'],
+                [product_ids] * options['workers'],
+                [warehouse.pk] * options['workers'],
+            ))
+        elapsed = time.perf_counter() - started
+
+        totals = {key: sum(result[key] for result in results) for key in ('posted', 'locked', 'failed')}
+        totals['elapsed'] = elapsed
+        return totals
+
+    def _report(self, mode, totals):
+        self.stdout.write(
+            f"{mode:<10} {totals['posted']:>10} {totals['locked']:>8} {totals['failed']:>8} "
+            f"{totals['elapsed']:>8.2f} {totals['posted'] / totals['elapsed']:>8.1f}"
+        )
@@ -0,0 +1,92 @@
+import os
+import re
+import statistics
+import subprocess
+import sys
+import time
+from collections import defaultdict
+
+from django.core.management.base import BaseCommand, CommandError
+
+# То, что делает при запуске каждый воркер: настройка Django, загрузка
+# приложений и URLconf со всеми модулями представлений.
+STARTUP_CODE = (
+    'import django; django.setup(); '
+    'from django.urls import get_resolver; get_resolver().url_patterns'
+)
+# Модули, которые нужны только отдельным операциям (PDF, аналитика) и не
+# должны загружаться при старте.
+HEAVY_MODULES = ('xhtml2pdf', 'reportlab', 'pypdf', 'weasyprint', 'numpy')
+DEFAULT_BUDGET_MS = 500
+
+_LINE = re.compile(r'^import time:\s+(\d+) \|\s+(\d+) \| (\s*)(\S+)$')
+
+
+def parse_importtime(output):
+    """
+    Разбирает вывод python -X importtime. Возвращает (общее время импорта в мкс,
+    кумулятивное время по пакетам верхнего уровня, множество загруженных модулей).
+    """
+    total = 0
+    packages = defaultdict(int)
+    modules = set()
+    for line in output.splitlines():
+        match = _LINE.match(line)
+        if not match:
+            continue
+        cumulative, indent, name = int(match[2]), match[3], match[4]
+        modules.add(name)
+        # Строка без отступа — импорт верхнего уровня; его время уже включает
+        # все вложенные импорты.
+        if not indent:
+            total += cumulative
+            packages[name.partition('.')[0]] += cumulative
+    return total, packages, modules
+
+
+class Command(BaseCommand):
+    help = (
+        'Замер времени запуска процесса (python -X importtime): django.setup() и '
+        'загрузка URLconf в отдельном интерпретаторе. Завершается ошибкой, если '
+        'медиана превышает бюджет или при старте загружаются тяжелые модули.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--runs', type=int, default=5)
+        parser.add_argument('--budget-ms', type=int, default=DEFAULT_BUDGET_MS,
+                            help='Допустимая медиана времени импорта, мс')
+        parser.add_argument('--top', type=int, default=10, help='Сколько самых медленных пакетов показать')
+
+    def handle(self, *args, **options):
+        env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, sys.path)))
+        totals, walls, packages, modules = [], [], defaultdict(list), set()
+        for _ in range(options['runs']):
+            started = time.perf_counter()
+            result = subprocess.run(
+                [sys.executable, '-X', 'importtime', '-c', STARTUP_CODE],
+                env=env, capture_output=True, text=True,
+            )
+            walls.append(time.perf_counter() - started)
+            if result.returncode:
+                raise CommandError(f'Запуск завершился с ошибкой:\n{result.stderr[-2000:]}')
+            total, by_package, loaded = parse_importtime(result.stderr)
+            totals.append(total)
+            for name, cumulative in by_package.items():
+                packages[name].append(cumulative)
+            modules |= loaded
+
+        self.stdout.write(f"{'пакет':<30} {'мс':>8}")
+        slowest = sorted(packages.items(), key=lambda item: -statistics.median(item[1]))
+        for name, values in slowest[:options['top']]:
+            self.stdout.write(f'{name:<30} {statistics.median(values) / 1000:8.1f}')
+
+        median = statistics.median(totals) / 1000
+        self.stdout.write(
+            f'\nимпорт: медиана {median:.0f} мс (бюджет {options["budget_ms"]} мс), '
+            f'запуск процесса: медиана {statistics.median(walls) * 1000:.0f} мс, модулей: {len(modules)}'
+        )
+        heavy = sorted(name for name in HEAVY_MODULES if name in modules)
+        if heavy:
+            raise CommandError(f'При запуске загружаются тяжелые модули: {", ".join(heavy)}')
+        if median > options['budget_ms']:
+            raise CommandError(f'Время импорта {median:.0f} мс превышает бюджет {options["budget_ms"]} мс')
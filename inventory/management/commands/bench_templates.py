@@ -0,0 +1,197 @@
+import statistics
+import time
+from datetime import date, timedelta
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand, CommandError
+from django.core.paginator import Paginator
+from django.db import connection
+from django.template import engines
+from django.template.backends.django import DjangoTemplates
+from django.template.loader import get_template
+from django.test import RequestFactory
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from inventory.models import Document, Lot, Product, Role, Staff, Warehouse
+from inventory.services import INCOMING, OUTGOING
+from reports.models import ProductClassification
+
+# Объекты строятся так, как их загружают запросы представлений (со связанными
+# объектами select_related), и не сохраняются: замеряется только рендеринг.
+TODAY = date(2025, 6, 1)
+
+
+def _warehouses():
+    return [Warehouse(pk=number, name=f'Склад {number}') for number in range(1, 4)]
+
+
+def _product(number):
+    return Product(pk=number, product_name=f'Товар {number}', serial_number=f'SN-{number:06d}')
+
+
+def _documents(rows):
+    documents = [
+        Document(
+            pk=number, document_type=INCOMING if number % 2 else OUTGOING, date=TODAY - timedelta(days=number % 90),
+            line_count=number % 12 + 1, total_quantity=number * 7, total_amount=Decimal(number) * Decimal('13.37'),
+        )
+        for number in range(1, rows + 1)
+    ]
+    page = Paginator(documents, rows).get_page(1)
+    return 'inventory/document_list.html', {
+        'page_obj': page,
+        'page_range': page.paginator.get_elided_page_range(page.number),
+        'sort': 'date',
+        'min_amount': None,
+        'filters': '',
+    }
+
+
+def _stock(rows):
+    warehouses = _warehouses()
+    page = Paginator(range(100 * rows), rows).get_page(2)
+    matrix = [
+        {
+            'product_id': number,
+            'product_name': f'Товар {number}',
+            'serial_number': f'SN-{number:06d}',
+            'quantities': [number % 17, 0, number * 3],
+            'total': number % 17 + number * 3,
+        }
+        for number in range(1, rows + 1)
+    ]
+    page_totals = [sum(column) for column in zip(*(row['quantities'] for row in matrix))]
+    return 'reports/stock_report.html', {
+        'report_title': 'Остатки по складам',
+        'all_warehouses': warehouses,
+        'warehouses': warehouses,
+        'selected_ids': set(),
+        'page_obj': page,
+        'page_range': page.paginator.get_elided_page_range(page.number),
+        'rows': matrix,
+        'page_totals': page_totals,
+        'page_grand_total': sum(page_totals),
+        'totals': None,
+        'grand_total': None,
+        'filters': '',
+    }
+
+
+def _expiring(rows):
+    warehouses = _warehouses()
+    lots = [
+        Lot(
+            pk=number, product=_product(number), warehouse=warehouses[number % 3], lot_number=f'L-{number}',
+            expiry_date=TODAY + timedelta(days=number % 60 - 10), quantity=number % 40 + 1,
+        )
+        for number in range(1, rows + 1)
+    ]
+    return 'reports/expiring_report.html', {
+        'report_title': 'Истекающие сроки годности',
+        'lots': lots,
+        'row_limit': rows,
+        'days': 50,
+        'today': TODAY,
+        'warehouses': warehouses,
+        'warehouse': None,
+    }
+
+
+def _abc_xyz(rows):
+    items = [
+        ProductClassification(
+            product=_product(number), abc_class='ABC'[number % 3], xyz_class='XYZ'[number % 3],
+            revenue=Decimal(rows - number) * 100, revenue_share=1 / rows, quantity=number, demand_cv=number % 9 / 10,
+        )
+        for number in range(1, rows + 1)
+    ]
+    matrix = [
+        {'abc_class': abc, 'cells': [
+            {'abc_class': abc, 'xyz_class': xyz, 'products': rows // 9, 'revenue': Decimal('123456.78')} for xyz in 'XYZ'
+        ]}
+        for abc in 'ABC'
+    ]
+    return 'reports/abc_xyz_report.html', {
+        'report_title': 'ABC/XYZ-анализ',
+        'matrix': matrix,
+        'items': items,
+        'abc_class': '',
+        'xyz_class': '',
+        'period': {
+            'period_start': TODAY - timedelta(days=365), 'period_end': TODAY,
+            'computed_at': timezone.now().replace(microsecond=0),
+        },
+    }
+
+
+PAGES = {'documents': _documents, 'stock': _stock, 'expiring': _expiring, 'abc_xyz': _abc_xyz}
+
+
+def _uncached_engine():
+    """Те же шаблоны без кеширующего загрузчика: разбор при каждом запросе."""
+    params = dict(engines.templates['django'], NAME='bench-uncached')
+    del params['BACKEND']
+    params['OPTIONS'] = dict(params.get('OPTIONS', {}), loaders=[
+        'django.template.loaders.filesystem.Loader',
+        'django.template.loaders.app_directories.Loader',
+    ])
+    return DjangoTemplates(params)
+
+
+def _median_ms(renders, runs):
+    """
+    Медианы времени (мс) для каждого варианта рендеринга. Варианты чередуются
+    в каждом прогоне, чтобы колебания скорости машины доставались всем поровну.
+    """
+    timings = [[] for _ in renders]
+    for _ in range(runs):
+        for render, samples in zip(renders, timings):
+            started = time.perf_counter()
+            render()
+            samples.append(time.perf_counter() - started)
+    return [statistics.median(samples) * 1000 for samples in timings]
+
+
+class Command(BaseCommand):
+    help = (
+        'Замер рендеринга страниц с заданным числом строк: без кеша шаблонов (разбор '
+        'при каждом запросе), с кешем шаблонов и с кешем шаблонов и фрагментов. '
+        'Завершается ошибкой, если рендеринг обращается к базе данных.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=1000)
+        parser.add_argument('--runs', type=int, default=20)
+        parser.add_argument('--pages', nargs='+', choices=sorted(PAGES), default=list(PAGES))
+
+    def handle(self, *args, **options):
+        rows, runs = options['rows'], options['runs']
+        if rows < 1 or runs < 1:
+            raise CommandError('--rows и --runs должны быть положительными')
+        request = RequestFactory().get('/')
+        request.user = Staff(pk=1, username='bench', role=Role(pk=1, role_name='Менеджер'))
+        uncached = _uncached_engine()
+
+        self.stdout.write(
+            f"{'страница':<12} {'без кеша, мс':>13} {'шаблоны, мс':>12} {'+ фрагменты, мс':>16} {'мкс/строку':>11}"
+        )
+        for name in options['pages']:
+            template_name, context = PAGES[name](rows)
+            template = get_template(template_name)
+            with CaptureQueriesContext(connection) as queries:
+                template.render(context, request)
+            if queries:
+                raise CommandError(
+                    f'{template_name}: рендеринг выполнил {len(queries)} запросов, первый: {queries[0]["sql"]}'
+                )
+
+            parsed, cold, warm = _median_ms([
+                lambda: uncached.get_template(template_name).render(context, request),
+                # Новая версия при каждом рендеринге — фрагменты ни разу не найдены в кеше.
+                lambda: template.render(dict(context, fragment_version=f'bench-{time.time_ns()}'), request),
+                lambda: template.render(context, request),
+            ], runs)
+            self.stdout.write(
+                f'{name:<12} {parsed:>13.1f} {cold:>12.1f} {warm:>16.1f} {warm * 1000 / rows:>11.0f}'
+            )
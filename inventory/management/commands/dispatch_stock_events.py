@@ -0,0 +1,33 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from inventory.outbox import dispatch_batch, get_sink
+
+
+class Command(BaseCommand):
+    help = (
+        'Отправляет накопленные события об изменении остатков (outbox) в '
+        'настроенный приемник STOCK_EVENT_SINK пачками.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument('--interval', type=float, default=2.0,
+                            help='Пауза между опросами, когда очередь пуста, секунды')
+        parser.add_argument('--once', action='store_true',
+                            help='Отправить все накопленное и завершиться')
+
+    def handle(self, *args, **options):
+        sink = get_sink()
+        total = 0
+        while True:
+            sent = dispatch_batch(sink, options['batch_size'])
+            total += sent
+            if sent:
+                self.stdout.write(f'Отправлено событий: {sent}')
+                continue
+            if options['once']:
+                break
+            time.sleep(options['interval'])
+        self.stdout.write(self.style.SUCCESS(f'Всего отправлено: {total}'))
@@ -0,0 +1,44 @@
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+
+from inventory.pdf_export import FORMATS, MAX_MERGED_DOCUMENTS, export_ids, render_pdfs
+
+
+class Command(BaseCommand):
+    help = (
+        'Выгружает документы в PDF одним ZIP-архивом (файл на документ) или '
+        'одним сводным PDF. PDF рендерятся параллельно в пуле процессов.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('output', help='Путь к создаваемому файлу')
+        parser.add_argument('--ids', help='id документов через запятую')
+        parser.add_argument('--from', dest='date_from', type=date.fromisoformat, help='ГГГГ-ММ-ДД')
+        parser.add_argument('--to', dest='date_to', type=date.fromisoformat, help='ГГГГ-ММ-ДД')
+        parser.add_argument('--format', choices=sorted(FORMATS), default='zip')
+        parser.add_argument('--workers', type=int, default=multiprocessing.cpu_count())
+
+    def handle(self, *args, **options):
+        ids = [int(value) for value in options['ids'].split(',')] if options['ids'] else None
+        if not (ids or options['date_from'] or options['date_to']):
+            raise CommandError('Укажите --ids или диапазон дат --from/--to')
+        document_ids = list(export_ids(ids, options['date_from'], options['date_to']))
+        if not document_ids:
+            raise CommandError('Документы не найдены')
+        if options['format'] == 'pdf' and len(document_ids) > MAX_MERGED_DOCUMENTS:
+            raise CommandError(
+                f'Сводный PDF — не больше {MAX_MERGED_DOCUMENTS} документов '
+                f'(найдено {len(document_ids)}), выгрузите --format zip'
+            )
+
+        stream, _ = FORMATS[options['format']]
+        pool = ProcessPoolExecutor(options['workers'], mp_context=multiprocessing.get_context('spawn'))
+        with pool, open(options['output'], 'wb') as output:
+            for chunk in stream(render_pdfs(document_ids, pool)):
+                output.write(chunk)
+        self.stdout.write(self.style.SUCCESS(
+            f"Выгружено документов: {len(document_ids)} → {options['output']}"
+        ))
@@ -0,0 +1,24 @@
+from datetime import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+
+from inventory.services import rebuild_counterparty_activity
+
+
+class Command(BaseCommand):
+    help = (
+        'Пересчитывает помесячные итоги по поставщикам и клиентам '
+        '(SupplierActivity, CustomerActivity) из строк документов: целиком '
+        'или за указанные месяцы. Нужна после загрузки данных в обход проведения.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--month', action='append', default=[], help='Месяц ГГГГ-ММ; можно повторять')
+
+    def handle(self, *args, **options):
+        try:
+            periods = {datetime.strptime(month, '%Y-%m').date() for month in options['month']} or None
+        except ValueError as error:
+            raise CommandError(f'Неверный месяц: {error}')
+        created = rebuild_counterparty_activity(periods)
+        self.stdout.write(self.style.SUCCESS(f'Строк итогов: {created}'))
@@ -0,0 +1,40 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction as db_transaction
+from django.db.models import F, Max
+
+from inventory.models import Document
+from inventory.services import document_totals, refresh_document_totals
+
+
+class Command(BaseCommand):
+    help = (
+        'Сверяет хранимые итоги документов (total_amount, line_count, '
+        'total_quantity) со строками и исправляет расхождения пачками.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=5000, help='Документов в одной транзакции')
+        parser.add_argument('--dry-run', action='store_true', help='Только посчитать расхождения')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        last_id = Document.objects.aggregate(last=Max('pk'))['last'] or 0
+        totals = document_totals()
+        stale_total = 0
+
+        for first in range(0, last_id + 1, batch_size):
+            batch = Document.objects.filter(pk__gte=first, pk__lt=first + batch_size)
+            stale = batch.annotate(**{f'actual_{name}': expression for name, expression in totals.items()}) \
+                .exclude(
+                    total_amount=F('actual_total_amount'),
+                    line_count=F('actual_line_count'),
+                    total_quantity=F('actual_total_quantity'),
+                ).values_list('pk', flat=True)
+            with db_transaction.atomic():
+                stale_ids = list(stale)
+                if stale_ids and not options['dry_run']:
+                    refresh_document_totals(Document.objects.filter(pk__in=stale_ids))
+            stale_total += len(stale_ids)
+
+        action = 'Найдено' if options['dry_run'] else 'Исправлено'
+        self.stdout.write(self.style.SUCCESS(f'{action} документов с неверными итогами: {stale_total}'))
@@ -0,0 +1,115 @@
+import multiprocessing
+import statistics
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections
+
+from inventory.services import INCOMING, OUTGOING
+from inventory.stress import (
+    LockWaitSampler, check_invariants, create_fixture, deadlock_count, drop_fixture, post_batch,
+)
+
+
+class Command(BaseCommand):
+    help = (
+        'Стресс-тест одновременных приходов и расходов по одним и тем же парам '
+        'товар × склад в настроенной базе (SQLite или PostgreSQL). После прогона '
+        'проверяет, что остатки сходятся с проведенными документами и историей и '
+        'не уходили в минус; выводит пропускную способность и ожидание блокировок. '
+        'Созданные для прогона склад, товары и документы удаляются.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=8)
+        parser.add_argument('--documents', type=int, default=200, help='Документов на одного исполнителя')
+        parser.add_argument('--lines', type=int, default=3, help='Строк в документе')
+        parser.add_argument('--products', type=int, default=3, help='Число "горячих" товаров')
+        parser.add_argument('--initial-stock', type=int, default=20, help='Начальный остаток каждого товара')
+        parser.add_argument('--max-quantity', type=int, default=5, help='Наибольшее количество в строке')
+        parser.add_argument('--processes', action='store_true',
+                            help='Исполнители — процессы (как воркеры WSGI), а не потоки')
+        parser.add_argument('--keep', action='store_true', help='Не удалять созданные данные')
+
+    def handle(self, *args, **options):
+        vendor = connections[DEFAULT_DB_ALIAS].vendor
+        warehouse, product_ids = create_fixture(options['products'], options['initial_stock'])
+        try:
+            posted, latencies, outcomes, elapsed, lock_samples, deadlocks = self._run(
+                vendor, warehouse, product_ids, options
+            )
+            violations = check_invariants(warehouse, product_ids, options['initial_stock'], posted)
+        finally:
+            if not options['keep']:
+                drop_fixture(warehouse, product_ids)
+
+        latencies.sort()
+        attempted = len(latencies)
+        self.stdout.write(
+            f'{vendor}, исполнителей: {options["workers"]} ({"процессы" if options["processes"] else "потоки"}), '
+            f'горячих товаров: {len(product_ids)}'
+        )
+        self.stdout.write(
+            f'документов: {attempted}, проведено приходов: {outcomes[INCOMING]}, расходов: {outcomes[OUTGOING]}, '
+            f'отказов по остатку: {outcomes["rejected"]}, блокировок: {outcomes["locked"]}, '
+            f'прочих ошибок: {outcomes["failed"]}'
+        )
+        self.stdout.write(
+            f'{attempted / elapsed:.1f} док/с за {elapsed:.2f} с; задержка проведения, мс: '
+            f'p50 {statistics.median(latencies) * 1000:.1f}, '
+            f'p95 {latencies[int(attempted * 0.95) - 1] * 1000:.1f}, max {latencies[-1] * 1000:.1f}'
+        )
+        if lock_samples:
+            waiting = sum(1 for sample in lock_samples if sample)
+            self.stdout.write(
+                f'ожидание блокировок: в {waiting * 100 / len(lock_samples):.0f}% замеров, '
+                f'в среднем {statistics.mean(lock_samples):.2f} сеанса, максимум {max(lock_samples)}; '
+                f'взаимоблокировок: {deadlocks}'
+            )
+
+        if violations:
+            for violation in violations:
+                self.stderr.write(violation)
+            raise CommandError(f'Нарушено инвариантов: {len(violations)}')
+        self.stdout.write(self.style.SUCCESS('Инварианты выполнены: остатки сходятся с документами, минуса не было.'))
+
+    def _run(self, vendor, warehouse, product_ids, options):
+        workers = options['workers']
+        deadlocks = deadlock_count() if vendor == 'postgresql' else None
+        if options['processes']:
+            # Дочерние процессы не должны унаследовать открытые соединения.
+            connections.close_all()
+            executor = ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context('fork'))
+        else:
+            executor = ThreadPoolExecutor(workers)
+
+        sampler = LockWaitSampler() if vendor == 'postgresql' else None
+        started = time.perf_counter()
+        with executor:
+            # map отправляет все пачки сразу, и процессы пула создаются до
+            # того, как поток замеров откроет свое соединение.
+            batches = executor.map(
+                post_batch,
+                range(workers),
+                [options['documents']] * workers,
+                [options['lines']] * workers,
+                [options['max_quantity']] * workers,
+                [product_ids] * workers,
+                [warehouse.pk] * workers,
+            )
+            if sampler:
+                sampler.start()
+            results = list(batches)
+        elapsed = time.perf_counter() - started
+        if sampler:
+            sampler.stop()
+            deadlocks = deadlock_count() - deadlocks
+
+        posted, outcomes, latencies = Counter(), Counter(), []
+        for batch_posted, batch_latencies, batch_outcomes in results:
+            posted.update(batch_posted)
+            outcomes.update(batch_outcomes)
+            latencies.extend(batch_latencies)
+        return posted, latencies, outcomes, elapsed, sampler.samples if sampler else [], deadlocks
@@ -0,0 +1,61 @@
+import csv
+import multiprocessing
+import os
+import sys
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import django
+from django.core.management.base import BaseCommand
+
+from inventory.stock_verification import apply_fixes, check_range, product_ranges
+
+
+class Command(BaseCommand):
+    help = (
+        'Сверяет остатки Inventory с историей строк документов (приходы минус '
+        'расходы) по диапазонам товаров в пуле процессов и выводит расхождения '
+        'в CSV. С --fix приводит расходящиеся остатки к истории.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=2000, help='Товаров (по id) в одной пачке')
+        parser.add_argument('--workers', type=int, default=os.cpu_count())
+        parser.add_argument('--output', help='Файл для CSV с расхождениями (по умолчанию stdout)')
+        parser.add_argument('--fix', action='store_true', help='Исправить расхождения')
+
+    def handle(self, *args, **options):
+        ranges = product_ranges(options['chunk_size'])
+        output = open(options['output'], 'w', newline='', encoding='utf-8') if options['output'] else sys.stdout
+        writer = csv.writer(output)
+        writer.writerow(['product_id', 'warehouse_id', 'inventory_id', 'stored', 'ledger', 'delta'])
+        found = fixed = 0
+        try:
+            with ProcessPoolExecutor(
+                options['workers'], mp_context=multiprocessing.get_context('spawn'), initializer=django.setup
+            ) as pool:
+                for diffs in self._results(pool, ranges, options['workers']):
+                    for product_id, warehouse_id, stored, ledger, inventory_id in diffs:
+                        writer.writerow([product_id, warehouse_id, inventory_id, stored, ledger, ledger - (stored or 0)])
+                    found += len(diffs)
+                    if diffs and options['fix']:
+                        fixed += apply_fixes(diffs)
+        finally:
+            if output is not sys.stdout:
+                output.close()
+
+        summary = f'Пачек: {len(ranges)}, расхождений: {found}'
+        if options['fix']:
+            summary += f', исправлено: {fixed}'
+        self.stderr.write(summary, style_func=self.style.SUCCESS)
+
+    @staticmethod
+    def _results(pool, ranges, workers):
+        """Результаты пачек по порядку; в работе не больше двух пачек на процесс."""
+        pending = deque()
+        for bounds in ranges:
+            pending.append(pool.submit(check_range, bounds))
+            if len(pending) >= 2 * workers:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
@@ -1,5 +1,6 @@
 from django.contrib.auth.models import AbstractUser
 from django.db import models
+from django.utils import timezone
 
 class Role(models.Model):
     role_name = models.CharField(max_length=100, unique=True)
@@ -32,6 +33,8 @@ class Staff(AbstractUser):
 
 class Supplier(models.Model):
     name = models.CharField(max_length=255)
+    # Срок от заказа до поступления на склад; используется в расчете точки заказа.
+    lead_time_days = models.PositiveIntegerField(default=7)
 
     def __str__(self):
         return self.name
@@ -52,10 +55,32 @@ class Product(models.Model):
     product_name = models.CharField(max_length=255)
     serial_number = models.CharField(max_length=255, unique=True)
     minimum_stock_level = models.IntegerField(default=10)
+    # Учет по партиям и срокам годности (продукты питания, лекарства).
+    tracks_lots = models.BooleanField(default=False)
+    # Время последнего сохранения: по нему сканеры забирают изменения
+    # каталога (inventory.catalog_sync). UPDATE через queryset его не
+    # обновляет — такие правки должны выставлять updated_at сами.
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            # Постраничный вывод каталога по названию (матрица остатков).
+            models.Index(fields=['product_name', 'id'], name='product_name_idx'),
+            # Изменения каталога с момента прошлой синхронизации.
+            models.Index(fields=['updated_at', 'id'], name='product_updated_idx'),
+        ]
 
     def __str__(self):
         return self.product_name
 
+class ProductTombstone(models.Model):
+    """Удаленный товар: синхронизация каталога сообщает о нем сканерам."""
+    product_id = models.BigIntegerField()
+    deleted_at = models.DateTimeField(default=timezone.now, db_index=True)
+
+    def __str__(self):
+        return f"{self.product_id} удален {self.deleted_at}"
+
 class Document(models.Model):
     DOCUMENT_TYPE_CHOICES = [
         ('Приход', 'Приход'),
@@ -63,6 +88,29 @@ class Document(models.Model):
     ]
     document_type = models.CharField(max_length=10, choices=DOCUMENT_TYPE_CHOICES)
     date = models.DateField()
+    # Ключ запроса от клиента (сканера, формы): повторная отправка того же
+    # запроса находит уже проведенный документ вместо создания дубля. Ключ
+    # уникален в пределах пользователя и типа документа, поэтому чужой или
+    # другой по типу запрос с тем же ключом его не находит.
+    idempotency_key = models.CharField(max_length=64, null=True, blank=True)
+    posted_by = models.ForeignKey(Staff, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    # Итоги по строкам, хранятся в документе, чтобы журнал сортировал и
+    # фильтровал по сумме без агрегации Transaction. Пересчитываются при
+    # проведении и при правке строк в админке; восстанавливаются командой
+    # repair_document_totals.
+    total_amount = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    line_count = models.PositiveIntegerField(default=0)
+    total_quantity = models.IntegerField(default=0)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['total_amount'], name='document_total_amount_idx'),
+        ]
+        constraints = [
+            models.UniqueConstraint(
+                fields=['posted_by', 'document_type', 'idempotency_key'], name='document_idempotency_key_uniq'
+            ),
+        ]
 
     def __str__(self):
         return f"{self.document_type} №{self.id} от {self.date}"
@@ -83,6 +131,9 @@ class Transaction(models.Model):
     def total_cost(self):
         return self.quantity * self.price
 
+# Порог "заканчивающегося" остатка для панели кладовщика.
+LOW_STOCK_THRESHOLD = 10
+
 class Inventory(models.Model):
     product = models.ForeignKey(Product, on_delete=models.CASCADE)
     warehouse = models.ForeignKey(Warehouse, on_delete=models.CASCADE)
@@ -90,6 +141,178 @@ class Inventory(models.Model):
 
     class Meta:
         unique_together = ('product', 'warehouse')
+        indexes = [
+            # Частичный индекс под выборку "заканчивающихся" остатков
+            # (панель кладовщика). Создается там, где СУБД поддерживает
+            # частичные индексы (PostgreSQL, SQLite).
+            models.Index(
+                fields=['warehouse', 'product'],
+                condition=models.Q(quantity__lt=LOW_STOCK_THRESHOLD),
+                name='inventory_low_stock_idx',
+            ),
+        ]
 
     def __str__(self):
         return f"{self.product.product_name} на складе {self.warehouse.name}: {self.quantity} шт."
+
+class BinLocation(models.Model):
+    """
+    Ячейка хранения на складе. zone, aisle и shelf задают ее место на
+    маршруте отбора (inventory.picking): зоны обходятся по порядку, проходы —
+    по номеру, полки — по номеру вдоль прохода.
+    """
+    warehouse = models.ForeignKey(Warehouse, on_delete=models.CASCADE, related_name='bins')
+    code = models.CharField(max_length=32)  # например, "A-03-12"
+    zone = models.CharField(max_length=16)
+    aisle = models.PositiveIntegerField()
+    shelf = models.PositiveIntegerField()
+
+    class Meta:
+        unique_together = ('warehouse', 'code')
+
+    def __str__(self):
+        return self.code
+
+class BinStock(models.Model):
+    """
+    Количество товара в ячейке. Размещение по ячейкам ведет склад;
+    проведения документов его не меняют, лист отбора только читает его.
+    """
+    bin = models.ForeignKey(BinLocation, on_delete=models.CASCADE, related_name='stock')
+    product = models.ForeignKey(Product, on_delete=models.CASCADE)
+    quantity = models.IntegerField(default=0)
+
+    class Meta:
+        unique_together = ('bin', 'product')
+        indexes = [
+            # Ячейки с товарами волны отбора.
+            models.Index(fields=['product', 'bin'], name='binstock_product_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.product_id} в {self.bin_id}: {self.quantity} шт."
+
+class Lot(models.Model):
+    """
+    Партия товара на складе: номер партии, срок годности и остаток.
+
+    Ведется для товаров с учетом партий (Product.tracks_lots): приход
+    пополняет партию строки, расход списывает партии по FEFO — сначала с
+    ближайшим сроком годности. Сумма остатков партий пары товар × склад
+    равна Inventory.quantity.
+    """
+    product = models.ForeignKey(Product, on_delete=models.CASCADE)
+    warehouse = models.ForeignKey(Warehouse, on_delete=models.CASCADE)
+    lot_number = models.CharField(max_length=64)
+    expiry_date = models.DateField()
+    quantity = models.IntegerField(default=0)
+
+    class Meta:
+        unique_together = ('product', 'warehouse', 'lot_number')
+        indexes = [
+            # Подбор партий пары товар × склад в порядке FEFO.
+            models.Index(fields=['product', 'warehouse', 'expiry_date'], name='lot_fefo_idx'),
+            # Отчет по истекающим срокам: диапазон дат только по партиям с остатком.
+            models.Index(fields=['expiry_date', 'id'], condition=models.Q(quantity__gt=0), name='lot_expiring_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.product_id}@{self.warehouse_id} партия {self.lot_number} до {self.expiry_date}"
+
+class LotAllocation(models.Model):
+    """Сколько штук строки документа пришло в партию или списано из нее."""
+    transaction = models.ForeignKey(Transaction, on_delete=models.CASCADE, related_name='lot_allocations')
+    lot = models.ForeignKey(Lot, on_delete=models.CASCADE, related_name='allocations')
+    quantity = models.IntegerField()
+
+    def __str__(self):
+        return f"{self.transaction_id} → {self.lot_id}: {self.quantity} шт."
+
+class StockEvent(models.Model):
+    """
+    Исходящее событие об изменении остатка (transactional outbox).
+
+    Пишется в той же транзакции, что и проведение документа, поэтому
+    внешние системы получают ровно те изменения, которые зафиксированы.
+    """
+    document = models.ForeignKey(Document, on_delete=models.CASCADE, related_name='stock_events')
+    product = models.ForeignKey(Product, on_delete=models.CASCADE)
+    warehouse = models.ForeignKey(Warehouse, on_delete=models.CASCADE)
+    quantity_delta = models.IntegerField()
+    quantity = models.IntegerField()  # остаток после изменения
+    created_at = models.DateTimeField(auto_now_add=True)
+    dispatched_at = models.DateTimeField(null=True, blank=True)
+    # До какого времени пачку с событием отправляет взявший ее диспетчер.
+    claimed_until = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=['id'],
+                condition=models.Q(dispatched_at__isnull=True),
+                name='stockevent_pending_idx',
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.product_id}@{self.warehouse_id}: {self.quantity_delta:+d}"
+
+class StockAuditRecord(models.Model):
+    """
+    Запись журнала аудита: кто, каким документом и на сколько изменил остаток.
+
+    Пишется не в транзакции проведения, а пачками после ее фиксации
+    (inventory.audit), поэтому created_at — время изменения, а не записи.
+    """
+    user = models.ForeignKey(Staff, on_delete=models.SET_NULL, null=True, blank=True)
+    document = models.ForeignKey(Document, on_delete=models.CASCADE, related_name='audit_records')
+    product = models.ForeignKey(Product, on_delete=models.CASCADE)
+    warehouse = models.ForeignKey(Warehouse, on_delete=models.CASCADE)
+    quantity_delta = models.IntegerField()
+    quantity = models.IntegerField()  # остаток после изменения
+    created_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['product', 'warehouse', '-created_at'], name='audit_balance_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.user_id}: {self.product_id}@{self.warehouse_id} {self.quantity_delta:+d}"
+
+class CounterpartyActivity(models.Model):
+    """
+    Помесячные итоги строк документов по контрагенту и товару.
+
+    Ведутся при проведении документа (post_document) и поправляются на
+    разницу вклада документа при его правке в админке, поэтому отчеты по
+    поставщикам и клиентам не читают строки Transaction.
+    """
+    period = models.DateField()  # первое число месяца
+    product = models.ForeignKey(Product, on_delete=models.CASCADE)
+    quantity = models.IntegerField(default=0)
+    amount = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    line_count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        abstract = True
+
+class SupplierActivity(CounterpartyActivity):
+    """Закупки: строки приходов с поставщиком."""
+    supplier = models.ForeignKey(Supplier, on_delete=models.CASCADE)
+
+    class Meta:
+        unique_together = ('period', 'supplier', 'product')
+
+    def __str__(self):
+        return f"{self.period:%Y-%m} {self.supplier_id}/{self.product_id}: {self.amount}"
+
+class CustomerActivity(CounterpartyActivity):
+    """Продажи: строки расходов с клиентом."""
+    customer = models.ForeignKey(Customer, on_delete=models.CASCADE)
+
+    class Meta:
+        unique_together = ('period', 'customer', 'product')
+
+    def __str__(self):
+        return f"{self.period:%Y-%m} {self.customer_id}/{self.product_id}: {self.amount}"
@@ -0,0 +1,150 @@
+import json
+import urllib.request
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connection, transaction as db_transaction
+from django.db.models import Max, Q
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from .models import StockEvent
+
+EVENT_FIELDS = (
+    'id', 'document_id', 'document__document_type', 'product_id', 'product__serial_number',
+    'warehouse_id', 'quantity_delta', 'quantity', 'created_at',
+)
+
+# Ключ рекомендательной блокировки PostgreSQL, которой проведения отделяются
+# от чтения ленты событий (committed_watermark).
+EVENT_FENCE_LOCK = 0x53544f43
+# Сколько пачка принадлежит взявшему ее диспетчеру. Если диспетчер упал, не
+# отправив пачку, по истечении этого срока ее возьмет следующий.
+CLAIM_TIMEOUT = timedelta(seconds=60)
+
+
+def serialize_event(row):
+    """Строка values() события → словарь для внешних систем."""
+    return {
+        'id': row['id'],
+        'document_id': row['document_id'],
+        'document_type': row['document__document_type'],
+        'product_id': row['product_id'],
+        'serial_number': row['product__serial_number'],
+        'warehouse_id': row['warehouse_id'],
+        'quantity_delta': row['quantity_delta'],
+        'quantity': row['quantity'],
+        'created_at': row['created_at'],
+    }
+
+
+def hold_event_fence():
+    """
+    Вызывается в начале транзакции проведения, до выдачи id событий. В
+    PostgreSQL берет разделяемую рекомендательную блокировку до конца
+    транзакции, и committed_watermark ждет ее снятия. В SQLite писатель один,
+    и id событий и так растут в порядке фиксации.
+    """
+    if connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT pg_advisory_xact_lock_shared(%s)', [EVENT_FENCE_LOCK])
+
+
+def committed_watermark():
+    """
+    Наибольший id события, ниже которого не осталось незафиксированных событий.
+
+    В PostgreSQL id выдаются до фиксации, поэтому событие с меньшим id может
+    стать видимым позже соседнего. Поэтому отметка читается под исключительной
+    блокировкой EVENT_FENCE_LOCK. К этому моменту все начатые проведения
+    зафиксированы, а новые ждут. Блокировка держится только на время
+    чтения max(id).
+    """
+    if connection.vendor != 'postgresql':
+        return StockEvent.objects.aggregate(last=Max('pk'))['last'] or 0
+    with db_transaction.atomic():
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT pg_advisory_xact_lock(%s)', [EVENT_FENCE_LOCK])
+        return StockEvent.objects.aggregate(last=Max('pk'))['last'] or 0
+
+
+def events_since(cursor, limit, until):
+    """
+    События с id больше cursor и не больше until (committed_watermark()) для
+    API изменений, в порядке возрастания id, то есть в порядке фиксации.
+    """
+    return StockEvent.objects.filter(pk__gt=cursor, pk__lte=until).order_by('pk').values(*EVENT_FIELDS)[:limit]
+
+
+class JsonLinesSink:
+    """Дописывает события в файл JSON Lines, по одному событию в строке."""
+
+    def __init__(self, path):
+        self.path = path
+
+    def send(self, events):
+        with open(self.path, 'a', encoding='utf-8') as file:
+            for event in events:
+                file.write(json.dumps(event, cls=DjangoJSONEncoder, ensure_ascii=False))
+                file.write('\n')
+
+
+class WebhookSink:
+    """Отправляет пачку событий одним POST-запросом с JSON-телом."""
+
+    def __init__(self, url, timeout=10):
+        self.url = url
+        self.timeout = timeout
+
+    def send(self, events):
+        body = json.dumps({'events': events}, cls=DjangoJSONEncoder).encode('utf-8')
+        request = urllib.request.Request(
+            self.url, data=body, headers={'Content-Type': 'application/json'}, method='POST'
+        )
+        with urllib.request.urlopen(request, timeout=self.timeout):
+            pass
+
+
+def get_sink():
+    config = settings.STOCK_EVENT_SINK
+    return import_string(config['BACKEND'])(**config.get('OPTIONS', {}))
+
+
+def dispatch_batch(sink, batch_size=500):
+    """
+    Отправляет в sink одну пачку неотправленных событий и помечает их.
+
+    Пачка берется в порядке фиксации: по id, не дальше committed_watermark.
+    Короткая транзакция закрепляет ее за диспетчером (claimed_until).
+    Отправка идет вне транзакции, поэтому медленный приемник не держит
+    блокировки базы. Затем события помечаются отправленными.
+
+    Доставка "хотя бы один раз". Если отправка упала, закрепление снимается,
+    и пачка уйдет снова. Если упал сам диспетчер, пачку возьмут через
+    CLAIM_TIMEOUT. Строгий порядок отправки соблюдается при одном
+    диспетчере. Возвращает число отправленных событий.
+    """
+    watermark = committed_watermark()
+    now = timezone.now()
+    with db_transaction.atomic():
+        pending = StockEvent.objects.filter(
+            Q(claimed_until__isnull=True) | Q(claimed_until__lt=now),
+            dispatched_at__isnull=True, pk__lte=watermark,
+        ).order_by('pk')
+        if connection.features.has_select_for_update_skip_locked:
+            # Несколько диспетчеров разбирают разные пачки, не дожидаясь друг друга.
+            pending = pending.select_for_update(skip_locked=True, of=('self',))
+        ids = list(pending.values_list('pk', flat=True)[:batch_size])
+        if not ids:
+            return 0
+        StockEvent.objects.filter(pk__in=ids).update(claimed_until=now + CLAIM_TIMEOUT)
+
+    rows = StockEvent.objects.filter(pk__in=ids).order_by('pk').values(*EVENT_FIELDS)
+    try:
+        sink.send([serialize_event(row) for row in rows])
+    except Exception:
+        StockEvent.objects.filter(pk__in=ids).update(claimed_until=None)
+        raise
+    StockEvent.objects.filter(pk__in=ids).update(dispatched_at=timezone.now())
+    return len(ids)
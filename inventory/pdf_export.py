@@ -0,0 +1,139 @@
+"""
+Пакетная выгрузка документов в PDF: ZIP-архив или один сводный PDF.
+
+Документы загружаются пачками по CHUNK_SIZE (два запроса на пачку: документы
+и их строки со всеми связанными объектами), HTML рендерится в текущем
+процессе, а PDF — в пуле процессов. Одновременно в работе не больше двух
+пачек, поэтому память не растет с числом документов, а архив отдается
+клиенту по мере готовности.
+"""
+import atexit
+import multiprocessing
+import tempfile
+import threading
+import zipfile
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from io import BytesIO
+
+from django.conf import settings
+from django.template.loader import get_template
+
+from .models import Document
+from .pdf_render import html_to_pdf
+from .read_models import document_context, documents_with_lines
+
+CHUNK_SIZE = 50
+# Сводный PDF собирается целиком в памяти (pypdf), поэтому число документов в
+# нем ограничено; большие выгрузки — ZIP-архивом.
+MAX_MERGED_DOCUMENTS = 200
+STREAM_BLOCK_SIZE = 64 * 1024
+TEMPLATE_NAME = 'inventory/pdf/document_pdf.html'
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    """Общий пул процессов для выгрузок из веб-запросов (создается при первом вызове)."""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(
+                settings.PDF_EXPORT_WORKERS, mp_context=multiprocessing.get_context('spawn')
+            )
+            # Рабочие процессы завершаются вместе с сервером, недоделанные PDF отменяются.
+            atexit.register(_pool.shutdown, cancel_futures=True)
+    return _pool
+
+
+def export_ids(ids=None, date_from=None, date_to=None):
+    """Запрос id документов для выгрузки в порядке дата → номер."""
+    documents = Document.objects.order_by('date', 'pk')
+    if ids:
+        documents = documents.filter(pk__in=ids)
+    if date_from:
+        documents = documents.filter(date__gte=date_from)
+    if date_to:
+        documents = documents.filter(date__lte=date_to)
+    return documents.values_list('pk', flat=True)
+
+
+def load_documents(ids):
+    """Документы со строками, товарами, поставщиками, клиентами и складами за два запроса."""
+    return documents_with_lines().filter(pk__in=ids).order_by('date', 'pk')
+
+
+def render_html(document):
+    return get_template(TEMPLATE_NAME).render(document_context(document))
+
+
+def render_pdfs(ids, pool, chunk_size=CHUNK_SIZE):
+    """Пары (документ, PDF) в порядке ids; следующая пачка рендерится, пока отдается текущая."""
+    pending = deque()
+    for start in range(0, len(ids), chunk_size):
+        for document in load_documents(ids[start:start + chunk_size]):
+            pending.append((document, pool.submit(html_to_pdf, render_html(document))))
+        while len(pending) > chunk_size:
+            document, future = pending.popleft()
+            yield document, future.result()
+    while pending:
+        document, future = pending.popleft()
+        yield document, future.result()
+
+
+class _StreamBuffer:
+    """Неперематываемый файл для zipfile: копит записанное до очередной выдачи."""
+
+    def __init__(self):
+        self._parts = []
+
+    def write(self, data):
+        self._parts.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b''.join(self._parts)
+        self._parts.clear()
+        return data
+
+
+def stream_zip(pdfs):
+    """Куски ZIP-архива: по одному на каждый готовый PDF плюс оглавление в конце."""
+    buffer = _StreamBuffer()
+    # PDF уже сжаты, повторное сжатие только тратит процессор.
+    with zipfile.ZipFile(buffer, 'w', compression=zipfile.ZIP_STORED) as archive:
+        for document, pdf in pdfs:
+            archive.writestr(f'document_{document.pk}.pdf', pdf)
+            yield buffer.drain()
+    yield buffer.drain()
+
+
+def stream_merged(pdfs):
+    """
+    Куски одного сводного PDF. Таблица ссылок PDF пишется в конце файла,
+    поэтому отдача начинается только после сборки всех страниц; готовый
+    файл пишется во временный файл на диске и читается оттуда блоками.
+    PdfWriter держит все страницы в памяти: вызывающий код ограничивает
+    выгрузку MAX_MERGED_DOCUMENTS документами.
+    """
+    from pypdf import PdfWriter
+
+    writer = PdfWriter()
+    for document, pdf in pdfs:
+        writer.append(BytesIO(pdf))
+    with tempfile.TemporaryFile() as output:
+        writer.write(output)
+        writer.close()
+        output.seek(0)
+        while block := output.read(STREAM_BLOCK_SIZE):
+            yield block
+
+
+FORMATS = {
+    'zip': (stream_zip, 'application/zip'),
+    'pdf': (stream_merged, 'application/pdf'),
+}
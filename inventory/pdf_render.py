@@ -0,0 +1,20 @@
+"""
+Рендеринг HTML в PDF для процессов пула выгрузки.
+
+Модуль намеренно не импортирует Django: процессы пула запускаются через
+spawn и получают уже готовый HTML, поэтому им не нужны ни настройки, ни база.
+
+xhtml2pdf (вместе с reportlab, html5lib и svglib) импортируется при первом
+рендеринге: процессы, которые не строят PDF, не тратят на него время запуска.
+"""
+from io import BytesIO
+
+
+def html_to_pdf(html):
+    from xhtml2pdf import pisa
+
+    output = BytesIO()
+    status = pisa.CreatePDF(html, dest=output)
+    if status.err:
+        raise ValueError(f'xhtml2pdf: ошибок при рендеринге — {status.err}')
+    return output.getvalue()
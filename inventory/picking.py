@@ -0,0 +1,110 @@
+"""
+Волны отбора: несколько расходных документов собираются в один обход склада.
+
+Строки документов волны суммируются по товару. Под каждый товар берутся
+ячейки с остатком, сначала с большим остатком, чтобы остановок было меньше.
+Остановки упорядочиваются по маршруту "змейкой" (S-shape): зоны и проходы
+по порядку, полки в каждом следующем посещаемом проходе — в обратном
+направлении, так что отборщик не возвращается к началу прохода. Пустые
+проходы пропускаются. План считается тремя запросами и одной сортировкой,
+поэтому волна из тысяч строк планируется за доли секунды.
+"""
+from collections import defaultdict, deque
+
+from .models import BinStock, Document, Product, Transaction
+from .services import OUTGOING
+
+MAX_WAVE_DOCUMENTS = 1000
+
+
+def wave_documents(ids=None, day=None):
+    """Запрос id расходных документов волны: по списку ids и/или за день day."""
+    documents = Document.objects.filter(document_type=OUTGOING).order_by('pk')
+    if ids:
+        documents = documents.filter(pk__in=ids)
+    if day:
+        documents = documents.filter(date=day)
+    return documents.values_list('pk', flat=True)
+
+
+def plan_wave(document_ids):
+    """
+    Лист отбора для волны документов document_ids. Возвращает словарь id
+    склада → остановки в порядке обхода. Остановка — словарь с ключами bin
+    (словарь code, zone, aisle, shelf; None, если товара в ячейках не
+    хватило — такие остановки идут в конце), product (id, product_name,
+    serial_number), quantity и documents — [(id документа, количество), ...]
+    для раскладки отобранного по заказам. Строки читаются кортежами, без
+    создания экземпляров моделей.
+    """
+    demand = defaultdict(list)
+    lines = Transaction.objects.filter(document_id__in=document_ids, document__document_type=OUTGOING) \
+        .order_by('document_id', 'pk').values_list('warehouse_id', 'product_id', 'document_id', 'quantity')
+    for warehouse_id, product_id, document_id, quantity in lines:
+        demand[warehouse_id, product_id].append([document_id, quantity])
+    if not demand:
+        return {}
+
+    products = {
+        product['id']: product
+        for product in Product.objects.filter(pk__in={product_id for _, product_id in demand})
+        .values('id', 'product_name', 'serial_number')
+    }
+    bins = {}
+    slots = defaultdict(list)
+    for bin_id, warehouse_id, code, zone, aisle, shelf, product_id, quantity in BinStock.objects.filter(
+        product_id__in=products, bin__warehouse_id__in={warehouse_id for warehouse_id, _ in demand}, quantity__gt=0,
+    ).values_list(
+        'bin_id', 'bin__warehouse_id', 'bin__code', 'bin__zone', 'bin__aisle', 'bin__shelf', 'product_id', 'quantity',
+    ):
+        if bin_id not in bins:
+            bins[bin_id] = {'code': code, 'zone': zone, 'aisle': aisle, 'shelf': shelf}
+        slots[warehouse_id, product_id].append((quantity, bins[bin_id]))
+
+    stops = defaultdict(list)
+    shortages = defaultdict(list)
+    for (warehouse_id, product_id), orders in demand.items():
+        orders = deque(orders)
+        for quantity, bin in sorted(slots[warehouse_id, product_id], key=lambda slot: -slot[0]):
+            stops[warehouse_id].append(_stop(bin, products[product_id], _take(orders, quantity)))
+            if not orders:
+                break
+        if orders:
+            shortages[warehouse_id].append(_stop(None, products[product_id], [tuple(order) for order in orders]))
+
+    return {
+        warehouse_id: _route(stops[warehouse_id]) + shortages[warehouse_id]
+        for warehouse_id in stops.keys() | shortages.keys()
+    }
+
+
+def _take(orders, available):
+    """Снимает с очереди заказов orders до available штук; возвращает [(документ, количество)]."""
+    served = []
+    while orders and available:
+        document_id, quantity = orders[0]
+        taken = min(quantity, available)
+        served.append((document_id, taken))
+        available -= taken
+        if taken == quantity:
+            orders.popleft()
+        else:
+            orders[0][1] -= taken
+    return served
+
+
+def _stop(bin, product, served):
+    return {'bin': bin, 'product': product, 'quantity': sum(quantity for _, quantity in served), 'documents': served}
+
+
+def _route(stops):
+    """Остановки в порядке обхода "змейкой"."""
+    aisles = sorted({(stop['bin']['zone'], stop['bin']['aisle']) for stop in stops})
+    backwards = {aisle for number, aisle in enumerate(aisles) if number % 2}
+
+    def key(stop):
+        bin = stop['bin']
+        aisle = bin['zone'], bin['aisle']
+        return (*aisle, -bin['shelf'] if aisle in backwards else bin['shelf'], bin['code'])
+
+    return sorted(stops, key=key)
@@ -0,0 +1,54 @@
+"""
+Документ со строками для отображения: HTML-карточка, PDF и пакетная выгрузка.
+
+documents_with_lines() отдает документы (итоговая сумма хранится в самом
+документе, total_amount) с заранее загруженными строками: товар, поставщик,
+клиент, склад и сумма строки, посчитанная в базе. Сколько бы строк ни было
+в документах, это два запроса.
+"""
+from django.db.models import DecimalField, ExpressionWrapper, F, OuterRef, Prefetch, Subquery
+
+from .models import Document, StockAuditRecord, Transaction
+
+_AMOUNT = DecimalField(max_digits=14, decimal_places=2)
+
+
+def document_lines():
+    """Строки документов со всеми связанными объектами и суммой строки line_total."""
+    return Transaction.objects.select_related('product', 'supplier', 'customer', 'warehouse') \
+        .annotate(line_total=ExpressionWrapper(F('quantity') * F('price'), output_field=_AMOUNT)) \
+        .order_by('pk')
+
+
+def documents_with_lines():
+    """Документы со строками в атрибуте lines."""
+    return Document.objects.prefetch_related(Prefetch('transactions', queryset=document_lines(), to_attr='lines'))
+
+
+def document_author():
+    """
+    Выражение для annotate: имя пользователя, проводившего документ, по
+    журналу аудита (None, если журнал не знает пользователя).
+    """
+    return Subquery(
+        StockAuditRecord.objects.filter(document=OuterRef('pk'), user__isnull=False)
+        .values('user__username')[:1]
+    )
+
+
+def document_context(document):
+    """Контекст шаблонов документа для документа из documents_with_lines()."""
+    lines = document.lines
+    counterparties = {
+        str(party): None
+        for line in lines
+        for party in (line.supplier, line.customer)
+        if party is not None
+    }
+    return {
+        'document': document,
+        'items': lines,
+        'total_sum': document.total_amount,
+        'counterparties': ', '.join(counterparties),
+        'warehouses': ', '.join({line.warehouse.name: None for line in lines}),
+    }
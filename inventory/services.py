@@ -0,0 +1,380 @@
+from collections import defaultdict
+from decimal import Decimal
+from itertools import islice
+
+from django.core.exceptions import ValidationError
+from django.db import IntegrityError, connection, transaction as db_transaction
+from django.db.models import Count, DecimalField, F, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce, TruncMonth
+from django.utils import timezone
+
+from .audit import audit_log
+from .models import (
+    CustomerActivity, Document, Inventory, Lot, LotAllocation, StockAuditRecord, StockEvent, SupplierActivity,
+    Transaction,
+)
+from .outbox import hold_event_fence
+from .write_queue import write_queue
+
+INCOMING = 'Приход'
+OUTGOING = 'Расход'
+
+
+def post_document(document_type, warehouse, items, date=None, idempotency_key=None, user=None):
+    """
+    Проводит документ: создает Document, его строки Transaction и изменяет
+    остатки Inventory в одной транзакции.
+
+    items — список словарей с ключами product, quantity, price и
+    необязательными supplier/customer (как cleaned_data формы ProductForm).
+    Строки прихода товаров с учетом партий несут lot_number и expiry_date,
+    расход таких товаров списывается с партий по FEFO (allocate_lots).
+    При нехватке товара для расхода выбрасывается ValidationError, и документ
+    не создается.
+
+    Если передан idempotency_key и тот же user уже провел документ этого типа
+    с таким ключом, возвращается он, а повторного проведения не происходит.
+    user попадает в документ и в журнал аудита изменений остатков.
+    """
+    if idempotency_key:
+        existing = find_posted_document(idempotency_key, document_type, user)
+        if existing is not None:
+            return existing
+    return write_queue.submit(_post_document, document_type, warehouse, items, date, idempotency_key, user)
+
+
+def find_posted_document(idempotency_key, document_type, user=None):
+    """Документ типа document_type, уже проведенный user по этому ключу запроса, или None."""
+    return Document.objects.filter(
+        posted_by=user, document_type=document_type, idempotency_key=idempotency_key
+    ).first()
+
+
+def _post_document(document_type, warehouse, items, date, idempotency_key, user):
+    try:
+        return _create_document(document_type, warehouse, items, date, idempotency_key, user)
+    except IntegrityError:
+        # Параллельный повтор с тем же ключом успел провести документ первым.
+        existing = find_posted_document(idempotency_key, document_type, user) if idempotency_key else None
+        if existing is None:
+            raise
+        return existing
+
+
+def _create_document(document_type, warehouse, items, date, idempotency_key, user):
+    with db_transaction.atomic():
+        # Первой блокировкой транзакции: лента событий ждет только проведения,
+        # начатые до нее, и не образует с ними цикла ожидания.
+        hold_event_fence()
+        document = Document.objects.create(
+            document_type=document_type,
+            date=date or timezone.localdate(),
+            idempotency_key=idempotency_key or None,
+            posted_by=user,
+            total_amount=sum((item['quantity'] * item['price'] for item in items), Decimal(0)),
+            line_count=len(items),
+            total_quantity=sum(item['quantity'] for item in items),
+        )
+        lines = Transaction.objects.bulk_create([
+            Transaction(
+                document=document,
+                product=item['product'],
+                quantity=item['quantity'],
+                price=item['price'],
+                supplier=item.get('supplier'),
+                customer=item.get('customer'),
+                warehouse=warehouse,
+            )
+            for item in items
+        ])
+
+        quantities = defaultdict(int)
+        products = {}
+        for item in items:
+            quantities[item['product'].pk] += item['quantity']
+            products[item['product'].pk] = item['product']
+
+        # Единый порядок обновления строк остатков исключает взаимоблокировки
+        # между одновременными проведениями.
+        for product_id in sorted(quantities):
+            if document_type == INCOMING:
+                _add_stock(product_id, warehouse, quantities[product_id])
+            else:
+                _remove_stock(products[product_id], warehouse, quantities[product_id])
+
+        tracked = [(line, item) for line, item in zip(lines, items) if line.product.tracks_lots]
+        if tracked:
+            if document_type == INCOMING:
+                allocations = _receive_lots(warehouse, tracked)
+            else:
+                allocations = allocate_lots(warehouse, [line for line, _ in tracked], document.date)
+            LotAllocation.objects.bulk_create(allocations)
+
+        events = _record_stock_events(document, warehouse, quantities)
+        _record_counterparty_activity(document, items)
+        audit_log.record([
+            StockAuditRecord(
+                user=user, document=document, product_id=event.product_id, warehouse=warehouse,
+                quantity_delta=event.quantity_delta, quantity=event.quantity, created_at=event.created_at,
+            )
+            for event in events
+        ])
+    return document
+
+
+def _record_stock_events(document, warehouse, quantities):
+    """Пишет события outbox об изменении остатков в текущую транзакцию и возвращает их."""
+    sign = 1 if document.document_type == INCOMING else -1
+    balances = dict(
+        Inventory.objects.filter(warehouse=warehouse, product_id__in=quantities)
+        .values_list('product_id', 'quantity')
+    )
+    return StockEvent.objects.bulk_create([
+        StockEvent(
+            document=document,
+            product_id=product_id,
+            warehouse=warehouse,
+            quantity_delta=sign * quantities[product_id],
+            quantity=balances[product_id],
+        )
+        for product_id in sorted(quantities)
+    ])
+
+
+# Куда попадают строки документа каждого типа в помесячных итогах.
+COUNTERPARTY_ACTIVITY = {INCOMING: (SupplierActivity, 'supplier'), OUTGOING: (CustomerActivity, 'customer')}
+
+
+def _record_counterparty_activity(document, items):
+    """Добавляет строки документа с контрагентом к итогам его месяца."""
+    model, field = COUNTERPARTY_ACTIVITY[document.document_type]
+    totals = defaultdict(lambda: [0, Decimal(0), 0])
+    for item in items:
+        if item.get(field) is None:
+            continue
+        total = totals[item[field].pk, item['product'].pk]
+        total[0] += item['quantity']
+        total[1] += item['quantity'] * item['price']
+        total[2] += 1
+    if totals:
+        period = document.date.replace(day=1)
+        _increment_activity(model, field, [(period, *key, *totals[key]) for key in sorted(totals)])
+
+
+def _increment_activity(model, field, rows):
+    """
+    Прибавляет строки (период, контрагент, товар, количество, сумма, строк)
+    к итогам одним INSERT ... ON CONFLICT DO UPDATE (PostgreSQL и SQLite):
+    ORM умеет при конфликте только перезаписать значения, а не прибавить.
+    Строки отсортированы по ключу, чтобы одновременные проведения блокировали
+    их в одном порядке.
+    """
+    table = connection.ops.quote_name(model._meta.db_table)
+    counterparty = connection.ops.quote_name(model._meta.get_field(field).column)
+    values = ', '.join(['(%s, %s, %s, %s, %s, %s)'] * len(rows))
+    sql = (
+        f'INSERT INTO {table} (period, {counterparty}, product_id, quantity, amount, line_count) '
+        f'VALUES {values} ON CONFLICT (period, {counterparty}, product_id) DO UPDATE SET '
+        f'quantity = {table}.quantity + excluded.quantity, '
+        f'amount = {table}.amount + excluded.amount, '
+        f'line_count = {table}.line_count + excluded.line_count'
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [value for row in rows for value in row])
+
+
+def counterparty_activity(documents):
+    """
+    Вклад строк документов documents в итоги по контрагентам: модель итогов →
+    строки (период, контрагент, товар, количество, сумма, строк). Снимок
+    до и после изменения документов передается в apply_counterparty_activity.
+    """
+    activity = {}
+    for document_type, (model, field) in COUNTERPARTY_ACTIVITY.items():
+        activity[model] = list(
+            Transaction.objects
+            .filter(document__in=documents, document__document_type=document_type, **{f'{field}__isnull': False})
+            .annotate(period=TruncMonth('document__date'))
+            .values_list('period', f'{field}_id', 'product_id')
+            .annotate(total_quantity=Sum('quantity'), total_amount=Sum(F('quantity') * F('price')), total_lines=Count('pk'))
+            .order_by('period', f'{field}_id', 'product_id')
+        )
+    return activity
+
+
+def apply_counterparty_activity(before=None, after=None):
+    """
+    Прибавляет к итогам по контрагентам разницу after − before (снимки
+    counterparty_activity; None — документов нет: before у нового документа,
+    after у удаленного). Поэтому правка документа не пересчитывает месяц и
+    не теряет одновременные проведения. Опустевшие строки итогов удаляются.
+    """
+    for model, field in COUNTERPARTY_ACTIVITY.values():
+        delta = defaultdict(lambda: [0, Decimal(0), 0])
+        for sign, rows in ((-1, before[model] if before else []), (1, after[model] if after else [])):
+            for period, counterparty_id, product_id, quantity, amount, line_count in rows:
+                total = delta[period, counterparty_id, product_id]
+                total[0] += sign * quantity
+                total[1] += sign * amount
+                total[2] += sign * line_count
+        existing = {row[:3] for row in before[model]} if before else set()
+        # Ключи идут по порядку, как в _increment_activity. Строка итогов с
+        # вкладом до изменения уже есть, и к ней разница (возможно,
+        # отрицательная) прибавляется UPDATE. Новые строки вставляются тем же
+        # UPSERT, что и при проведении. Отрицательные значения во VALUES
+        # нарушили бы ограничение line_count >= 0.
+        for key, (quantity, amount, line_count) in sorted(delta.items()):
+            if not (quantity or amount or line_count):
+                continue
+            period, counterparty_id, product_id = key
+            if key in existing:
+                model.objects.filter(period=period, product_id=product_id, **{f'{field}_id': counterparty_id}).update(
+                    quantity=F('quantity') + quantity, amount=F('amount') + amount,
+                    line_count=F('line_count') + line_count,
+                )
+            else:
+                _increment_activity(model, field, [(*key, quantity, amount, line_count)])
+        if existing:
+            model.objects.filter(period__in={key[0] for key in existing}, line_count=0).delete()
+
+
+def rebuild_counterparty_activity(periods=None, batch_size=2000):
+    """
+    Пересчитывает итоги по контрагентам из строк документов: за месяцы periods
+    (первые числа месяцев) или целиком. Возвращает число строк итогов.
+    """
+    created = 0
+    with db_transaction.atomic():
+        for document_type, (model, field) in COUNTERPARTY_ACTIVITY.items():
+            stale = model.objects.all()
+            lines = Transaction.objects.filter(
+                document__document_type=document_type, **{f'{field}__isnull': False}
+            ).annotate(period=TruncMonth('document__date'))
+            if periods is not None:
+                stale = stale.filter(period__in=periods)
+                lines = lines.filter(document__date__gte=min(periods), period__in=periods)
+            stale.delete()
+
+            rows = lines.values_list('period', f'{field}_id', 'product_id').annotate(
+                total_quantity=Sum('quantity'),
+                total_amount=Sum(F('quantity') * F('price')),
+                total_lines=Count('pk'),
+            ).order_by().iterator(chunk_size=batch_size)
+            while batch := [
+                model(**{
+                    'period': period, f'{field}_id': counterparty_id, 'product_id': product_id,
+                    'quantity': quantity, 'amount': amount, 'line_count': line_count,
+                })
+                for period, counterparty_id, product_id, quantity, amount, line_count in islice(rows, batch_size)
+            ]:
+                model.objects.bulk_create(batch)
+                created += len(batch)
+    return created
+
+
+def _add_stock(product_id, warehouse, quantity):
+    updated = Inventory.objects.filter(
+        product_id=product_id, warehouse=warehouse
+    ).update(quantity=F('quantity') + quantity)
+    if not updated:
+        stock, created = Inventory.objects.get_or_create(
+            product_id=product_id, warehouse=warehouse, defaults={'quantity': quantity}
+        )
+        if not created:
+            Inventory.objects.filter(pk=stock.pk).update(quantity=F('quantity') + quantity)
+
+
+def _remove_stock(product, warehouse, quantity):
+    updated = Inventory.objects.filter(
+        product=product, warehouse=warehouse, quantity__gte=quantity
+    ).update(quantity=F('quantity') - quantity)
+    if not updated:
+        raise ValidationError(
+            f'Недостаточно товара «{product}» на складе «{warehouse}» для списания {quantity} шт.'
+        )
+
+
+def _receive_lots(warehouse, received):
+    """
+    Зачисляет строки прихода received — пары (строка, позиция с lot_number и
+    expiry_date) — в их партии. Возвращает несохраненные LotAllocation.
+    """
+    allocations = []
+    for line, item in received:
+        lot_number, expiry_date = item.get('lot_number'), item.get('expiry_date')
+        if not lot_number or not expiry_date:
+            raise ValidationError(f'Для товара «{line.product}» нужны номер партии и срок годности.')
+        lot, _ = Lot.objects.get_or_create(
+            product_id=line.product_id, warehouse=warehouse, lot_number=lot_number,
+            defaults={'expiry_date': expiry_date},
+        )
+        if lot.expiry_date != expiry_date:
+            raise ValidationError(
+                f'Партия {lot_number} товара «{line.product}» уже есть на складе со сроком годности {lot.expiry_date}.'
+            )
+        Lot.objects.filter(pk=lot.pk).update(quantity=F('quantity') + line.quantity)
+        allocations.append(LotAllocation(transaction=line, lot=lot, quantity=line.quantity))
+    return allocations
+
+
+def allocate_lots(warehouse, lines, date):
+    """
+    Списывает строки расхода lines с партий склада по FEFO: сначала партии
+    с ближайшим сроком годности, просроченные на дату date не отгружаются.
+    Партии всех товаров читаются одним запросом (индекс lot_fefo_idx),
+    распределение считается в памяти, остатки партий обновляются одним
+    bulk_update. Возвращает несохраненные LotAllocation.
+
+    Вызывается после списания Inventory тех же товаров: блокировка строк
+    остатков упорядочивает одновременные расходы, поэтому партии читаются
+    уже после фиксации предыдущего расхода и без select_for_update.
+    """
+    available = defaultdict(list)
+    for lot in Lot.objects.filter(
+        warehouse=warehouse, product_id__in={line.product_id for line in lines},
+        quantity__gt=0, expiry_date__gte=date,
+    ).order_by('product_id', 'expiry_date', 'pk'):
+        available[lot.product_id].append(lot)
+
+    allocations = []
+    changed = {}
+    for line in lines:
+        needed = line.quantity
+        for lot in available[line.product_id]:
+            if not needed:
+                break
+            taken = min(needed, lot.quantity)
+            if taken:
+                lot.quantity -= taken
+                needed -= taken
+                changed[lot.pk] = lot
+                allocations.append(LotAllocation(transaction=line, lot=lot, quantity=taken))
+        if needed:
+            raise ValidationError(
+                f'Недостаточно годных партий товара «{line.product}» на складе «{warehouse}»: '
+                f'не хватает {needed} шт.'
+            )
+    Lot.objects.bulk_update(changed.values(), ['quantity'])
+    return allocations
+
+
+def refresh_document_totals(documents):
+    """
+    Пересчитывает total_amount, line_count и total_quantity документов
+    queryset одним UPDATE с подзапросами по строкам.
+    """
+    return documents.update(**document_totals())
+
+
+def document_totals():
+    """Выражения итогов документа по его строкам (для update/annotate)."""
+    lines = Transaction.objects.filter(document=OuterRef('pk')).order_by().values('document')
+    amount = DecimalField(max_digits=14, decimal_places=2)
+    return {
+        'total_amount': Coalesce(
+            Subquery(lines.annotate(total=Sum(F('quantity') * F('price'), output_field=amount)).values('total')),
+            Value(Decimal(0)), output_field=amount,
+        ),
+        'line_count': Coalesce(Subquery(lines.annotate(total=Count('pk')).values('total')), 0),
+        'total_quantity': Coalesce(Subquery(lines.annotate(total=Sum('quantity')).values('total')), 0),
+    }
@@ -69,3 +69,37 @@
 #             operation_type="CREATE",
 #             user_add=instance.outgoing_transaction.document.staff
 #         )
+
+
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import receiver
+
+from .auth_backends import forget_users
+from .models import Product, ProductTombstone, Role, Staff
+
+
+@receiver(post_delete, sender=Product)
+def record_product_tombstone(sender, instance, **kwargs):
+    # Сканеры с офлайн-каталогом узнают об удалении при следующей синхронизации.
+    ProductTombstone.objects.create(product_id=instance.pk)
+
+
+# Кеш сбрасывается после фиксации транзакции: сброшенного до нее пользователя
+# параллельный запрос успел бы снова положить в кеш в прежнем виде.
+
+@receiver(post_save, sender=Staff)
+@receiver(post_delete, sender=Staff)
+def forget_cached_user(sender, instance, using, **kwargs):
+    # Пароль, роль, блокировка и вход (last_login) меняют закешированного пользователя.
+    user_ids = [instance.pk]
+    transaction.on_commit(lambda: forget_users(user_ids), using=using)
+
+
+@receiver(post_save, sender=Role)
+@receiver(pre_delete, sender=Role)
+def forget_role_users(sender, instance, using, **kwargs):
+    # pre_delete: после удаления роли ссылки на нее у пользователей уже
+    # обнулены, поэтому список читается сейчас, а сбрасывается после фиксации.
+    user_ids = list(Staff.objects.using(using).filter(role=instance).values_list('pk', flat=True))
+    transaction.on_commit(lambda: forget_users(user_ids), using=using)
@@ -0,0 +1,73 @@
+"""
+Машиночитаемые остатки: строки Inventory с товаром и складом.
+
+Строки читаются через values_list и сериализуются прямо из кортежей, без
+экземпляров моделей. Порядок — по id строки остатка, курсор — id последней
+отданной строки, поэтому каждая страница читается по первичному ключу
+независимо от глубины, а полная выгрузка JSON Lines идет курсором базы без
+загрузки всей таблицы в память.
+"""
+import json
+
+from .models import Inventory
+
+# Поле ответа → путь в ORM.
+STOCK_API_FIELDS = {
+    'id': 'id',
+    'product_id': 'product_id',
+    'serial_number': 'product__serial_number',
+    'product_name': 'product__product_name',
+    'warehouse_id': 'warehouse_id',
+    'warehouse_name': 'warehouse__name',
+    'quantity': 'quantity',
+}
+DEFAULT_FIELDS = ('id', 'product_id', 'serial_number', 'warehouse_id', 'quantity')
+DEFAULT_PAGE_SIZE = 1000
+MAX_PAGE_SIZE = 10000
+CURSOR_CHUNK_SIZE = 2000
+LINES_PER_CHUNK = 1000
+
+
+def parse_fields(value):
+    """Поля из ?fields=a,b,c (по умолчанию DEFAULT_FIELDS); ValueError при неизвестном поле."""
+    fields = tuple(name for name in (value or '').split(',') if name) or DEFAULT_FIELDS
+    unknown = [name for name in fields if name not in STOCK_API_FIELDS]
+    if unknown:
+        raise ValueError(f'Неизвестные поля: {", ".join(unknown)}. Доступны: {", ".join(STOCK_API_FIELDS)}')
+    return fields
+
+
+def stock_rows(fields, warehouse_ids=None, product_ids=None, serial_number=None, after=None):
+    """
+    Кортежи (id строки, значения fields...) по строкам остатков в порядке
+    id; id нужен для курсора. after — курсор: строки с id больше него.
+    """
+    rows = Inventory.objects.order_by('id')
+    if warehouse_ids:
+        rows = rows.filter(warehouse_id__in=warehouse_ids)
+    if product_ids:
+        rows = rows.filter(product_id__in=product_ids)
+    if serial_number:
+        rows = rows.filter(product__serial_number=serial_number)
+    if after is not None:
+        rows = rows.filter(id__gt=after)
+    return rows.values_list('id', *(STOCK_API_FIELDS[name] for name in fields))
+
+
+def page(rows, fields, limit):
+    """Страница ответа JSON: {"results": [...], "next": курсор или null}."""
+    batch = list(rows[:limit + 1])
+    results = [dict(zip(fields, row[1:])) for row in batch[:limit]]
+    return {'results': results, 'next': batch[limit - 1][0] if len(batch) > limit else None}
+
+
+def json_lines(rows, fields):
+    """Байтовые куски JSON Lines по LINES_PER_CHUNK строк, все строки rows."""
+    lines = []
+    for row in rows.iterator(chunk_size=CURSOR_CHUNK_SIZE):
+        lines.append(json.dumps(dict(zip(fields, row[1:])), ensure_ascii=False))
+        if len(lines) >= LINES_PER_CHUNK:
+            yield ('\n'.join(lines) + '\n').encode()
+            lines = []
+    if lines:
+        yield ('\n'.join(lines) + '\n').encode()
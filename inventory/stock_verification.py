@@ -0,0 +1,98 @@
+"""
+Сверка остатков Inventory с историей строк документов.
+
+Остаток пары товар × склад по истории — сумма приходов минус сумма расходов.
+Каталог делится на диапазоны id товаров, каждый диапазон сверяется в
+процессе пула: остатки по истории (агрегат по Transaction) и строки Inventory
+читаются курсорами, отсортированными по (товар, склад), и сравниваются
+слиянием, поэтому в памяти нет ни всего диапазона, ни тем более всей таблицы.
+Процессы пула только читают; исправления применяет вызывающий процесс.
+"""
+from django.db import transaction as db_transaction
+from django.db.models import Case, F, Max, Min, OuterRef, Q, Subquery, Sum, When
+from django.db.models.functions import Coalesce
+
+from .models import Inventory, Transaction
+from .services import INCOMING
+
+CURSOR_CHUNK_SIZE = 5000
+
+
+def product_ranges(size):
+    """Полуоткрытые диапазоны id товаров [first, last) по size id."""
+    bounds = Inventory.objects.aggregate(first=Min('product_id'), last=Max('product_id'))
+    ledger = Transaction.objects.aggregate(first=Min('product_id'), last=Max('product_id'))
+    ids = [value for value in (*bounds.values(), *ledger.values()) if value is not None]
+    if not ids:
+        return []
+    return [(first, first + size) for first in range(min(ids), max(ids) + 1, size)]
+
+
+def ledger_balances(lines):
+    """Остатки по истории для строк lines: (товар, склад, остаток) по возрастанию ключа."""
+    return lines.values_list('product_id', 'warehouse_id').annotate(
+        balance=Sum(Case(When(document__document_type=INCOMING, then=F('quantity')), default=-F('quantity')))
+    ).order_by('product_id', 'warehouse_id')
+
+
+def merge_diff(ledger, stored):
+    """
+    Слияние двух потоков, отсортированных по (товар, склад): ledger —
+    (товар, склад, остаток по истории), stored — (товар, склад, остаток, id
+    строки Inventory). Выдает расхождения (товар, склад, хранимый остаток,
+    остаток по истории, id строки); для отсутствующей строки Inventory
+    хранимый остаток и id — None. Отсутствующая строка при нулевой истории
+    расхождением не считается.
+    """
+    ledger, stored = iter(ledger), iter(stored)
+    expected, actual = next(ledger, None), next(stored, None)
+    while expected is not None or actual is not None:
+        if actual is None or (expected is not None and expected[:2] < actual[:2]):
+            if expected[2]:
+                yield expected[0], expected[1], None, expected[2], None
+            expected = next(ledger, None)
+        elif expected is None or actual[:2] < expected[:2]:
+            if actual[2]:
+                yield actual[0], actual[1], actual[2], 0, actual[3]
+            actual = next(stored, None)
+        else:
+            if expected[2] != actual[2]:
+                yield actual[0], actual[1], actual[2], expected[2], actual[3]
+            expected, actual = next(ledger, None), next(stored, None)
+
+
+def check_range(bounds):
+    """Расхождения по товарам с id из [first, last) (выполняется в процессе пула)."""
+    first, last = bounds
+    products = Q(product_id__gte=first, product_id__lt=last)
+    ledger = ledger_balances(Transaction.objects.filter(products)).iterator(chunk_size=CURSOR_CHUNK_SIZE)
+    stored = Inventory.objects.filter(products).order_by('product_id', 'warehouse_id') \
+        .values_list('product_id', 'warehouse_id', 'quantity', 'pk').iterator(chunk_size=CURSOR_CHUNK_SIZE)
+    return list(merge_diff(ledger, stored))
+
+
+def apply_fixes(diffs, batch_size=1000):
+    """
+    Приводит остатки пар из diffs к истории. Существующие строки обновляются
+    одним UPDATE на пачку, новый остаток вычисляется в том же UPDATE
+    подзапросом по строкам документов: проведение, успевшее изменить пару
+    после сверки, не теряется. Недостающие строки создаются. Возвращает число
+    исправленных пар.
+    """
+    balance = ledger_balances(
+        Transaction.objects.filter(product_id=OuterRef('product_id'), warehouse_id=OuterRef('warehouse_id'))
+    ).values('balance')
+    existing = sorted(inventory_id for *_, inventory_id in diffs if inventory_id is not None)
+    missing = [
+        Inventory(product_id=product_id, warehouse_id=warehouse_id, quantity=ledger)
+        for product_id, warehouse_id, _, ledger, inventory_id in diffs if inventory_id is None
+    ]
+    fixed = 0
+    with db_transaction.atomic():
+        for first in range(0, len(existing), batch_size):
+            fixed += Inventory.objects.filter(pk__in=existing[first:first + batch_size]).update(
+                quantity=Coalesce(Subquery(balance), 0)
+            )
+        # Строку, которую успело создать проведение, не трогаем.
+        fixed += len(Inventory.objects.bulk_create(missing, batch_size=batch_size, ignore_conflicts=True))
+    return fixed
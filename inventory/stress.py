@@ -0,0 +1,166 @@
+"""
+Нагрузочная проверка одновременных проведений по одним и тем же товарам.
+
+Исполнители (потоки или процессы) проводят вперемешку приходы и расходы по
+нескольким "горячим" парам товар × склад и считают, сколько штук им удалось
+провести. После прогона проверяются инварианты: остаток каждой пары равен
+начальному плюс проведенные приходы минус проведенные расходы, равен
+остатку по истории документов и ни разу не был отрицательным (по остаткам
+после каждого изменения в StockEvent). Потерянное обновление или продажа
+в минус нарушают хотя бы один из них.
+"""
+import random
+import threading
+import time
+from collections import Counter
+from decimal import Decimal
+
+from django.core.exceptions import ValidationError
+from django.db import DatabaseError, connection, connections
+from django.db.models import Min, Sum
+
+from .audit import audit_log
+from .models import Document, Inventory, Product, StockEvent, Transaction, Warehouse
+from .services import INCOMING, OUTGOING, post_document
+from .stock_verification import ledger_balances
+
+STRESS_PREFIX = 'STRESS-'
+
+
+def create_fixture(products, initial_stock):
+    """
+    Создает склад и products товаров для прогона и проводит по ним
+    начальный приход. Возвращает (склад, список id товаров).
+    """
+    marker = f'{STRESS_PREFIX}{time.time_ns()}'
+    warehouse = Warehouse.objects.create(name=marker)
+    Product.objects.bulk_create([
+        Product(product_name=f'Стресс-тест {number}', serial_number=f'{marker}-{number}')
+        for number in range(products)
+    ])
+    hot = list(Product.objects.filter(serial_number__startswith=f'{marker}-'))
+    post_document(INCOMING, warehouse, [
+        {'product': product, 'quantity': initial_stock, 'price': Decimal('1.00')} for product in hot
+    ])
+    return warehouse, [product.pk for product in hot]
+
+
+def drop_fixture(warehouse, product_ids):
+    """Удаляет все, что создал прогон: документы, остатки, товары и склад."""
+    audit_log.flush()
+    Document.objects.filter(transactions__warehouse=warehouse).delete()
+    Product.objects.filter(pk__in=product_ids).delete()
+    warehouse.delete()
+
+
+def post_batch(seed, documents, lines, max_quantity, product_ids, warehouse_id):
+    """
+    Проводит documents документов подряд, выбирая приход или расход
+    случайно. Возвращает проведенные штуки по товарам (приход с плюсом,
+    расход с минусом), задержки проведений в секундах и счетчики исходов.
+    """
+    rnd = random.Random(seed)
+    products = list(Product.objects.filter(pk__in=product_ids))
+    warehouse = Warehouse.objects.get(pk=warehouse_id)
+    posted = Counter()
+    outcomes = Counter()
+    latencies = []
+    try:
+        for _ in range(documents):
+            document_type = rnd.choice((INCOMING, OUTGOING))
+            items = [
+                {'product': rnd.choice(products), 'quantity': rnd.randint(1, max_quantity), 'price': Decimal('1.00')}
+                for _ in range(lines)
+            ]
+            started = time.perf_counter()
+            try:
+                post_document(document_type, warehouse, items)
+            except ValidationError:
+                outcomes['rejected'] += 1
+            except DatabaseError as error:
+                outcomes['locked' if 'lock' in str(error) else 'failed'] += 1
+            else:
+                outcomes[document_type] += 1
+                sign = 1 if document_type == INCOMING else -1
+                for item in items:
+                    posted[item['product'].pk] += sign * item['quantity']
+            latencies.append(time.perf_counter() - started)
+    finally:
+        audit_log.flush()
+        connections.close_all()
+    return posted, latencies, outcomes
+
+
+class LockWaitSampler(threading.Thread):
+    """
+    Раз в interval секунд считает сеансы PostgreSQL, ждущие блокировку
+    (pg_stat_activity.wait_event_type = 'Lock'). В SQLite ожидание
+    блокировки происходит внутри драйвера и снаружи не видно.
+    """
+
+    def __init__(self, interval=0.05):
+        super().__init__(name='inventory-stress-lock-sampler', daemon=True)
+        self.interval = interval
+        self.samples = []
+        self._done = threading.Event()
+
+    def run(self):
+        try:
+            with connection.cursor() as cursor:
+                while not self._done.wait(self.interval):
+                    cursor.execute(
+                        "SELECT count(*) FROM pg_stat_activity "
+                        "WHERE datname = current_database() AND wait_event_type = 'Lock'"
+                    )
+                    self.samples.append(cursor.fetchone()[0])
+        finally:
+            connection.close()
+
+    def stop(self):
+        self._done.set()
+        self.join()
+
+
+def deadlock_count():
+    """Число взаимоблокировок в текущей базе PostgreSQL с запуска сервера."""
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT deadlocks FROM pg_stat_database WHERE datname = current_database()')
+        return cursor.fetchone()[0]
+
+
+def check_invariants(warehouse, product_ids, initial_stock, posted):
+    """
+    Сверяет остатки горячих пар после прогона. posted — суммарно проведенные
+    исполнителями штуки по товарам. Возвращает список нарушений (строк);
+    пустой список — инварианты выполнены.
+    """
+    stored = dict(
+        Inventory.objects.filter(warehouse=warehouse, product_id__in=product_ids)
+        .values_list('product_id', 'quantity')
+    )
+    ledger = {
+        product_id: balance
+        for product_id, _, balance in ledger_balances(
+            Transaction.objects.filter(warehouse=warehouse, product_id__in=product_ids)
+        )
+    }
+    events = {
+        row['product_id']: row
+        for row in StockEvent.objects.filter(warehouse=warehouse, product_id__in=product_ids)
+        .order_by().values('product_id').annotate(delta=Sum('quantity_delta'), lowest=Min('quantity'))
+    }
+
+    violations = []
+    for product_id in product_ids:
+        expected = initial_stock + posted[product_id]
+        actual = stored.get(product_id)
+        if actual != expected:
+            violations.append(f'товар {product_id}: остаток {actual}, ожидалось {expected} по проведенным документам')
+        if ledger.get(product_id) != actual:
+            violations.append(f'товар {product_id}: остаток {actual}, по истории документов {ledger.get(product_id)}')
+        row = events.get(product_id)
+        if row is None or row['delta'] != actual:
+            violations.append(f'товар {product_id}: сумма изменений в событиях {row and row["delta"]}, остаток {actual}')
+        elif row['lowest'] < 0:
+            violations.append(f'товар {product_id}: остаток опускался до {row["lowest"]}')
+    return violations
@@ -1,3 +1,990 @@
-from django.test import TestCase
+import csv
+import gzip
+import json
+import tempfile
+import warnings
+import zipfile
+from concurrent.futures import Future
+from datetime import date, timedelta
+from decimal import Decimal
+from io import BytesIO, StringIO
+from pathlib import Path
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+from django.contrib.auth import BACKEND_SESSION_KEY
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.core.management import call_command
+from django.db import connection, transaction as db_transaction
+from django.test import SimpleTestCase, TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from .models import (
+    BinLocation, BinStock, Customer, CustomerActivity, Document, Inventory, Lot, LotAllocation, Product,
+    ProductTombstone, Role, Staff, StockAuditRecord, StockEvent, Supplier, SupplierActivity,
+    Transaction, Warehouse,
+)
+from .catalog_sync import catalog_changes, make_token, parse_token
+from .audit import AuditLog
+from .auth_backends import CachedModelBackend, user_cache_key
+from .outbox import committed_watermark, dispatch_batch
+from .forms import ProductFormSet
+from .picking import plan_wave
+from .services import INCOMING, OUTGOING, apply_counterparty_activity, counterparty_activity, post_document
+from .stock_verification import apply_fixes, check_range, merge_diff, product_ranges
+
+
+class InventoryTestCase(TestCase):
+    """Склад, два товара и вошедший менеджер."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.role = Role.objects.create(role_name='Менеджер')
+        cls.user = Staff.objects.create_user('manager', password='secret', role=cls.role)
+        cls.warehouse = Warehouse.objects.create(name='Основной')
+        cls.product = Product.objects.create(product_name='Болт', serial_number='SN-1')
+        cls.other_product = Product.objects.create(product_name='Гайка', serial_number='SN-2')
+
+    def setUp(self):
+        # Пользователь и сессия кешируются (inventory.auth_backends), а базы
+        # тестов откатываются вместе с первичными ключами.
+        cache.clear()
+        self.client.force_login(self.user)
+
+    def line_data(self, lines, **document):
+        """POST-данные формы документа со строками lines (словари полей строки)."""
+        data = {
+            'warehouse': self.warehouse.pk,
+            'products-TOTAL_FORMS': len(lines),
+            'products-INITIAL_FORMS': 0,
+            **document,
+        }
+        for index, line in enumerate(lines):
+            for field, value in line.items():
+                data[f'products-{index}-{field}'] = getattr(value, 'pk', value)
+        return data
+
+    def read_stream(self, response):
+        """Куски потокового ответа так, как их читает WSGI-сервер: по одному, без сборки в памяти."""
+        self.assertTrue(response.streaming)
+        self.assertFalse(response.is_async)
+        with warnings.catch_warnings(record=True) as caught:
+            warnings.simplefilter('always')
+            chunks = list(response)
+        self.assertEqual([str(warning.message) for warning in caught], [])
+        return chunks
+
+    async def aread_stream(self, response):
+        """Куски потокового ответа так, как их читает ASGI-сервер."""
+        self.assertTrue(response.streaming)
+        self.assertTrue(response.is_async)
+        return [chunk async for chunk in response]
+
+
+class IncomingFormViewTests(InventoryTestCase):
+    url = reverse('incoming_transaction_create')
+
+    def test_get_renders_line_formset(self):
+        response = self.client.get(self.url)
+        self.assertContains(response, 'name="products-TOTAL_FORMS"')
+        self.assertContains(response, 'name="products-0-product"')
+        self.assertContains(response, 'name="products-0-quantity"')
+        self.assertContains(response, 'name="products-0-price"')
+
+    def test_post_creates_receipt_and_stock(self):
+        response = self.client.post(self.url, self.line_data([
+            {'product': self.product, 'quantity': 5, 'price': '2.50'},
+            {'product': self.other_product, 'quantity': 3, 'price': '1.00'},
+        ]))
+        self.assertRedirects(response, reverse('document_list'), fetch_redirect_response=False)
+
+        document = Document.objects.get()
+        self.assertEqual(document.document_type, 'Приход')
+        self.assertEqual(document.line_count, 2)
+        self.assertEqual(document.total_amount, Decimal('15.50'))
+        self.assertEqual(Transaction.objects.filter(document=document).count(), 2)
+        self.assertEqual(Inventory.objects.get(product=self.product, warehouse=self.warehouse).quantity, 5)
+
+    def test_invalid_line_is_shown_and_nothing_posted(self):
+        response = self.client.post(self.url, self.line_data([{'product': self.product, 'quantity': 0, 'price': '1'}]))
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'invalid-feedback')
+        self.assertFalse(Document.objects.exists())
+
+
+class StockShortageFormSetTests(InventoryTestCase):
+    def setUp(self):
+        super().setUp()
+        Inventory.objects.create(product=self.product, warehouse=self.warehouse, quantity=5)
+
+    def formset(self, lines):
+        # Значения строками, как в POST-запросе.
+        data = {name: str(value) for name, value in self.line_data(lines).items()}
+        formset = ProductFormSet(data, prefix='products')
+        formset.warehouse = self.warehouse
+        return formset
+
+    def test_shortage_is_summed_over_lines_of_one_product(self):
+        formset = self.formset([
+            {'product': self.product, 'quantity': 3, 'price': '1'},
+            {'product': self.other_product, 'quantity': 1, 'price': '1'},
+            {'product': self.product, 'quantity': 3, 'price': '1'},
+        ])
+        self.assertFalse(formset.is_valid())
+        message = (
+            'Недостаточно на складе «Основной»: в наличии 5 шт., '
+            'по всем строкам с этим товаром запрошено 6 шт.'
+        )
+        self.assertEqual(formset.errors[0], {'quantity': [message]})
+        self.assertEqual(formset.errors[2], {'quantity': [message]})
+        # Товара без остатка на складе нет вовсе.
+        self.assertEqual(formset.errors[1], {'quantity': [
+            'Недостаточно на складе «Основной»: в наличии 0 шт., по всем строкам с этим товаром запрошено 1 шт.'
+        ]})
+
+    def test_exact_stock_is_accepted(self):
+        formset = self.formset([
+            {'product': self.product, 'quantity': 2, 'price': '1'},
+            {'product': self.product, 'quantity': 3, 'price': '1'},
+        ])
+        self.assertTrue(formset.is_valid(), formset.errors)
+
+    def test_query_count_does_not_grow_with_lines(self):
+        for count in (1, 20):
+            formset = self.formset([
+                {'product': product, 'quantity': 1, 'price': '1'}
+                for product in [self.product, self.other_product] * count
+            ])
+            # Товары всех строк и остатки склада — по одному запросу.
+            with self.assertNumQueries(2):
+                formset.is_valid()
+
+
+class IdempotentPostingTests(InventoryTestCase):
+    def test_repeated_form_post_creates_one_document(self):
+        data = self.line_data([{'product': self.product, 'quantity': 4, 'price': '1'}], idempotency_key='retry-1')
+        url = reverse('incoming_transaction_create')
+        for _ in range(2):
+            self.assertRedirects(self.client.post(url, data), reverse('document_list'), fetch_redirect_response=False)
+        self.assertEqual(Document.objects.filter(idempotency_key='retry-1').count(), 1)
+        self.assertEqual(Inventory.objects.get(product=self.product).quantity, 4)
+
+    def test_header_key_takes_precedence_over_form_field(self):
+        url = reverse('incoming_transaction_create')
+        data = self.line_data([{'product': self.product, 'quantity': 1, 'price': '1'}], idempotency_key='form-key')
+        self.client.post(url, data, headers={'Idempotency-Key': 'header-key'})
+        self.assertTrue(Document.objects.filter(idempotency_key='header-key').exists())
+
+    def test_service_returns_existing_document(self):
+        items = [{'product': self.product, 'quantity': 2, 'price': Decimal('1.00')}]
+        first = post_document(INCOMING, self.warehouse, items, idempotency_key='svc-1')
+        second = post_document(INCOMING, self.warehouse, items, idempotency_key='svc-1')
+        self.assertEqual(first.pk, second.pk)
+        self.assertEqual(Inventory.objects.get(product=self.product).quantity, 2)
+
+    def test_other_users_key_is_not_replayed(self):
+        data = self.line_data([{'product': self.product, 'quantity': 4, 'price': '1'}], idempotency_key='shared-1')
+        url = reverse('incoming_transaction_create')
+        self.client.post(url, data)
+        other = Staff.objects.create_user('storekeeper', password='secret', role=self.role)
+        self.client.force_login(other)
+        self.client.post(url, data)
+
+        documents = Document.objects.filter(idempotency_key='shared-1')
+        self.assertQuerySetEqual(documents.order_by('pk').values_list('posted_by', flat=True), [self.user.pk, other.pk])
+        self.assertEqual(Inventory.objects.get(product=self.product).quantity, 8)
+
+    def test_key_is_scoped_by_document_type(self):
+        items = [{'product': self.product, 'quantity': 2, 'price': Decimal('1.00')}]
+        receipt = post_document(INCOMING, self.warehouse, items, idempotency_key='svc-2', user=self.user)
+        sale = post_document(OUTGOING, self.warehouse, items, idempotency_key='svc-2', user=self.user)
+        self.assertNotEqual(receipt.pk, sale.pk)
+        self.assertEqual(Inventory.objects.get(product=self.product).quantity, 0)
+
+    def test_overlong_key_is_rejected(self):
+        response = self.client.post(
+            reverse('incoming_transaction_create'), self.line_data([]), headers={'Idempotency-Key': 'x' * 65}
+        )
+        self.assertEqual(response.status_code, 400)
+
+
+class AuditLogTests(InventoryTestCase):
+    def setUp(self):
+        super().setUp()
+        # Свой буфер без фонового потока: записи пишутся только явным flush.
+        self.audit_log = AuditLog()
+        for patcher in (
+            mock.patch('inventory.services.audit_log', self.audit_log),
+            mock.patch.object(AuditLog, '_run', lambda log: None),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def post(self, quantity=2):
+        items = [{'product': self.product, 'quantity': quantity, 'price': Decimal('1.00')}]
+        return post_document(INCOMING, self.warehouse, items, user=self.user)
+
+    def test_records_are_buffered_after_commit_and_written_by_flush(self):
+        with self.captureOnCommitCallbacks() as callbacks:
+            document = self.post()
+        self.assertEqual(self.audit_log.flush(direct=True), 0)
+        for callback in callbacks:
+            callback()
+
+        self.assertFalse(StockAuditRecord.objects.exists())
+        self.assertEqual(self.audit_log.flush(direct=True), 1)
+        record = StockAuditRecord.objects.get()
+        self.assertEqual(
+            (record.user, record.document, record.product, record.quantity_delta, record.quantity),
+            (self.user, document, self.product, 2, 2),
+        )
+        self.assertEqual(self.audit_log.flush(direct=True), 0)
+
+    def test_rolled_back_posting_leaves_no_records(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            with self.assertRaises(RuntimeError), db_transaction.atomic():
+                self.post()
+                raise RuntimeError
+            self.post(quantity=3)
+        self.assertEqual(self.audit_log.flush(), 1)
+        self.assertEqual(list(StockAuditRecord.objects.values_list('quantity_delta', flat=True)), [3])
+
+    def test_failed_flush_keeps_records_for_next_flush(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.post()
+            self.post()
+        with mock.patch.object(StockAuditRecord.objects, 'bulk_create', side_effect=OSError), \
+                self.assertLogs('inventory.audit', 'ERROR'):
+            self.assertEqual(self.audit_log.flush(direct=True), 0)
+        self.assertEqual(self.audit_log.flush(direct=True), 2)
+        self.assertEqual(StockAuditRecord.objects.count(), 2)
+
+
+class RecordingSink:
+    """Приемник, запоминающий пачки и глубину транзакций в момент отправки."""
+
+    def __init__(self, fail=False):
+        self.fail = fail
+        self.batches = []
+        self.atomic_depths = []
+
+    def send(self, events):
+        self.atomic_depths.append(len(connection.atomic_blocks))
+        if self.fail:
+            raise OSError('приемник недоступен')
+        self.batches.append([event['id'] for event in events])
+
+
+class StockEventDispatchTests(InventoryTestCase):
+    def setUp(self):
+        super().setUp()
+        items = [{'product': self.product, 'quantity': 3, 'price': Decimal('1.00')}]
+        post_document(INCOMING, self.warehouse, items)
+        post_document(INCOMING, self.warehouse, items)
+        # Транзакции самого TestCase; отправка не должна добавлять к ним свою.
+        self.test_depth = len(connection.atomic_blocks)
+
+    def test_batch_is_sent_in_id_order_outside_transaction(self):
+        sink = RecordingSink()
+        self.assertEqual(dispatch_batch(sink, batch_size=1), 1)
+        self.assertEqual(dispatch_batch(sink), 1)
+        self.assertEqual(dispatch_batch(sink), 0)
+
+        ids = list(StockEvent.objects.order_by('pk').values_list('pk', flat=True))
+        self.assertEqual(sink.batches, [ids[:1], ids[1:]])
+        self.assertEqual(sink.atomic_depths, [self.test_depth, self.test_depth])
+        self.assertFalse(StockEvent.objects.filter(dispatched_at__isnull=True).exists())
+
+    def test_failed_send_releases_claim(self):
+        with self.assertRaises(OSError):
+            dispatch_batch(RecordingSink(fail=True))
+        self.assertFalse(StockEvent.objects.exclude(claimed_until=None).exists())
+        self.assertEqual(StockEvent.objects.filter(dispatched_at__isnull=True).count(), 2)
+
+        sink = RecordingSink()
+        self.assertEqual(dispatch_batch(sink), 2)
+
+    def test_claimed_batch_is_skipped_until_claim_expires(self):
+        StockEvent.objects.update(claimed_until=timezone.now() + timedelta(minutes=1))
+        self.assertEqual(dispatch_batch(RecordingSink()), 0)
+        StockEvent.objects.update(claimed_until=timezone.now() - timedelta(seconds=1))
+        self.assertEqual(dispatch_batch(RecordingSink()), 2)
+
+    def test_feed_stops_at_committed_watermark(self):
+        last = StockEvent.objects.latest('pk').pk
+        self.assertEqual(committed_watermark(), last)
+        response = self.client.get(reverse('stock_changes'), {'since': 0, 'limit': 1})
+        first = response.json()
+        self.assertEqual(len(first['events']), 1)
+        response = self.client.get(reverse('stock_changes'), {'since': first['next']})
+        self.assertEqual([event['id'] for event in response.json()['events']], [last])
+
+
+class ImmediatePool:
+    """Пул выгрузки, сразу возвращающий готовый PDF-заглушку."""
+
+    def submit(self, function, *args):
+        future = Future()
+        future.set_result(b'%PDF-1.4 test')
+        return future
+
+
+class InlineExecutor:
+    """Пул процессов, выполняющий задачу сразу в текущем процессе (и в транзакции теста)."""
+
+    def __init__(self, *args, **kwargs):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        pass
+
+    def submit(self, function, *args):
+        future = Future()
+        future.set_result(function(*args))
+        return future
+
+
+class MergeDiffTests(SimpleTestCase):
+    def diff(self, ledger, stored):
+        return list(merge_diff(ledger, stored))
+
+    def test_matching_streams_have_no_diff(self):
+        self.assertEqual(self.diff([(1, 1, 5), (1, 2, 3)], [(1, 1, 5, 10), (1, 2, 3, 11)]), [])
+
+    def test_pair_only_in_ledger(self):
+        self.assertEqual(self.diff([(1, 1, 5), (2, 1, 4)], [(2, 1, 4, 11)]), [(1, 1, None, 5, None)])
+        self.assertEqual(self.diff([(1, 1, 4), (2, 1, 5)], [(1, 1, 4, 10)]), [(2, 1, None, 5, None)])
+
+    def test_pair_only_in_stored_stock(self):
+        self.assertEqual(self.diff([(2, 1, 4)], [(1, 1, 3, 10), (2, 1, 4, 11)]), [(1, 1, 3, 0, 10)])
+        self.assertEqual(self.diff([], [(1, 1, 3, 10)]), [(1, 1, 3, 0, 10)])
+
+    def test_zero_rows_without_counterpart_are_not_diffs(self):
+        self.assertEqual(self.diff([(1, 1, 0)], [(1, 2, 0, 10)]), [])
+
+    def test_differing_quantities_and_key_order(self):
+        # Ключ сравнивается как (товар, склад): склад 2 товара 1 идет раньше склада 1 товара 2.
+        self.assertEqual(
+            self.diff([(1, 2, 5), (2, 1, 0)], [(1, 2, 6, 10), (2, 1, 2, 11)]),
+            [(1, 2, 6, 5, 10), (2, 1, 2, 0, 11)],
+        )
+
+
+class StockVerificationTests(InventoryTestCase):
+    def setUp(self):
+        super().setUp()
+        post_document(INCOMING, self.warehouse, [
+            {'product': self.product, 'quantity': 5, 'price': Decimal('1.00')},
+            {'product': self.other_product, 'quantity': 3, 'price': Decimal('1.00')},
+        ])
+
+    def corrupt(self):
+        Inventory.objects.filter(product=self.product).update(quantity=7)
+        Inventory.objects.filter(product=self.other_product).delete()
+
+    def test_ranges_cover_ids_at_size_boundary(self):
+        first, last = sorted((self.product.pk, self.other_product.pk))
+        self.assertEqual(product_ranges(last - first), [(first, last), (last, 2 * last - first)])
+        self.assertEqual(product_ranges(last - first + 1), [(first, last + 1)])
+
+    def test_fixes_are_applied_in_batches_at_boundary(self):
+        third = Warehouse.objects.create(name='Третий')
+        post_document(INCOMING, third, [{'product': self.product, 'quantity': 2, 'price': Decimal('1.00')}])
+        Inventory.objects.update(quantity=1)
+        diffs = check_range((0, max(self.product.pk, self.other_product.pk) + 1))
+        self.assertEqual(len(diffs), 3)
+        for batch_size in (1, 2, 3):
+            Inventory.objects.update(quantity=1)
+            # По UPDATE на пачку плюс точка сохранения и ее освобождение.
+            with self.assertNumQueries(-(-3 // batch_size) + 2):
+                self.assertEqual(apply_fixes(diffs, batch_size=batch_size), 3)
+            self.assertEqual(check_range((0, max(self.product.pk, self.other_product.pk) + 1)), [])
+
+    def verify(self, *args):
+        """Строки CSV и сводка команды verify_stock."""
+        stderr = StringIO()
+        with tempfile.TemporaryDirectory() as directory, \
+                mock.patch('inventory.management.commands.verify_stock.ProcessPoolExecutor', InlineExecutor):
+            output = Path(directory) / 'diffs.csv'
+            call_command('verify_stock', '--output', output, *args, stderr=stderr)
+            with open(output, newline='', encoding='utf-8') as file:
+                rows = list(csv.DictReader(file))
+        return rows, stderr.getvalue()
+
+    def test_detect_fix_and_verify_clean(self):
+        self.corrupt()
+        rows, summary = self.verify()
+        self.assertEqual(
+            sorted((int(row['product_id']), row['stored'], row['ledger'], row['delta']) for row in rows),
+            sorted([(self.product.pk, '7', '5', '-2'), (self.other_product.pk, '', '3', '3')]),
+        )
+        self.assertIn('расхождений: 2', summary)
+
+        rows, summary = self.verify('--fix')
+        self.assertIn('исправлено: 2', summary)
+        self.assertEqual(
+            dict(Inventory.objects.values_list('product_id', 'quantity')),
+            {self.product.pk: 5, self.other_product.pk: 3},
+        )
+
+        rows, summary = self.verify()
+        self.assertEqual(rows, [])
+        self.assertIn('расхождений: 0', summary)
+
+
+class DocumentExportTests(InventoryTestCase):
+    url = reverse('document_export')
+
+    def post_receipts(self, count):
+        items = [{'product': self.product, 'quantity': 1, 'price': Decimal('1.00')}]
+        return [post_document(INCOMING, self.warehouse, items).pk for _ in range(count)]
+
+    def test_zip_is_streamed_document_by_document(self):
+        ids = self.post_receipts(2)
+        with mock.patch('inventory.views.get_pool', return_value=ImmediatePool()):
+            response = self.client.get(self.url, {'ids': ','.join(map(str, ids))})
+        chunks = self.read_stream(response)
+        # Первый кусок — архивная запись первого документа, до рендера второго.
+        self.assertIn(f'document_{ids[0]}.pdf'.encode(), chunks[0])
+        self.assertNotIn(f'document_{ids[1]}.pdf'.encode(), chunks[0])
+        with zipfile.ZipFile(BytesIO(b''.join(chunks))) as archive:
+            self.assertEqual(archive.namelist(), [f'document_{pk}.pdf' for pk in ids])
+
+    async def test_zip_is_streamed_under_asgi(self):
+        await self.async_client.aforce_login(self.user)
+        ids = await sync_to_async(self.post_receipts)(2)
+        with mock.patch('inventory.views.get_pool', return_value=ImmediatePool()):
+            response = await self.async_client.get(self.url, {'ids': ','.join(map(str, ids))})
+        with zipfile.ZipFile(BytesIO(b''.join(await self.aread_stream(response)))) as archive:
+            self.assertEqual(len(archive.namelist()), 2)
+
+    def test_merged_pdf_is_bounded(self):
+        items = [{'product': self.product, 'quantity': 1, 'price': Decimal('1.00')}]
+        ids = [post_document(INCOMING, self.warehouse, items).pk for _ in range(2)]
+        with mock.patch('inventory.views.MAX_MERGED_DOCUMENTS', 1):
+            response = self.client.get(self.url, {'ids': ','.join(map(str, ids)), 'format': 'pdf'})
+        self.assertEqual(response.status_code, 400)
+        self.assertContains(response, 'ZIP', status_code=400)
+
+
+class DocumentAdminTests(InventoryTestCase):
+    def setUp(self):
+        super().setUp()
+        self.admin = Staff.objects.create_superuser('admin', password='secret', role=self.role)
+        self.client.force_login(self.admin)
+
+    def change_page_queries(self, lines):
+        document = Document.objects.create(document_type=INCOMING, date=timezone.localdate())
+        Transaction.objects.bulk_create([
+            Transaction(document=document, product=self.product, quantity=1, price=Decimal('1'), warehouse=self.warehouse)
+            for _ in range(lines)
+        ])
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('admin:inventory_document_change', args=[document.pk]))
+        self.assertContains(response, f'<option value="{self.product.pk}" selected>{self.product}</option>', count=lines)
+        return len(queries)
+
+    def change_data(self, document, lines):
+        """POST-данные страницы изменения документа; lines — словари полей строк (с id для существующих)."""
+        data = {
+            'date': document.date.isoformat(),
+            'transactions-TOTAL_FORMS': len(lines),
+            'transactions-INITIAL_FORMS': sum(1 for line in lines if 'id' in line),
+        }
+        for index, line in enumerate(lines):
+            data[f'transactions-{index}-document'] = document.pk
+            for field, value in line.items():
+                data[f'transactions-{index}-{field}'] = getattr(value, 'pk', value)
+        return data
+
+    def posted_receipt(self):
+        document = post_document(INCOMING, self.warehouse, [
+            {'product': self.product, 'quantity': 4, 'price': Decimal('1.00')},
+        ])
+        line = document.transactions.get()
+        return document, {
+            'id': line.pk, 'product': self.product, 'quantity': 4, 'price': '1.00', 'warehouse': self.warehouse,
+        }
+
+    def test_price_edit_recomputes_totals_without_moving_stock(self):
+        document, line = self.posted_receipt()
+        events = StockEvent.objects.count()
+        response = self.client.post(
+            reverse('admin:inventory_document_change', args=[document.pk]),
+            self.change_data(document, [{**line, 'price': '2.50'}]),
+        )
+        self.assertRedirects(response, reverse('admin:inventory_document_changelist'), fetch_redirect_response=False)
+        document.refresh_from_db()
+        self.assertEqual((document.total_amount, document.total_quantity), (Decimal('10.00'), 4))
+        self.assertEqual(Inventory.objects.get(product=self.product).quantity, 4)
+        self.assertEqual(StockEvent.objects.count(), events)
+
+    def test_stock_line_edits_are_rejected(self):
+        document, line = self.posted_receipt()
+        url = reverse('admin:inventory_document_change', args=[document.pk])
+        new_line = {'product': self.other_product, 'quantity': 1, 'price': '1.00', 'warehouse': self.warehouse}
+        for lines in (
+            [{**line, 'quantity': 9}],
+            [{**line, 'product': self.other_product}],
+            [{**line, 'warehouse': Warehouse.objects.create(name='Запасной')}],
+            [{**line, 'DELETE': 'on'}],
+            [line, new_line],
+        ):
+            response = self.client.post(url, self.change_data(document, lines))
+            self.assertContains(response, 'меняются только проведением документа')
+        self.assertQuerySetEqual(
+            document.transactions.values_list('product', 'quantity', 'warehouse'),
+            [(self.product.pk, 4, self.warehouse.pk)],
+        )
+        document.refresh_from_db()
+        self.assertEqual((document.line_count, document.total_quantity), (1, 4))
+
+    def test_document_type_is_read_only_after_creation(self):
+        document, line = self.posted_receipt()
+        self.client.post(
+            reverse('admin:inventory_document_change', args=[document.pk]),
+            {**self.change_data(document, [line]), 'document_type': OUTGOING},
+        )
+        document.refresh_from_db()
+        self.assertEqual(document.document_type, INCOMING)
+
+    def test_delete_subtracts_document_from_counterparty_activity(self):
+        customer = Customer.objects.create(name='Магазин')
+        Inventory.objects.create(product=self.product, warehouse=self.warehouse, quantity=10)
+        items = [{'product': self.product, 'quantity': 2, 'price': Decimal('1.00'), 'customer': customer}]
+        kept = post_document(OUTGOING, self.warehouse, items)
+        deleted = post_document(OUTGOING, self.warehouse, items)
+        self.client.post(reverse('admin:inventory_document_delete', args=[deleted.pk]), {'post': 'yes'})
+        self.assertEqual(
+            list(CustomerActivity.objects.values_list('period', 'quantity', 'line_count')),
+            [(kept.date.replace(day=1), 2, 1)],
+        )
+
+    def test_tracked_lot_lines_are_not_edited_in_admin(self):
+        self.product.tracks_lots = True
+        self.product.save()
+        items = [{
+            'product': self.product, 'quantity': 4, 'price': Decimal('1.00'),
+            'lot_number': 'L-1', 'expiry_date': date(2030, 1, 1),
+        }]
+        document = post_document(INCOMING, self.warehouse, items)
+        line = document.transactions.get()
+        response = self.client.post(reverse('admin:inventory_document_change', args=[document.pk]), {
+            'document_type': document.document_type,
+            'date': document.date.isoformat(),
+            'transactions-TOTAL_FORMS': 1,
+            'transactions-INITIAL_FORMS': 1,
+            'transactions-0-id': line.pk,
+            'transactions-0-document': document.pk,
+            'transactions-0-product': self.product.pk,
+            'transactions-0-quantity': 4,
+            'transactions-0-price': '1.00',
+            'transactions-0-warehouse': self.warehouse.pk,
+            'transactions-0-DELETE': 'on',
+        })
+        self.assertContains(response, 'меняются только проведением документа')
+        self.assertTrue(Transaction.objects.filter(pk=line.pk).exists())
+
+    def test_change_page_query_count_does_not_grow_with_lines(self):
+        # Первый запрос заполняет кеши сессии, пользователя и типов содержимого.
+        self.change_page_queries(1)
+        self.assertEqual(self.change_page_queries(50), self.change_page_queries(2))
+
+
+class RepairDocumentTotalsTests(InventoryTestCase):
+    def test_corrupted_totals_are_restored(self):
+        items = [
+            {'product': self.product, 'quantity': 2, 'price': Decimal('1.50')},
+            {'product': self.other_product, 'quantity': 3, 'price': Decimal('2.00')},
+        ]
+        broken, intact = (post_document(INCOMING, self.warehouse, items) for _ in range(2))
+        Document.objects.filter(pk=broken.pk).update(total_amount=0, line_count=7, total_quantity=-1)
+        # Документ без строк: итоги — нули, а не NULL подзапроса.
+        empty = Document.objects.create(document_type=INCOMING, date=timezone.localdate(), line_count=3)
+
+        stdout = StringIO()
+        call_command('repair_document_totals', '--dry-run', stdout=stdout)
+        self.assertIn('Найдено документов с неверными итогами: 2', stdout.getvalue())
+        self.assertEqual(Document.objects.get(pk=broken.pk).line_count, 7)
+
+        stdout = StringIO()
+        call_command('repair_document_totals', '--batch-size', 1, stdout=stdout)
+        self.assertIn('Исправлено документов с неверными итогами: 2', stdout.getvalue())
+        self.assertEqual(
+            dict(Document.objects.values_list('pk', 'total_amount')),
+            {broken.pk: Decimal('9.00'), intact.pk: Decimal('9.00'), empty.pk: Decimal('0.00')},
+        )
+        self.assertEqual(
+            list(Document.objects.order_by('pk').values_list('line_count', 'total_quantity')),
+            [(2, 5), (2, 5), (0, 0)],
+        )
+
+
+class CounterpartyActivityTests(InventoryTestCase):
+    def activity(self, model):
+        return list(model.objects.order_by('period').values_list('period', 'product_id', 'quantity', 'line_count'))
+
+    def test_form_posting_records_supplier_and_customer(self):
+        supplier = Supplier.objects.create(name='Завод')
+        customer = Customer.objects.create(name='Магазин')
+        line = [{'product': self.product, 'quantity': 5, 'price': '2'}]
+        self.client.post(reverse('incoming_transaction_create'), self.line_data(line, supplier=supplier.pk))
+        line[0]['quantity'] = 2
+        self.client.post(reverse('outgoing_transaction_create'), self.line_data(line, customer=customer.pk))
+
+        period = timezone.localdate().replace(day=1)
+        self.assertEqual(self.activity(SupplierActivity), [(period, self.product.pk, 5, 1)])
+        self.assertEqual(self.activity(CustomerActivity), [(period, self.product.pk, 2, 1)])
+        self.assertEqual(Transaction.objects.filter(supplier=supplier).count(), 1)
+
+    def test_document_change_applies_only_its_delta(self):
+        supplier = Supplier.objects.create(name='Завод')
+        items = [{'product': self.product, 'quantity': 3, 'price': Decimal('1.00'), 'supplier': supplier}]
+        january = post_document(INCOMING, self.warehouse, items, date=date(2024, 1, 10))
+        post_document(INCOMING, self.warehouse, items, date=date(2024, 1, 20))
+
+        # Документ переносится на февраль, а его строка меняет количество.
+        documents = Document.objects.filter(pk=january.pk)
+        before = counterparty_activity(documents)
+        documents.update(date=date(2024, 2, 1))
+        Transaction.objects.filter(document=january).update(quantity=4)
+        apply_counterparty_activity(before, counterparty_activity(documents))
+        self.assertEqual(self.activity(SupplierActivity), [
+            (date(2024, 1, 1), self.product.pk, 3, 1),
+            (date(2024, 2, 1), self.product.pk, 4, 1),
+        ])
+
+        apply_counterparty_activity(counterparty_activity(documents))
+        self.assertEqual(self.activity(SupplierActivity), [(date(2024, 1, 1), self.product.pk, 3, 1)])
+
+
+class LotTests(InventoryTestCase):
+    def setUp(self):
+        super().setUp()
+        self.product.tracks_lots = True
+        self.product.save()
+
+    def receive(self, lot_number, expiry_date, quantity):
+        return post_document(INCOMING, self.warehouse, [{
+            'product': self.product, 'quantity': quantity, 'price': Decimal('1.00'),
+            'lot_number': lot_number, 'expiry_date': expiry_date,
+        }], date=date(2025, 1, 1))
+
+    def lot_quantities(self):
+        return dict(Lot.objects.values_list('lot_number', 'quantity'))
+
+    def test_incoming_form_renders_and_posts_lot_fields(self):
+        url = reverse('incoming_transaction_create')
+        self.assertContains(self.client.get(url), 'name="products-0-lot_number"')
+        self.client.post(url, self.line_data([{
+            'product': self.product, 'quantity': 3, 'price': '1', 'lot_number': 'L-7', 'expiry_date': '2030-05-01',
+        }]))
+        self.assertEqual(self.lot_quantities(), {'L-7': 3})
+
+    def test_receipt_without_lot_is_rejected(self):
+        with self.assertRaises(ValidationError):
+            post_document(INCOMING, self.warehouse, [{'product': self.product, 'quantity': 1, 'price': Decimal('1')}])
+        self.assertFalse(Document.objects.exists())
+
+    def test_outgoing_takes_earliest_unexpired_lots_first(self):
+        self.receive('EXPIRED', date(2024, 12, 31), 5)
+        self.receive('LATE', date(2025, 9, 1), 5)
+        self.receive('SOON', date(2025, 3, 1), 5)
+
+        sale = post_document(
+            OUTGOING, self.warehouse, [{'product': self.product, 'quantity': 7, 'price': Decimal('2')}],
+            date=date(2025, 1, 2),
+        )
+        self.assertEqual(self.lot_quantities(), {'EXPIRED': 5, 'SOON': 0, 'LATE': 3})
+        self.assertEqual(
+            sorted(LotAllocation.objects.filter(transaction__document=sale).values_list('lot__lot_number', 'quantity')),
+            [('LATE', 2), ('SOON', 5)],
+        )
+
+    def test_outgoing_fails_when_only_expired_lots_remain(self):
+        self.receive('EXPIRED', date(2024, 12, 31), 5)
+        with self.assertRaises(ValidationError):
+            post_document(
+                OUTGOING, self.warehouse, [{'product': self.product, 'quantity': 1, 'price': Decimal('2')}],
+                date=date(2025, 1, 2),
+            )
+        self.assertEqual(self.lot_quantities(), {'EXPIRED': 5})
+        self.assertEqual(Inventory.objects.get(product=self.product).quantity, 5)
+
+
+class PickingRouteTests(InventoryTestCase):
+    def setUp(self):
+        super().setUp()
+        bins = {
+            code: BinLocation.objects.create(
+                warehouse=self.warehouse, code=code, zone='A', aisle=int(code[2]), shelf=int(code[4]),
+            )
+            for code in ('A-1-1', 'A-1-5', 'A-2-2', 'A-2-8', 'A-3-1', 'A-4-1', 'A-4-3')
+        }
+        self.washer = Product.objects.create(product_name='Шайба', serial_number='SN-3')
+        self.screw = Product.objects.create(product_name='Винт', serial_number='SN-4')
+        self.nail = Product.objects.create(product_name='Гвоздь', serial_number='SN-5')
+        unrelated = Product.objects.create(product_name='Скоба', serial_number='SN-6')
+        BinStock.objects.bulk_create([
+            BinStock(bin=bins[code], product=product, quantity=quantity)
+            for code, product, quantity in [
+                ('A-1-5', self.product, 10),
+                ('A-2-2', self.other_product, 6),
+                ('A-4-3', self.other_product, 5),
+                ('A-2-8', self.washer, 9),
+                ('A-1-1', self.screw, 4),
+                ('A-4-1', self.screw, 3),
+                ('A-3-1', unrelated, 50),
+            ]
+        ])
+        self.first = self.outgoing([(self.product, 3), (self.other_product, 7), (self.screw, 2)])
+        self.second = self.outgoing([(self.washer, 1), (self.screw, 3), (self.nail, 2)])
+
+    def outgoing(self, lines):
+        document = Document.objects.create(document_type=OUTGOING, date=date(2025, 1, 1))
+        Transaction.objects.bulk_create([
+            Transaction(document=document, product=product, quantity=quantity, price=Decimal('1'), warehouse=self.warehouse)
+            for product, quantity in lines
+        ])
+        return document.pk
+
+    def test_route_is_s_shaped_and_shortages_go_last(self):
+        with self.assertNumQueries(3):
+            plan = plan_wave([self.first, self.second])
+        stops = plan[self.warehouse.pk]
+        # Проход 3 без товаров волны пропущен, поэтому обратно идет только проход 2.
+        self.assertEqual(
+            [stop['bin'] and stop['bin']['code'] for stop in stops],
+            ['A-1-1', 'A-1-5', 'A-2-8', 'A-2-2', 'A-4-1', 'A-4-3', None],
+        )
+        self.assertEqual(stops[0]['documents'], [(self.first, 2), (self.second, 2)])
+        self.assertEqual(stops[4]['documents'], [(self.second, 1)])
+        self.assertEqual((stops[-1]['product']['id'], stops[-1]['quantity']), (self.nail.pk, 2))
+
+    def test_pick_list_page(self):
+        response = self.client.get(reverse('pick_list'), {'ids': f'{self.first},{self.second}'})
+        self.assertContains(response, 'A-2-8')
+        self.assertEqual(self.client.get(reverse('pick_list')).status_code, 400)
+
+
+class CatalogSyncTests(InventoryTestCase):
+    def setUp(self):
+        super().setUp()
+        self.start = timezone.now()
+        Product.objects.update(updated_at=self.start - timedelta(hours=1))
+
+    def sync(self, token, seconds):
+        """Строки ответа синхронизации и новый токен; часы — start + seconds."""
+        clock = mock.Mock(now=lambda: self.start + timedelta(seconds=seconds))
+        with mock.patch('inventory.catalog_sync.timezone', clock):
+            lines = [json.loads(line) for line in b''.join(catalog_changes(parse_token(token))).decode().splitlines()]
+        return lines[:-1], lines[-1]['token']
+
+    def test_token_round_trip_and_errors(self):
+        self.assertIsNone(parse_token(''))
+        self.assertEqual(parse_token(make_token(self.start)), self.start)
+        for token in ('abc', '9' * 30):
+            with self.assertRaises(ValueError):
+                parse_token(token)
+        self.assertEqual(self.client.get(reverse('catalog_sync'), {'token': 'abc'}).status_code, 400)
+
+    def test_view_streams_json_lines(self):
+        chunks = self.read_stream(self.client.get(reverse('catalog_sync')))
+        lines = [json.loads(line) for line in b''.join(chunks).decode().splitlines()]
+        self.assertEqual([line['id'] for line in lines[:-1]], [self.product.pk, self.other_product.pk])
+        self.assertIn('token', lines[-1])
+
+    def test_view_streams_gzip(self):
+        response = self.client.get(reverse('catalog_sync'), headers={'Accept-Encoding': 'gzip'})
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        lines = gzip.decompress(b''.join(self.read_stream(response))).decode().splitlines()
+        self.assertEqual(len(lines), 3)
+
+    async def test_view_streams_under_asgi(self):
+        await self.async_client.aforce_login(self.user)
+        response = await self.async_client.get(reverse('catalog_sync'))
+        lines = b''.join(await self.aread_stream(response)).decode().splitlines()
+        self.assertEqual(len(lines), 3)
+
+    def test_incremental_sync_returns_changes_after_token(self):
+        lines, token = self.sync(None, 0)
+        self.assertEqual([line['id'] for line in lines], [self.product.pk, self.other_product.pk])
+        self.assertEqual(parse_token(token), self.start - timedelta(seconds=5))
+
+        Product.objects.filter(pk=self.product.pk).update(product_name='Болт М8', updated_at=self.start + timedelta(seconds=1))
+        deleted_id = self.other_product.pk
+        self.other_product.delete()
+        ProductTombstone.objects.update(deleted_at=self.start + timedelta(seconds=2))
+        fresh = Product.objects.create(product_name='Шуруп', serial_number='SN-9')
+        Product.objects.filter(pk=fresh.pk).update(updated_at=self.start + timedelta(seconds=9))
+
+        # Изменение моложе SETTLE_DELAY откладывается до следующей синхронизации.
+        lines, token = self.sync(token, 10)
+        self.assertEqual(lines, [
+            {'id': self.product.pk, 'product_name': 'Болт М8', 'serial_number': 'SN-1', 'minimum_stock_level': 10},
+            {'id': deleted_id, 'deleted': True},
+        ])
+        self.assertEqual(self.sync(token, 10), ([], token))
+
+        lines, token = self.sync(token, 20)
+        self.assertEqual([line['id'] for line in lines], [fresh.pk])
+
+
+class StockApiPaginationTests(InventoryTestCase):
+    url = reverse('stock_api')
+
+    def setUp(self):
+        super().setUp()
+        second = Warehouse.objects.create(name='Запасной')
+        products = [self.product, self.other_product] + [
+            Product.objects.create(product_name=f'Товар {number}', serial_number=f'SN-X{number}') for number in range(3)
+        ]
+        self.rows = Inventory.objects.bulk_create([
+            Inventory(product=product, warehouse=warehouse, quantity=number)
+            for number, (product, warehouse) in enumerate(
+                (product, warehouse) for product in products for warehouse in (self.warehouse, second)
+            )
+        ])
+
+    def walk(self, limit, change=None, **params):
+        """id всех строк, пройденных по курсору; change вызывается после первой страницы."""
+        ids, cursor = [], None
+        while True:
+            query = {'limit': limit, **params, **({'cursor': cursor} if cursor else {})}
+            body = self.client.get(self.url, query).json()
+            ids += [row['id'] for row in body['results']]
+            if change and cursor is None:
+                change()
+            cursor = body['next']
+            if cursor is None:
+                return ids
+
+    def test_pages_cover_all_rows_once_in_id_order(self):
+        ids = sorted(row.pk for row in self.rows)
+        self.assertEqual(self.walk(3), ids)
+        # Ровно кратное limit число строк не дает пустой последней страницы.
+        self.assertEqual(self.walk(5), ids)
+
+    def test_changes_behind_cursor_do_not_shift_pages(self):
+        ids = sorted(row.pk for row in self.rows)
+
+        def change():
+            Inventory.objects.filter(pk=ids[0]).delete()
+            Inventory.objects.create(product=self.product, warehouse=Warehouse.objects.create(name='Новый'), quantity=1)
+
+        walked = self.walk(3, change)
+        self.assertEqual(walked[:len(ids)], ids)
+        self.assertEqual(len(walked), len(ids) + 1)
+
+    def test_fields_and_filters(self):
+        body = self.client.get(self.url, {
+            'fields': 'serial_number,quantity', 'warehouse': self.warehouse.pk, 'product': self.other_product.pk,
+        }).json()
+        self.assertEqual(body, {'results': [{'serial_number': 'SN-2', 'quantity': 2}], 'next': None})
+        self.assertEqual(self.client.get(self.url, {'fields': 'price'}).status_code, 400)
+        self.assertEqual(self.client.get(self.url, {'limit': 0}).status_code, 400)
+        self.assertEqual(self.client.get(self.url, {'cursor': 'x'}).status_code, 400)
+
+    def test_only_managers_have_access(self):
+        storekeeper = Staff.objects.create_user(
+            'storekeeper', password='secret', role=Role.objects.create(role_name='Кладовщик')
+        )
+        without_role = Staff.objects.create_user('newcomer', password='secret')
+        for user in (storekeeper, without_role):
+            self.client.force_login(user)
+            response = self.client.get(self.url)
+            self.assertEqual(response.status_code, 302)
+            self.assertTrue(response.url.startswith(reverse('login')))
+
+    def test_jsonl_is_streamed(self):
+        chunks = self.read_stream(self.client.get(self.url, {'format': 'jsonl', 'fields': 'id'}))
+        rows = [json.loads(line) for line in b''.join(chunks).decode().splitlines()]
+        self.assertEqual(rows, [{'id': row.pk} for row in sorted(self.rows, key=lambda row: row.pk)])
+
+    async def test_jsonl_is_streamed_under_asgi(self):
+        await self.async_client.aforce_login(self.user)
+        response = await self.async_client.get(self.url, {'format': 'jsonl', 'fields': 'id'})
+        lines = b''.join(await self.aread_stream(response)).decode().splitlines()
+        self.assertEqual(len(lines), len(self.rows))
+
+
+class CachedUserTests(InventoryTestCase):
+    def test_user_is_loaded_with_role_once(self):
+        backend = CachedModelBackend()
+        with self.assertNumQueries(1):
+            user = backend.get_user(self.user.pk)
+            self.assertEqual(user.role.role_name, 'Менеджер')
+        with self.assertNumQueries(0):
+            self.assertEqual(backend.get_user(self.user.pk).role.role_name, 'Менеджер')
+
+    def test_user_change_evicts_cache_after_commit(self):
+        CachedModelBackend().get_user(self.user.pk)
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            self.user.first_name = 'Иван'
+            self.user.save()
+            self.assertIsNotNone(cache.get(user_cache_key(self.user.pk)))
+        self.assertEqual(len(callbacks), 1)
+        self.assertIsNone(cache.get(user_cache_key(self.user.pk)))
+
+    def test_role_delete_evicts_its_users_after_commit(self):
+        role = Role.objects.create(role_name='Кладовщик')
+        storekeeper = Staff.objects.create_user('storekeeper', password='secret', role=role)
+        CachedModelBackend().get_user(storekeeper.pk)
+        with self.captureOnCommitCallbacks(execute=True):
+            role.delete()
+            self.assertIsNotNone(cache.get(user_cache_key(storekeeper.pk)))
+        self.assertIsNone(cache.get(user_cache_key(storekeeper.pk)))
+        self.assertIsNone(CachedModelBackend().get_user(storekeeper.pk).role)
+
+
+class AuthBackendTransitionTests(InventoryTestCase):
+    def test_session_of_previous_backend_stays_logged_in(self):
+        self.client.force_login(self.user, backend='django.contrib.auth.backends.ModelBackend')
+        self.assertEqual(self.client.get(reverse('document_list')).status_code, 200)
+
+    def test_login_uses_cached_backend(self):
+        self.client.logout()
+        self.assertTrue(self.client.login(username='manager', password='secret'))
+        self.assertEqual(self.client.session[BACKEND_SESSION_KEY], 'inventory.auth_backends.CachedModelBackend')
+
+
+class DocumentListTests(InventoryTestCase):
+    def test_rows_link_to_document_detail(self):
+        document = post_document(INCOMING, self.warehouse, [{'product': self.product, 'quantity': 1, 'price': Decimal('1')}])
+        response = self.client.get(reverse('document_list'), {'sort': 'amount'})
+        self.assertContains(response, f'href="{reverse("document_detail", args=[document.pk])}"')
+
+
+class AsyncViewTests(InventoryTestCase):
+    """Асинхронные представления чтения через ASGI-клиент."""
+
+    async def asetup(self):
+        await self.async_client.aforce_login(self.user)
+
+    async def test_document_detail(self):
+        await self.asetup()
+        items = [{'product': self.product, 'quantity': 2, 'price': Decimal('1.00')}]
+        document = await sync_to_async(post_document)(INCOMING, self.warehouse, items, user=self.user)
+        response = await self.async_client.get(reverse('document_detail', args=[document.pk]))
+        self.assertContains(response, 'Болт')
+        response = await self.async_client.get(reverse('document_detail', args=[document.pk + 1]))
+        self.assertEqual(response.status_code, 404)
+
+    async def test_product_lookup(self):
+        await self.asetup()
+        response = await self.async_client.get(reverse('product_lookup'), {'q': 'SN-2'})
+        self.assertEqual([row['id'] for row in response.json()['results']], [self.other_product.pk])
+        response = await self.async_client.get(reverse('product_lookup'), {'q': 'Гай'})
+        self.assertEqual([row['id'] for row in response.json()['results']], [self.other_product.pk])
+        response = await self.async_client.get(reverse('product_lookup'), {'q': ' '})
+        self.assertEqual(response.json(), {'results': []})
+
+    async def test_login_required(self):
+        response = await self.async_client.get(reverse('product_lookup'), {'q': 'SN-2'})
+        self.assertEqual(response.status_code, 302)
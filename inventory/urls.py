@@ -2,15 +2,22 @@
 from django.urls import path
 from .views import (
     stock_list, document_list, document_detail, 
-    incoming_form_view, outgoing_form_view, StorekeeperDashboardView, document_pdf_view
+    incoming_form_view, outgoing_form_view, StorekeeperDashboardView, document_pdf_view,
+    product_lookup, stock_changes, document_export, pick_list, catalog_sync, stock_api
 )
 
 urlpatterns = [
     path('stock/', stock_list, name='stock_list'),
+    path('stock/api/', stock_api, name='stock_api'),
     path('documents/', document_list, name='document_list'),
     path('documents/<int:pk>/', document_detail, name='document_detail'),
     path('documents/create/incoming/', incoming_form_view, name='incoming_transaction_create'),
     path('documents/create/outgoing/', outgoing_form_view, name='outgoing_transaction_create'),
     path('storekeeper/dashboard/', StorekeeperDashboardView.as_view(), name='storekeeper_dashboard'),
     path('documents/<int:document_id>/pdf/', document_pdf_view, name='document_pdf'),
+    path('documents/export/', document_export, name='document_export'),
+    path('documents/pick-list/', pick_list, name='pick_list'),
+    path('products/lookup/', product_lookup, name='product_lookup'),
+    path('products/sync/', catalog_sync, name='catalog_sync'),
+    path('changes/', stock_changes, name='stock_changes'),
 ]
@@ -1,12 +1,15 @@
 from django.template.loader import get_template
 from django.http import HttpResponse
-from weasyprint import HTML
 from django.conf import settings
 
 def render_to_pdf(template_path, context_dict={}):
     """
     Рендерит HTML-шаблон в PDF с помощью WeasyPrint.
     """
+    # WeasyPrint тяжелый и тянет системные библиотеки: импортируется только
+    # при рендеринге.
+    from weasyprint import HTML
+
     try:
         template = get_template(template_path)
         html_string = template.render(context_dict)
@@ -1,17 +1,32 @@
-from django.shortcuts import render, redirect, get_object_or_404
+from django.shortcuts import render, redirect, get_object_or_404, aget_object_or_404
 from django.contrib.auth.decorators import login_required, user_passes_test
 from django.contrib.auth.views import LoginView
 from django.views import View
 from .models import (
-    Document, Transaction, Inventory, Product, Warehouse
+    Document, Transaction, Inventory, Product, Warehouse, LOW_STOCK_THRESHOLD
 )
-from .forms import IncomingTransactionForm, OutgoingTransactionForm, DocumentForm
-from django.http import HttpResponse
-from django.template.loader import get_template
-from xhtml2pdf import pisa
+from .forms import IncomingTransactionForm, OutgoingTransactionForm, DocumentForm, ProductFormSet
+from .services import INCOMING, OUTGOING, find_posted_document, post_document
+from .catalog_sync import catalog_changes, parse_token
+from .outbox import committed_watermark, events_since, serialize_event
+from .pdf_export import FORMATS, MAX_MERGED_DOCUMENTS, export_ids, get_pool, render_html, render_pdfs
+from .pdf_render import html_to_pdf
+from .picking import MAX_WAVE_DOCUMENTS, plan_wave, wave_documents
+from .stock_api import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, json_lines, page, parse_fields, stock_rows
+from .read_models import document_author, document_context, documents_with_lines
+from reports.views import is_manager
+from django.core.exceptions import ValidationError
+from django.core.handlers.asgi import ASGIRequest
+from django.http import Http404, HttpResponse, HttpResponseBadRequest, JsonResponse, StreamingHttpResponse
+from django.template.response import TemplateResponse
+from django.views.decorators.gzip import gzip_page
 from django.views.generic import ListView
-from django.db.models import Sum
-from django.db import transaction as db_transaction
+from django.db.models import Q, Sum
+from django.db import connections, transaction as db_transaction
+from django.core.paginator import Paginator
+from asgiref.sync import sync_to_async
+from datetime import date
+from decimal import Decimal, InvalidOperation
 
 
 class CustomLoginView(LoginView):
@@ -29,77 +44,194 @@ def stock_list(request):
     return render(request, 'inventory/stock_list.html', {'stocks': []})
 
 
+# Сортировки журнала: параметр ?sort= → порядок строк. Сумма хранится в
+# документе (total_amount), поэтому сортировка по ней идет по индексу.
+DOCUMENT_LIST_ORDERING = {
+    'date': ('-date', '-pk'),
+    'amount': ('-total_amount', '-pk'),
+    'lines': ('-line_count', '-pk'),
+}
+
+
 @login_required
 def document_list(request):
-    documents = Document.objects.all().order_by('-date_created')
-    return render(request, 'inventory/document_list.html', {'documents': documents})
+    sort = request.GET.get('sort', 'date')
+    documents = Document.objects.order_by(*DOCUMENT_LIST_ORDERING.get(sort, DOCUMENT_LIST_ORDERING['date']))
+    try:
+        min_amount = Decimal(request.GET['min_amount']) if request.GET.get('min_amount') else None
+    except InvalidOperation:
+        min_amount = None
+    if min_amount is not None:
+        documents = documents.filter(total_amount__gte=min_amount)
+
+    page_obj = Paginator(documents, 25).get_page(request.GET.get('page'))
+    filters = request.GET.copy()
+    filters.pop('page', None)
+    return render(request, 'inventory/document_list.html', {
+        'page_obj': page_obj,
+        # Все номера страниц журнала — десятки тысяч ссылок; выводятся соседние и крайние.
+        'page_range': page_obj.paginator.get_elided_page_range(page_obj.number),
+        'sort': sort,
+        'min_amount': min_amount,
+        'filters': filters.urlencode(),
+    })
+
+
+# Асинхронные представления только читают данные: запросы выполняются через
+# асинхронный ORM, а рендеринг TemplateResponse Django выполняет сам в
+# синхронном потоке, поэтому шаблонам передаются уже загруженные списки.
+@login_required
+async def document_detail(request, pk):
+    document = await aget_object_or_404(documents_with_lines().annotate(author=document_author()), pk=pk)
+    return TemplateResponse(request, 'inventory/document_detail.html', document_context(document))
 
 
 @login_required
-def document_detail(request, pk):
-    document = get_object_or_404(Document, pk=pk)
-    transactions = document.transactions.all().select_related('product')
-    return render(request, 'inventory/document_detail.html', {
-        'document': document,
-        'transactions': transactions
+async def stock_changes(request):
+    """
+    Лента изменений остатков для синхронизации внешних систем.
+
+    ?since=<id последнего полученного события>&limit=<до 1000>. Ответ содержит
+    события после since и курсор next для следующего запроса.
+    """
+    try:
+        since = int(request.GET.get('since', 0))
+        limit = min(int(request.GET.get('limit', 500)), 1000)
+    except ValueError:
+        return HttpResponseBadRequest('Параметры since и limit должны быть целыми числами.')
+
+    until = await sync_to_async(committed_watermark)()
+    events = [serialize_event(row) async for row in events_since(since, limit, until)]
+    return JsonResponse({
+        'events': events,
+        'next': events[-1]['id'] if events else since,
     })
 
 
 @login_required
-def incoming_form_view(request):
-    if request.method == 'POST':
-        form = IncomingTransactionForm(request.POST)
-        if form.is_valid():
-            with db_transaction.atomic():
-                document = Document.objects.create(
-                    document_type='Приход',
-                    user=request.user
-                )
-                products = form.cleaned_data['products']
-                for item in products:
-                    Transaction.objects.create(
-                        document=document,
-                        product=item['product'],
-                        quantity=item['quantity'],
-                        price=item['price'],
-                        transaction_type='Приход'
-                    )
+async def product_lookup(request):
+    """Ищет товары по серийному номеру или названию (для сканеров и автодополнения)."""
+    query = request.GET.get('q', '').strip()
+    if not query:
+        return JsonResponse({'results': []})
+
+    products = Product.objects.filter(
+        Q(serial_number=query) | Q(product_name__icontains=query)
+    ).order_by('product_name').values(
+        'id', 'product_name', 'serial_number', 'minimum_stock_level'
+    )[:20]
+    return JsonResponse({'results': [product async for product in products]})
+
+
+@gzip_page
+@login_required
+async def catalog_sync(request):
+    """
+    Каталог для офлайн-сканеров: ?token=<токен прошлой синхронизации> отдает
+    только изменения после него, без токена — весь каталог. Ответ — JSON
+    Lines потоком, сжатый gzip, если клиент его принимает.
+    """
+    try:
+        since = parse_token(request.GET.get('token'))
+    except ValueError:
+        return HttpResponseBadRequest('Неверный token: передайте значение из прошлого ответа.')
+    return StreamingHttpResponse(
+        _streaming_content(request, catalog_changes(since)), content_type='application/x-ndjson; charset=utf-8'
+    )
+
+
+@gzip_page
+@login_required
+@user_passes_test(is_manager)
+async def stock_api(request):
+    """
+    Остатки для интеграций, только чтение; доступ тот же, что у отчета по
+    остаткам (reports.views.stock_report) — только менеджерам.
+
+    ?fields=product_id,serial_number,quantity — поля ответа (список в
+    stock_api.STOCK_API_FIELDS); ?warehouse=1,2 и ?product=1,2 — фильтры по
+    id, ?serial_number= — по артикулу; ?cursor=<next прошлой страницы>,
+    ?limit= до MAX_PAGE_SIZE. ?format=jsonl отдает все строки после cursor
+    потоком JSON Lines без разбивки на страницы.
+    """
+    try:
+        fields = parse_fields(request.GET.get('fields'))
+    except ValueError as error:
+        return HttpResponseBadRequest(str(error))
+    try:
+        warehouse_ids, product_ids = (
+            [int(value) for value in request.GET.get(name, '').split(',') if value] for name in ('warehouse', 'product')
+        )
+        cursor = int(request.GET['cursor']) if request.GET.get('cursor') else None
+        limit = int(request.GET.get('limit', DEFAULT_PAGE_SIZE))
+    except ValueError:
+        return HttpResponseBadRequest('warehouse и product — целые числа через запятую, cursor и limit — целые числа')
+    if not 1 <= limit <= MAX_PAGE_SIZE:
+        return HttpResponseBadRequest(f'limit — от 1 до {MAX_PAGE_SIZE}')
+
+    rows = stock_rows(fields, warehouse_ids, product_ids, request.GET.get('serial_number'), cursor)
+    if request.GET.get('format') == 'jsonl':
+        return StreamingHttpResponse(
+            _streaming_content(request, json_lines(rows, fields)), content_type='application/x-ndjson; charset=utf-8'
+        )
+    return JsonResponse(await sync_to_async(page)(rows, fields, limit), json_dumps_params={'ensure_ascii': False})
+
+
+def _post_from_forms(request, form_class, document_type, template_name):
+    # Повтор уже проведенного запроса (сканер потерял связь и отправил снова)
+    # отвечает тем же результатом после одного поиска по индексу, без
+    # валидации формы и повторного проведения. Ищутся только документы этого
+    # пользователя и этого типа: чужой ключ не подменяет проведение.
+    idempotency_key = request.headers.get('Idempotency-Key') or request.POST.get('idempotency_key')
+    if idempotency_key and len(idempotency_key) > 64:
+        return HttpResponseBadRequest('Ключ Idempotency-Key длиннее 64 символов.')
+    if request.method == 'POST' and idempotency_key and find_posted_document(idempotency_key, document_type, request.user):
+        return redirect('document_list')
+
+    form = form_class(request.POST or None)
+    formset = ProductFormSet(request.POST or None, prefix='products')
+    if request.method == 'POST' and form.is_valid() and document_type == OUTGOING:
+        # Наличие проверяется до проведения; проведение все равно перепроверяет
+        # остатки под блокировкой на случай одновременного расхода.
+        formset.warehouse = form.cleaned_data['warehouse']
+    if request.method == 'POST' and form.is_valid() and formset.is_valid():
+        # Контрагент выбирается для документа целиком и переходит в каждую строку.
+        counterparty = {
+            name: form.cleaned_data[name] for name in ('supplier', 'customer') if name in form.cleaned_data
+        }
+        items = [{**item_form.cleaned_data, **counterparty} for item_form in formset if item_form.cleaned_data]
+        try:
+            post_document(
+                document_type, form.cleaned_data['warehouse'], items,
+                idempotency_key=idempotency_key, user=request.user,
+            )
+        except ValidationError as error:
+            form.add_error(None, error)
+        else:
             return redirect('document_list')
-    else:
-        form = IncomingTransactionForm()
-    return render(request, 'inventory/incoming_form.html', {'form': form})
+    return render(request, template_name, {'form': form, 'formset': formset})
+
+
+@login_required
+def incoming_form_view(request):
+    return _post_from_forms(request, IncomingTransactionForm, INCOMING, 'inventory/incoming_form.html')
 
 
 @login_required
 def outgoing_form_view(request):
-    if request.method == 'POST':
-        form = OutgoingTransactionForm(request.POST)
-        if form.is_valid():
-            with db_transaction.atomic():
-                document = Document.objects.create(
-                    document_type='Расход',
-                    user=request.user
-                )
-                products = form.cleaned_data['products']
-                for item in products:
-                    Transaction.objects.create(
-                        document=document,
-                        product=item['product'],
-                        quantity=item['quantity'],
-                        price=item['price'],
-                        transaction_type='Расход'
-                    )
-            return redirect('document_list')
-    else:
-        form = OutgoingTransactionForm()
-    return render(request, 'inventory/outgoing_form.html', {'form': form})
+    return _post_from_forms(request, OutgoingTransactionForm, OUTGOING, 'inventory/outgoing_form.html')
 
 
 class StorekeeperDashboardView(View):
     def get(self, request, *args, **kwargs):
         total_products = Product.objects.count()
         total_quantity = Inventory.objects.aggregate(total_quantity=Sum('quantity'))['total_quantity'] or 0
-        low_stock_products = Product.objects.filter(inventory__quantity__lt=10).distinct()
+        low_stock_products = Product.objects.filter(inventory__quantity__lt=LOW_STOCK_THRESHOLD)
+        if connections[low_stock_products.db].features.can_distinct_on_fields:
+            # PostgreSQL: DISTINCT ON (id) сравнивает только ключ, а не все столбцы товара
+            low_stock_products = low_stock_products.order_by('pk').distinct('pk')
+        else:
+            low_stock_products = low_stock_products.distinct()
         
         context = {
             'total_products': total_products,
@@ -112,19 +244,105 @@ class StorekeeperDashboardView(View):
 
 @login_required
 def document_pdf_view(request, document_id):
-    document = get_object_or_404(Document, id=document_id)
-    template_path = 'inventory/document_pdf.html'
-    context = {'document': document}
-    response = HttpResponse(content_type='application/pdf')
+    document = get_object_or_404(documents_with_lines(), id=document_id)
+    html = render_html(document)
+    try:
+        pdf = html_to_pdf(html)
+    except ValueError:
+        return HttpResponse('We had some errors <pre>' + html + '</pre>')
+
+    response = HttpResponse(pdf, content_type='application/pdf')
     response['Content-Disposition'] = f'attachment; filename="document_{document.id}.pdf"'
+    return response
 
-    template = get_template(template_path)
-    html = template.render(context)
 
-    pisa_status = pisa.CreatePDF(
-        html, dest=response
-    )
+# Не больше стольких документов в одной выгрузке из веб-запроса; большие
+# пакеты выгружаются командой export_documents.
+MAX_EXPORT_DOCUMENTS = 2000
 
-    if pisa_status.err:
-        return HttpResponse('We had some errors <pre>' + html + '</pre>')
+
+@login_required
+async def document_export(request):
+    """
+    Пакетная выгрузка документов в PDF.
+
+    ?ids=1,2,3 и/или ?date_from=ГГГГ-ММ-ДД&date_to=ГГГГ-ММ-ДД; format=zip
+    (по умолчанию, файл на документ) или pdf (один сводный файл).
+    """
+    export_format = request.GET.get('format', 'zip')
+    try:
+        ids = [int(value) for value in request.GET.get('ids', '').split(',') if value]
+        date_from, date_to = (
+            date.fromisoformat(request.GET[name]) if request.GET.get(name) else None
+            for name in ('date_from', 'date_to')
+        )
+    except ValueError:
+        return HttpResponseBadRequest('ids — целые числа через запятую, даты — ГГГГ-ММ-ДД')
+    if export_format not in FORMATS:
+        return HttpResponseBadRequest('format: zip или pdf')
+    if not (ids or date_from or date_to):
+        return HttpResponseBadRequest('Укажите ids или диапазон дат')
+
+    document_ids = [pk async for pk in export_ids(ids, date_from, date_to)[:MAX_EXPORT_DOCUMENTS + 1]]
+    if not document_ids:
+        raise Http404('Документы не найдены')
+    if len(document_ids) > MAX_EXPORT_DOCUMENTS:
+        return HttpResponseBadRequest(f'Не больше {MAX_EXPORT_DOCUMENTS} документов за раз')
+    if export_format == 'pdf' and len(document_ids) > MAX_MERGED_DOCUMENTS:
+        return HttpResponseBadRequest(f'Сводный PDF — не больше {MAX_MERGED_DOCUMENTS} документов, выгрузите ZIP')
+
+    stream, content_type = FORMATS[export_format]
+    response = StreamingHttpResponse(
+        _streaming_content(request, stream(render_pdfs(document_ids, get_pool()))), content_type=content_type
+    )
+    response['Content-Disposition'] = f'attachment; filename="documents.{export_format}"'
     return response
+
+
+@login_required
+async def pick_list(request):
+    """
+    Лист отбора для волны расходных документов: ?ids=1,2,3 и/или
+    ?date=ГГГГ-ММ-ДД. По каждому складу — остановки в порядке обхода.
+    """
+    try:
+        ids = [int(value) for value in request.GET.get('ids', '').split(',') if value]
+        day = date.fromisoformat(request.GET['date']) if request.GET.get('date') else None
+    except ValueError:
+        return HttpResponseBadRequest('ids — целые числа через запятую, date — ГГГГ-ММ-ДД')
+    if not (ids or day):
+        return HttpResponseBadRequest('Укажите ids или date')
+
+    document_ids = [pk async for pk in wave_documents(ids, day)[:MAX_WAVE_DOCUMENTS + 1]]
+    if not document_ids:
+        raise Http404('Расходные документы не найдены')
+    if len(document_ids) > MAX_WAVE_DOCUMENTS:
+        return HttpResponseBadRequest(f'Не больше {MAX_WAVE_DOCUMENTS} документов в волне')
+
+    plan = await sync_to_async(plan_wave)(document_ids)
+    warehouses = {warehouse.pk: warehouse async for warehouse in Warehouse.objects.filter(pk__in=plan)}
+    return TemplateResponse(request, 'inventory/pick_list.html', {
+        'document_count': len(document_ids),
+        'waves': [(warehouses[warehouse_id], stops) for warehouse_id, stops in sorted(plan.items())],
+    })
+
+
+def _streaming_content(request, iterator):
+    """
+    Содержимое StreamingHttpResponse для сервера, принявшего запрос. Под ASGI
+    Django собрал бы синхронный итератор целиком в памяти, а под WSGI —
+    асинхронный, поэтому асинхронная обертка нужна только для ASGI.
+    """
+    if isinstance(request, ASGIRequest):
+        return _iterate_in_thread(iterator)
+    return iterator
+
+
+async def _iterate_in_thread(iterator):
+    """
+    Асинхронно отдает куски синхронного генератора, выполняя каждый его шаг
+    (запросы к базе, ожидание пула) вне цикла событий.
+    """
+    done = object()
+    while (chunk := await sync_to_async(next)(iterator, done)) is not done:
+        yield chunk
@@ -0,0 +1,65 @@
+import os
+import queue
+import threading
+from concurrent.futures import Future
+
+from django.conf import settings
+from django.db import close_old_connections, connection
+
+
+class WriteQueue:
+    """
+    Внутрипроцессная очередь записи.
+
+    Все задачи выполняются по одной в отдельном потоке-писателе, поэтому
+    одновременные проведения внутри процесса не конкурируют за блокировку
+    SQLite, а встают в очередь. Вызывающий поток ждет результата задачи;
+    исключения пробрасываются ему же.
+    """
+
+    def __init__(self):
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def submit(self, func, *args, **kwargs):
+        # Внутри уже открытой транзакции поток-писатель не увидит ее данных
+        # и будет ждать ее блокировку, поэтому такие вызовы выполняются сразу.
+        if not getattr(settings, 'SERIALIZE_DB_WRITES', False) or connection.in_atomic_block:
+            return func(*args, **kwargs)
+
+        self._ensure_worker()
+        future = Future()
+        self._queue.put((future, func, args, kwargs))
+        return future.result()
+
+    def _ensure_worker(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(
+                    target=self._run, name='inventory-write-queue', daemon=True
+                )
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            future, func, args, kwargs = self._queue.get()
+            if not future.set_running_or_notify_cancel():
+                continue
+            close_old_connections()
+            try:
+                future.set_result(func(*args, **kwargs))
+            except BaseException as exc:
+                future.set_exception(exc)
+
+    def _reset_after_fork(self):
+        # Потоки не переживают fork: дочерний процесс начинает с пустой очереди.
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+
+
+write_queue = WriteQueue()
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=write_queue._reset_after_fork)
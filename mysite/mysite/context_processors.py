@@ -0,0 +1,9 @@
+from django.conf import settings
+
+
+def fragment_cache(request):
+    """Срок и версия для ключей {% cache %} в шаблонах."""
+    return {
+        'fragment_timeout': settings.FRAGMENT_CACHE_TIMEOUT,
+        'fragment_version': settings.FRAGMENT_CACHE_VERSION,
+    }
@@ -0,0 +1,86 @@
+"""
+Маршрутизация запросов между основной базой и репликой.
+
+Отчеты и панели (приложения из REPLICA_APPS) читают с реплики 'replica',
+все остальное — с основной базы 'default'; запись всегда идет в основную.
+После того как пользователь что-то изменил, его запросы некоторое время
+(REPLICA_PIN_SECONDS) читают с основной базы, чтобы он сразу видел свои
+изменения, даже если реплика отстает. Сессии, пользователи и права всегда
+читаются с основной базы: отставание реплики не должно разлогинивать.
+"""
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+from django.utils.deprecation import MiddlewareMixin
+
+REPLICA_DB_ALIAS = 'replica'
+REPLICA_APPS = {'reports', 'dashboard'}
+PIN_COOKIE_NAME = 'db_primary_pin'
+PRIMARY_ONLY_APPS = {'admin', 'auth', 'contenttypes', 'sessions'}
+PRIMARY_ONLY_MODELS = {'inventory.staff', 'inventory.role'}
+
+_read_alias = ContextVar('read_alias', default=DEFAULT_DB_ALIAS)
+_primary_pinned = ContextVar('primary_pinned', default=False)
+
+
+def pin_primary():
+    """
+    Переводит чтения текущего запроса на основную базу и ставит в ответ метку,
+    по которой следующие запросы пользователя тоже читают с нее. Изменяющие
+    запросы закрепляются промежуточным слоем сами; код, который пишет во время
+    GET-запроса, вызывает эту функцию перед записью.
+    """
+    _read_alias.set(DEFAULT_DB_ALIAS)
+    _primary_pinned.set(True)
+
+
+class PrimaryReplicaRouter:
+    def db_for_read(self, model, **hints):
+        if REPLICA_DB_ALIAS not in settings.DATABASES:
+            return None
+        if model._meta.app_label in PRIMARY_ONLY_APPS or model._meta.label_lower in PRIMARY_ONLY_MODELS:
+            return DEFAULT_DB_ALIAS
+        return _read_alias.get()
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Реплика содержит те же данные, что и основная база.
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == DEFAULT_DB_ALIAS
+
+
+class ReplicaRoutingMiddleware(MiddlewareMixin):
+    """Выбирает базу для чтения по приложению представления и метке в cookie."""
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        app = view_func.__module__.partition('.')[0]
+        _primary_pinned.set(False)
+        if request.method not in ('GET', 'HEAD', 'OPTIONS'):
+            pin_primary()
+        elif (
+            REPLICA_DB_ALIAS in settings.DATABASES
+            and app in REPLICA_APPS
+            and PIN_COOKIE_NAME not in request.COOKIES
+        ):
+            _read_alias.set(REPLICA_DB_ALIAS)
+        else:
+            _read_alias.set(DEFAULT_DB_ALIAS)
+
+    def process_response(self, request, response):
+        pinned = _primary_pinned.get()
+        _read_alias.set(DEFAULT_DB_ALIAS)
+        _primary_pinned.set(False)
+        if pinned and response.status_code < 400:
+            response.set_cookie(
+                PIN_COOKIE_NAME, '1',
+                max_age=settings.REPLICA_PIN_SECONDS,
+                secure=settings.SESSION_COOKIE_SECURE,
+                httponly=True,
+                samesite='Lax',
+            )
+        return response
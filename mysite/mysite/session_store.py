@@ -0,0 +1,42 @@
+"""
+Сессии cached_db: читаются из кеша, записываются сразу в кеш и в базу.
+
+При кеше в памяти процесса у каждого воркера своя копия сессии: выход из
+системы в одном воркере удаляет сессию из базы и из своего кеша, но не из
+кеша соседей. Поэтому, если задан AUTH_CACHE_MAX_AGE, запись в кеше живет не
+дольше стольких секунд, после чего сессия перечитывается из базы.
+"""
+from django.conf import settings
+from django.contrib.sessions.backends import cached_db
+
+
+class CappedCache:
+    """Кеш, в котором записи живут не дольше max_age секунд."""
+
+    def __init__(self, cache, max_age):
+        self._cache = cache
+        self._max_age = max_age
+
+    def _timeout(self, timeout):
+        if isinstance(timeout, (int, float)):
+            return min(timeout, self._max_age)
+        return self._max_age
+
+    def set(self, key, value, timeout=None, version=None):
+        return self._cache.set(key, value, self._timeout(timeout), version)
+
+    async def aset(self, key, value, timeout=None, version=None):
+        return await self._cache.aset(key, value, self._timeout(timeout), version)
+
+    def __contains__(self, key):
+        return key in self._cache
+
+    def __getattr__(self, name):
+        return getattr(self._cache, name)
+
+
+class SessionStore(cached_db.SessionStore):
+    def __init__(self, session_key=None):
+        super().__init__(session_key)
+        if settings.AUTH_CACHE_MAX_AGE is not None:
+            self._cache = CappedCache(self._cache, settings.AUTH_CACHE_MAX_AGE)
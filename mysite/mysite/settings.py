@@ -10,6 +10,8 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.0/ref/settings/
 '''
 
+import os
+import sys
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -41,6 +43,40 @@ CSRF_COOKIE_SECURE = True
 SESSION_COOKIE_SAMESITE = 'None'
 SESSION_COOKIE_SECURE = True
 
+# Сессии читаются из кеша и записываются сразу в кеш и в базу (cached_db),
+# пользователь с ролью тоже берется из кеша (inventory.auth_backends), так
+# что обычный запрос не обращается к базе за сессией и пользователем.
+SESSION_ENGINE = 'mysite.session_store'
+# Вход проверяет первый бэкенд. ModelBackend оставлен на переходный период:
+# сессии, открытые до перехода на CachedModelBackend, записали его путь и без
+# него стали бы анонимными. Убрать, когда такие сессии истекут
+# (SESSION_COOKIE_AGE, по умолчанию две недели после выката).
+AUTHENTICATION_BACKENDS = [
+    'inventory.auth_backends.CachedModelBackend',
+    'django.contrib.auth.backends.ModelBackend',
+]
+
+# Кеш по умолчанию — память процесса. У каждого воркера он свой, и выход из
+# системы или смена роли в одном воркере не сбрасывают записи в остальных,
+# поэтому там сессия и пользователь хранятся не дольше AUTH_CACHE_MAX_AGE
+# секунд. С общим кешем (REDIS_URL) сброс виден всем воркерам сразу.
+if os.environ.get('REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.environ['REDIS_URL'],
+        }
+    }
+    AUTH_CACHE_MAX_AGE = None
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'warehousemanage',
+        }
+    }
+    AUTH_CACHE_MAX_AGE = 30
+
 
 # Application definition
 
@@ -63,6 +99,7 @@ MIDDLEWARE = [
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'mysite.db_router.ReplicaRoutingMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -73,31 +110,140 @@ TEMPLATES = [
     {
         'BACKEND': 'django.template.backends.django.DjangoTemplates',
         'DIRS': [BASE_DIR / 'templates'],
-        'APP_DIRS': True,
         'OPTIONS': {
             'context_processors': [
                 'django.template.context_processors.debug',
                 'django.template.context_processors.request',
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
+                'mysite.context_processors.fragment_cache',
+            ],
+            # Шаблоны разбираются один раз на процесс, а не при каждом запросе.
+            # Django включает этот загрузчик и сам, пока loaders не заданы; здесь
+            # он указан явно, чтобы не потерять его при добавлении загрузчиков.
+            # В разработке runserver сбрасывает его при изменении шаблонов.
+            'loaders': [
+                ('django.template.loaders.cached.Loader', [
+                    'django.template.loaders.filesystem.Loader',
+                    'django.template.loaders.app_directories.Loader',
+                ]),
             ],
         },
     },
 ]
 
+# Кеш фрагментов шаблонов ({% cache %}): меню и неизменные блоки отчетов.
+# Версия входит в ключ каждого фрагмента; с общим кешем (REDIS_URL) ее
+# меняют при выкладке (RELEASE), чтобы фрагменты старых шаблонов не
+# показывались новой версии. Кеш в памяти процесса очищается перезапуском.
+FRAGMENT_CACHE_TIMEOUT = 600
+FRAGMENT_CACHE_VERSION = os.environ.get('RELEASE', '1')
+
 WSGI_APPLICATION = 'mysite.wsgi.application'
 
 
 # Database
 # https://docs.djangoproject.com/en/5.0/ref/settings/#databases
 
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+# База данных выбирается переменными окружения. По умолчанию — SQLite рядом с
+# проектом; для нескольких воркеров используется PostgreSQL (DB_ENGINE=postgresql).
+DB_ENGINE = os.environ.get('DB_ENGINE', 'sqlite')
+
+# Боевой режим SQLite: WAL-журнал, ожидание блокировки вместо ошибки
+# "database is locked" и транзакции BEGIN IMMEDIATE, чтобы запись не падала
+# при повышении блокировки с чтения до записи. Отключается SQLITE_TUNING=0.
+SQLITE_TUNING = os.environ.get('SQLITE_TUNING', '1') != '0'
+
+SQLITE_TUNED_OPTIONS = {
+    'timeout': 30,  # busy timeout, секунды
+    'transaction_mode': 'IMMEDIATE',
+    'init_command': (
+        'PRAGMA journal_mode=WAL;'
+        'PRAGMA synchronous=NORMAL;'
+        'PRAGMA mmap_size=268435456;'
+        'PRAGMA cache_size=-64000;'
+        'PRAGMA temp_store=MEMORY;'
+    ),
+}
+
+if DB_ENGINE == 'postgresql':
+    # Пул соединений psycopg (DB_POOL_MAX_SIZE > 0) несовместим с постоянными
+    # соединениями Django, поэтому включается либо пул, либо CONN_MAX_AGE.
+    DB_POOL_MAX_SIZE = int(os.environ.get('DB_POOL_MAX_SIZE', '0'))
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': os.environ.get('DB_NAME', 'warehouse'),
+            'USER': os.environ.get('DB_USER', 'warehouse'),
+            'PASSWORD': os.environ.get('DB_PASSWORD', ''),
+            'HOST': os.environ.get('DB_HOST', 'localhost'),
+            'PORT': os.environ.get('DB_PORT', '5432'),
+            'CONN_MAX_AGE': 0 if DB_POOL_MAX_SIZE else int(os.environ.get('DB_CONN_MAX_AGE', '60')),
+            'CONN_HEALTH_CHECKS': True,
+            'OPTIONS': {
+                'pool': {
+                    'min_size': int(os.environ.get('DB_POOL_MIN_SIZE', '2')),
+                    'max_size': DB_POOL_MAX_SIZE,
+                    'timeout': int(os.environ.get('DB_POOL_TIMEOUT', '10')),
+                },
+            } if DB_POOL_MAX_SIZE else {},
+        }
+    }
+else:
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': os.environ.get('DB_NAME', BASE_DIR / 'db.sqlite3'),
+            'OPTIONS': SQLITE_TUNED_OPTIONS if SQLITE_TUNING else {},
+        }
+    }
+
+# Реплика для чтения отчетов и панелей (mysite.db_router). Включается, если
+# задан DB_REPLICA_NAME (для SQLite — путь ко второму файлу) или
+# DB_REPLICA_HOST; остальные параметры берутся из основной базы.
+if os.environ.get('DB_REPLICA_NAME') or os.environ.get('DB_REPLICA_HOST'):
+    DATABASES['replica'] = {
+        **DATABASES['default'],
+        'NAME': os.environ.get('DB_REPLICA_NAME', DATABASES['default']['NAME']),
+        'HOST': os.environ.get('DB_REPLICA_HOST', DATABASES['default'].get('HOST', '')),
+        'TEST': {'MIRROR': 'default'},
     }
+
+DATABASE_ROUTERS = ['mysite.db_router.PrimaryReplicaRouter']
+
+# Сколько секунд после изменения данных пользователь читает с основной базы.
+REPLICA_PIN_SECONDS = int(os.environ.get('DB_REPLICA_PIN_SECONDS', '5'))
+
+# Проведение документов выполняется через внутрипроцессную очередь записи
+# (inventory.write_queue): SQLite допускает только одного писателя. В PostgreSQL
+# одновременные проведения разводятся блокировками строк.
+SERIALIZE_DB_WRITES = DB_ENGINE != 'postgresql' and SQLITE_TUNING
+
+# Миграции inventory отстают от моделей, поэтому одноразовые базы (например,
+# PostgreSQL из pgtest.sh) строят схему прямо по моделям: DB_SCHEMA_FROM_MODELS=1
+# и "manage.py migrate --run-syncdb". Так же строятся базы "manage.py test".
+# Миграции отключаются у всех приложений, чтобы таблицы со ссылками друг на
+# друга создавались в одном проходе.
+if os.environ.get('DB_SCHEMA_FROM_MODELS') == '1' or sys.argv[1:2] == ['test']:
+    MIGRATION_MODULES = {app.rpartition('.')[2]: None for app in INSTALLED_APPS}
+
+
+# Приемник событий об изменении остатков (inventory.outbox), куда их
+# отправляет "manage.py dispatch_stock_events". Для вебхука:
+# {'BACKEND': 'inventory.outbox.WebhookSink', 'OPTIONS': {'url': 'https://...'}}
+STOCK_EVENT_SINK = {
+    'BACKEND': 'inventory.outbox.JsonLinesSink',
+    'OPTIONS': {'path': os.environ.get('STOCK_EVENT_LOG', BASE_DIR / 'stock_events.jsonl')},
 }
 
+# Процессов в пуле пакетной выгрузки документов в PDF (inventory.pdf_export).
+PDF_EXPORT_WORKERS = int(os.environ.get('PDF_EXPORT_WORKERS', os.cpu_count() or 1))
+
+# Журнал аудита остатков (inventory.audit) пишется пачками после фиксации
+# проведения: когда набирается столько записей или проходит столько секунд.
+AUDIT_LOG_BATCH_SIZE = 500
+AUDIT_LOG_FLUSH_INTERVAL = 1.0
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.0/ref/settings/#auth-password-validators
@@ -0,0 +1,19 @@
+#!/bin/sh
+# Проверка на одноразовом PostgreSQL: поднимает контейнер, строит схему по
+# моделям, сверяет агрегаты отчетов, прогоняет тесты и удаляет контейнер.
+set -e
+source .venv/bin/activate
+
+CONTAINER=warehouse-pgtest
+docker run -d --rm --name $CONTAINER \
+    -e POSTGRES_DB=warehouse -e POSTGRES_USER=warehouse -e POSTGRES_PASSWORD=warehouse \
+    -p ${PGTEST_PORT:-55432}:5432 postgres:16 >/dev/null
+trap "docker stop $CONTAINER >/dev/null" EXIT
+until docker exec $CONTAINER pg_isready -U warehouse >/dev/null 2>&1; do sleep 1; done
+
+export DB_ENGINE=postgresql DB_HOST=127.0.0.1 DB_PORT=${PGTEST_PORT:-55432}
+export DB_NAME=warehouse DB_USER=warehouse DB_PASSWORD=warehouse
+export DB_SCHEMA_FROM_MODELS=1 DB_POOL_MAX_SIZE=4
+python mysite/manage.py migrate --run-syncdb
+python mysite/manage.py verify_reports
+python mysite/manage.py test inventory reports
@@ -0,0 +1,147 @@
+"""
+ABC/XYZ-анализ ассортимента.
+
+ABC — по доле товара в выручке: A — товары, набирающие первые 80 % выручки,
+B — следующие 15 %, C — остальные. XYZ — по изменчивости спроса, то есть по
+коэффициенту вариации продаж по периодам: X — до 10 %, Y — до 25 %, Z — выше.
+
+Продажи загружаются одним агрегирующим запросом и превращаются в столбцы
+(товар, период, количество, выручка); дальше все считается векторно в NumPy,
+без циклов по товарам.
+"""
+from decimal import Decimal
+from operator import itemgetter
+
+import numpy as np
+from django.db import transaction as db_transaction
+from django.db.models import F, FloatField, Sum
+from django.db.models.functions import TruncMonth, TruncWeek
+
+from inventory.models import Transaction
+from inventory.services import OUTGOING
+
+from .models import ProductClassification
+
+ABC_THRESHOLDS = (0.80, 0.95)
+XYZ_THRESHOLDS = (0.10, 0.25)
+PERIODS = {'month': TruncMonth, 'week': TruncWeek}
+
+_ABC = np.array(['A', 'B', 'C'])
+_XYZ = np.array(['X', 'Y', 'Z'])
+_CENT = Decimal('0.01')
+
+
+def sales_columns(start, end, period='month'):
+    """
+    Расходы за [start, end], сгруппированные по товару и периоду, в виде
+    столбцов NumPy: (product_ids, period_index, quantities, revenues, n_periods).
+    """
+    rows = list(
+        Transaction.objects
+        .filter(document__document_type=OUTGOING, document__date__range=(start, end))
+        .annotate(period=PERIODS[period]('document__date'))
+        .values_list('product_id', 'period')
+        .annotate(
+            total_quantity=Sum('quantity'),
+            total_revenue=Sum(F('quantity') * F('price'), output_field=FloatField()),
+        )
+        .order_by()
+    )
+    return to_columns(rows, start, end, period)
+
+
+def to_columns(rows, start, end, period='month'):
+    """Строки (товар, начало периода, количество, выручка) → столбцы NumPy."""
+    count = len(rows)
+
+    def column(index, dtype, convert=None):
+        values = map(itemgetter(index), rows)
+        return np.fromiter(map(convert, values) if convert else values, dtype=dtype, count=count)
+
+    # Различных дат всего столько, сколько периодов: в номера переводятся
+    # только они, а не дата каждой строки.
+    distinct = sorted({row[1] for row in rows})
+    numbers = dict(zip(distinct, period_index(np.array(distinct, dtype='datetime64[D]'), start, period).tolist()))
+    return (
+        column(0, np.int64),
+        column(1, np.int64, numbers.__getitem__),
+        column(2, np.float64),
+        column(3, np.float64),
+        int(period_index(np.array([end], dtype='datetime64[D]'), start, period)[0]) + 1,
+    )
+
+
+def period_index(dates, start, period):
+    """Номер периода каждой даты, считая от периода, в который попадает start."""
+    if period == 'month':
+        return (dates.astype('datetime64[M]') - np.datetime64(start, 'M')).astype(np.int64)
+    monday = np.datetime64(start, 'D') - np.timedelta64(start.weekday(), 'D')
+    return (dates - monday).astype(np.int64) // 7
+
+
+def classify(product_ids, period_idx, quantities, revenues, n_periods):
+    """
+    ABC/XYZ-классы по столбцам продаж. Возвращает словарь столбцов
+    одинаковой длины, по одной позиции на каждый проданный товар.
+    """
+    products, inverse = np.unique(product_ids, return_inverse=True)
+    count = len(products)
+
+    # Матрица спроса товар × период; периоды без продаж остаются нулевыми
+    # и тоже участвуют в оценке изменчивости.
+    demand = np.bincount(
+        inverse * n_periods + period_idx, weights=quantities, minlength=count * n_periods
+    ).reshape(count, n_periods)
+    revenue = np.bincount(inverse, weights=revenues, minlength=count)
+
+    total = revenue.sum()
+    share = revenue / total if total > 0 else np.zeros(count)
+    order = np.argsort(-revenue, kind='stable')
+    # Товар попадает в класс по доле выручки, набранной до него.
+    preceding = np.cumsum(share[order]) - share[order]
+    abc = np.empty(count, dtype=_ABC.dtype)
+    abc[order] = _ABC[np.searchsorted(ABC_THRESHOLDS, preceding, side='right')]
+
+    mean = demand.mean(axis=1)
+    cv = np.divide(demand.std(axis=1), mean, out=np.full(count, np.inf), where=mean > 0)
+    xyz = _XYZ[np.searchsorted(XYZ_THRESHOLDS, cv, side='left')]
+
+    return {
+        'product_id': products,
+        'abc_class': abc,
+        'xyz_class': xyz,
+        'revenue': revenue,
+        'revenue_share': share,
+        'quantity': demand.sum(axis=1),
+        'demand_cv': cv,
+    }
+
+
+def save_classification(result, start, end, batch_size=2000):
+    """Заменяет сохраненную классификацию новой одной транзакцией."""
+    rows = zip(*(result[name].tolist() for name in (
+        'product_id', 'abc_class', 'xyz_class', 'revenue', 'revenue_share', 'quantity', 'demand_cv',
+    )))
+    objects = [
+        ProductClassification(
+            product_id=product_id,
+            abc_class=abc,
+            xyz_class=xyz,
+            revenue=Decimal(revenue).quantize(_CENT),
+            revenue_share=share,
+            quantity=int(quantity),
+            demand_cv=cv if np.isfinite(cv) else None,
+            period_start=start,
+            period_end=end,
+        )
+        for product_id, abc, xyz, revenue, share, quantity, cv in rows
+    ]
+    with db_transaction.atomic():
+        ProductClassification.objects.all().delete()
+        ProductClassification.objects.bulk_create(objects, batch_size=batch_size)
+    return len(objects)
+
+
+def refresh_classification(start, end, period='month'):
+    """Пересчитывает и сохраняет ABC/XYZ-классы за период. Возвращает число товаров."""
+    return save_classification(classify(*sales_columns(start, end, period)), start, end)
@@ -0,0 +1,144 @@
+import tempfile
+import time
+from datetime import date
+from pathlib import Path
+
+import numpy as np
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections
+
+from inventory.models import Customer, Document, Product, Supplier, Transaction, Warehouse
+from inventory.services import OUTGOING
+from reports.analytics import ABC_THRESHOLDS, XYZ_THRESHOLDS, classify, sales_columns, save_classification, to_columns
+from reports.models import ProductClassification
+
+START = date(2025, 1, 1)
+
+
+def _synthetic_rows(products, periods, density, seed):
+    """Строки агрегата продаж, как их вернул бы запрос sales_columns."""
+    rng = np.random.default_rng(seed)
+    product_ids, period_idx = np.nonzero(rng.random((products, periods)) < density)
+    # Спрос с разным средним и разбросом, цены по логнормальному закону.
+    base = rng.integers(1, 200, products)[product_ids]
+    quantities = np.maximum(1, rng.normal(base, base * rng.random(products)[product_ids])).astype(np.int64)
+    prices = rng.lognormal(5, 1, products)[product_ids].round(2)
+    dates = [date(START.year + month // 12, month % 12 + 1, 1) for month in range(periods)]
+    return [
+        (product_id + 1, dates[period], quantity, quantity * price)
+        for product_id, period, quantity, price in zip(
+            product_ids.tolist(), period_idx.tolist(), quantities.tolist(), prices.tolist()
+        )
+    ]
+
+
+def _classify_loop(rows, periods):
+    """Эталон: тот же расчет циклами по товарам на чистом Python."""
+    demand, revenue = {}, {}
+    for product_id, period, quantity, amount in rows:
+        index = (period.year - START.year) * 12 + period.month - START.month
+        demand.setdefault(product_id, [0.0] * periods)[index] += quantity
+        revenue[product_id] = revenue.get(product_id, 0.0) + amount
+
+    total = sum(revenue.values())
+    classes, accumulated = {}, 0.0
+    for product_id in sorted(revenue, key=lambda key: -revenue[key]):
+        abc = 'A' if accumulated < ABC_THRESHOLDS[0] else 'B' if accumulated < ABC_THRESHOLDS[1] else 'C'
+        accumulated += revenue[product_id] / total
+        values = demand[product_id]
+        mean = sum(values) / periods
+        cv = (sum((value - mean) ** 2 for value in values) / periods) ** 0.5 / mean
+        xyz = 'X' if cv <= XYZ_THRESHOLDS[0] else 'Y' if cv <= XYZ_THRESHOLDS[1] else 'Z'
+        classes[product_id] = abc + xyz
+    return classes
+
+
+class Command(BaseCommand):
+    help = (
+        'Бенчмарк ABC/XYZ-анализа на каталоге заданного размера: преобразование '
+        'строк в столбцы и расчет в NumPy против циклов на Python; с --database '
+        'также полный прогон (запрос, расчет, сохранение) на временной базе SQLite.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--products', type=int, default=100_000)
+        parser.add_argument('--periods', type=int, default=12, help='Месяцев в анализе')
+        parser.add_argument('--density', type=float, default=0.6,
+                            help='Доля пар товар × месяц, в которых были продажи')
+        parser.add_argument('--database', action='store_true',
+                            help='Дополнительно прогнать полный цикл на временной базе SQLite')
+
+    def handle(self, *args, **options):
+        periods = options['periods']
+        end = date(START.year + (periods - 1) // 12, (periods - 1) % 12 + 1, 28)
+        rows = _synthetic_rows(options['products'], periods, options['density'], seed=1)
+        self.stdout.write(f"Товаров: {options['products']}, строк агрегата: {len(rows)}")
+
+        started = time.perf_counter()
+        columns = to_columns(rows, START, end)
+        converted = time.perf_counter()
+        result = classify(*columns)
+        vectorized = time.perf_counter()
+        expected = _classify_loop(rows, periods)
+        looped = time.perf_counter()
+
+        mismatches = sum(
+            expected[product_id] != abc + xyz
+            for product_id, abc, xyz in zip(
+                result['product_id'].tolist(), result['abc_class'].tolist(), result['xyz_class'].tolist()
+            )
+        )
+        self.stdout.write(f'строки → столбцы   {converted - started:8.3f} с')
+        self.stdout.write(f'расчет NumPy       {vectorized - converted:8.3f} с')
+        self.stdout.write(f'циклы Python       {looped - vectorized:8.3f} с')
+        if mismatches:
+            raise CommandError(f'Классы расходятся с эталоном у {mismatches} товаров')
+        self.stdout.write(self.style.SUCCESS('Классы совпадают с эталоном'))
+
+        if options['database']:
+            self._run_database(rows, end)
+
+    def _run_database(self, rows, end):
+        db_settings = connections.settings[DEFAULT_DB_ALIAS]
+        if db_settings['ENGINE'] != 'django.db.backends.sqlite3':
+            raise CommandError('Прогон на базе предназначен для SQLite.')
+        original = {'NAME': db_settings['NAME'], 'OPTIONS': db_settings.get('OPTIONS', {})}
+        try:
+            with tempfile.TemporaryDirectory() as directory:
+                connections.close_all()
+                db_settings['NAME'] = str(Path(directory) / 'bench.sqlite3')
+                self._fill(rows)
+                started = time.perf_counter()
+                columns = sales_columns(START, end)
+                loaded = time.perf_counter()
+                result = classify(*columns)
+                classified = time.perf_counter()
+                count = save_classification(result, START, end)
+                saved = time.perf_counter()
+                self.stdout.write(f'запрос к базе      {loaded - started:8.3f} с')
+                self.stdout.write(f'расчет NumPy       {classified - loaded:8.3f} с')
+                self.stdout.write(f'сохранение         {saved - classified:8.3f} с ({count} товаров)')
+                connections.close_all()
+        finally:
+            db_settings.update(original)
+
+    def _fill(self, rows):
+        with connections[DEFAULT_DB_ALIAS].schema_editor() as editor:
+            for model in (Warehouse, Product, Supplier, Customer, Document, Transaction, ProductClassification):
+                editor.create_model(model)
+        warehouse = Warehouse.objects.create(name='Бенчмарк')
+        Product.objects.bulk_create(
+            [Product(pk=product_id, product_name=f'Товар {product_id}', serial_number=f'BENCH-{product_id}')
+             for product_id in sorted({row[0] for row in rows})],
+            batch_size=5000,
+        )
+        documents = {
+            period: Document.objects.create(document_type=OUTGOING, date=period)
+            for period in sorted({row[1] for row in rows})
+        }
+        Transaction.objects.bulk_create(
+            [Transaction(document=documents[period], product_id=product_id, quantity=quantity,
+                         price=round(amount / quantity, 2), warehouse=warehouse)
+             for product_id, period, quantity, amount in rows],
+            batch_size=5000,
+        )
@@ -0,0 +1,28 @@
+from datetime import date, timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from reports.analytics import PERIODS, refresh_classification
+
+
+class Command(BaseCommand):
+    help = (
+        'Пересчитывает ABC/XYZ-классификацию товаров по расходам за последние '
+        'полные месяцы и сохраняет ее для отчета.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--months', type=int, default=12, help='Глубина анализа, полных месяцев')
+        parser.add_argument('--period', choices=sorted(PERIODS), default='month',
+                            help='Период, по которому оценивается изменчивость спроса')
+
+    def handle(self, *args, **options):
+        end = timezone.localdate().replace(day=1) - timedelta(days=1)
+        months = end.year * 12 + end.month - options['months']
+        start = date(months // 12, months % 12 + 1, 1)
+
+        count = refresh_classification(start, end, options['period'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Классифицировано товаров: {count} (период {start:%d.%m.%Y} — {end:%d.%m.%Y})'
+        ))
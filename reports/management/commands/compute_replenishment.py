@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from reports.replenishment import HISTORY_DAYS, refresh_suggestions
+
+
+class Command(BaseCommand):
+    help = (
+        'Пересчитывает точки заказа и рекомендуемые заказы по парам товар × склад '
+        'по истории расходов и срокам поставки поставщиков.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=HISTORY_DAYS, help='Глубина истории продаж, дней')
+
+    def handle(self, *args, **options):
+        count = refresh_suggestions(timezone.localdate(), options['days'])
+        self.stdout.write(self.style.SUCCESS(f'Рассчитано пар товар × склад: {count}'))
@@ -0,0 +1,93 @@
+from datetime import date
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import Q
+
+from inventory.models import Document, Inventory, Product, Transaction, Warehouse
+from reports.queries import STOCK_MATRIX_PAGE_SIZE, low_stock, sales_by_product, stock_matrix, warehouse_totals
+
+
+class Command(BaseCommand):
+    help = (
+        'Проверяет агрегаты отчетов на текущей базе данных (SQLite или PostgreSQL): '
+        'создает небольшой набор данных, сравнивает результаты запросов с '
+        'ожидаемыми значениями и откатывает транзакцию.'
+    )
+
+    def handle(self, *args, **options):
+        self.stdout.write(f'База данных: {connection.vendor}')
+        errors = []
+        with transaction.atomic():
+            self._check(errors)
+            transaction.set_rollback(True)
+
+        if errors:
+            raise CommandError('Расхождения в отчетах:\n' + '\n'.join(errors))
+        self.stdout.write(self.style.SUCCESS('Агрегаты отчетов совпадают с ожидаемыми.'))
+
+    def _check(self, errors):
+        north = Warehouse.objects.create(name='Проверка А')
+        south = Warehouse.objects.create(name='Проверка Б')
+        bolt = Product.objects.create(product_name='Проверка болт', serial_number='VERIFY-1', minimum_stock_level=5)
+        nut = Product.objects.create(product_name='Проверка гайка', serial_number='VERIFY-2', minimum_stock_level=10)
+        Inventory.objects.bulk_create([
+            Inventory(product=bolt, warehouse=north, quantity=3),
+            Inventory(product=bolt, warehouse=south, quantity=50),
+            Inventory(product=nut, warehouse=north, quantity=10),
+        ])
+
+        sale = Document.objects.create(document_type='Расход', date=date(2024, 1, 15))
+        receipt = Document.objects.create(document_type='Приход', date=date(2024, 1, 10))
+        Transaction.objects.bulk_create([
+            Transaction(document=sale, product=bolt, quantity=3, price=Decimal('19.99'), warehouse=north),
+            Transaction(document=sale, product=bolt, quantity=2, price=Decimal('0.01'), warehouse=south),
+            Transaction(document=sale, product=nut, quantity=7, price=Decimal('1.10'), warehouse=north),
+            Transaction(document=receipt, product=nut, quantity=100, price=Decimal('0.50'), warehouse=north),
+        ])
+
+        verify_products = {'Проверка болт', 'Проверка гайка'}
+        sales = [row for row in sales_by_product() if row['product__product_name'] in verify_products]
+        expected_sales = [
+            {'product__product_name': 'Проверка гайка', 'total_quantity': 7, 'total_revenue': Decimal('7.70')},
+            {'product__product_name': 'Проверка болт', 'total_quantity': 5, 'total_revenue': Decimal('59.99')},
+        ]
+        if sales != expected_sales:
+            errors.append(f'sales_by_product: {sales} != {expected_sales}')
+        for row in sales:
+            if not isinstance(row['total_revenue'], Decimal):
+                errors.append(f'sales_by_product: выручка {row["total_revenue"]!r} не Decimal')
+
+        low = sorted(
+            (item.product.serial_number, item.warehouse.name)
+            for item in low_stock() if item.product.serial_number.startswith('VERIFY-')
+        )
+        expected_low = [('VERIFY-1', 'Проверка А')]
+        if low != expected_low:
+            errors.append(f'low_stock: {low} != {expected_low}')
+
+        # Страницы матрицы, на которых оказались проверочные товары (товары
+        # упорядочены по названию, в базе могут быть и другие).
+        warehouses = [north, south]
+        pages = {
+            Product.objects.filter(
+                Q(product_name__lt=product.product_name) | Q(product_name=product.product_name, pk__lt=product.pk)
+            ).count() // STOCK_MATRIX_PAGE_SIZE + 1
+            for product in (bolt, nut)
+        }
+        matrix = [
+            (row['product_name'], row['quantities'], row['total'])
+            for page_number in sorted(pages)
+            for row in stock_matrix(warehouses, page_number)[1] if row['product_id'] in (bolt.pk, nut.pk)
+        ]
+        expected_matrix = [
+            ('Проверка болт', [3, 50], 53),
+            ('Проверка гайка', [10, 0], 10),
+        ]
+        if matrix != expected_matrix:
+            errors.append(f'stock_matrix: {matrix} != {expected_matrix}')
+
+        totals = warehouse_totals(warehouses)
+        if totals != [13, 50]:
+            errors.append(f'warehouse_totals: {totals} != [13, 50]')
@@ -1,3 +1,54 @@
 from django.db import models
 
-# Create your models here.
+
+class ProductClassification(models.Model):
+    """
+    Результат ABC/XYZ-анализа по товару за период.
+
+    Пересчитывается целиком командой classify_products; страница отчета и
+    PDF только читают готовые строки.
+    """
+    ABC_CHOICES = [('A', 'A'), ('B', 'B'), ('C', 'C')]
+    XYZ_CHOICES = [('X', 'X'), ('Y', 'Y'), ('Z', 'Z')]
+
+    product = models.OneToOneField('inventory.Product', on_delete=models.CASCADE, related_name='classification')
+    abc_class = models.CharField(max_length=1, choices=ABC_CHOICES)
+    xyz_class = models.CharField(max_length=1, choices=XYZ_CHOICES)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2)
+    revenue_share = models.FloatField()
+    quantity = models.IntegerField()
+    demand_cv = models.FloatField(null=True, blank=True)  # коэффициент вариации спроса
+    period_start = models.DateField()
+    period_end = models.DateField()
+    computed_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['abc_class', 'xyz_class', '-revenue'], name='classification_cell_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.product_id}: {self.abc_class}{self.xyz_class}"
+
+
+class ReplenishmentSuggestion(models.Model):
+    """
+    Точка заказа и рекомендуемый заказ по паре товар × склад.
+
+    Пересчитывается целиком командой compute_replenishment; отчеты об
+    остатках только читают готовые значения.
+    """
+    product = models.ForeignKey('inventory.Product', on_delete=models.CASCADE)
+    warehouse = models.ForeignKey('inventory.Warehouse', on_delete=models.CASCADE)
+    average_daily_demand = models.FloatField()
+    lead_time_days = models.PositiveIntegerField()
+    safety_stock = models.IntegerField()
+    reorder_point = models.IntegerField()
+    order_quantity = models.IntegerField()  # 0, если остаток выше точки заказа
+    computed_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        unique_together = ('product', 'warehouse')
+
+    def __str__(self):
+        return f"{self.product_id}@{self.warehouse_id}: заказать {self.order_quantity}"
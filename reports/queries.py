@@ -0,0 +1,203 @@
+from django.core.paginator import Paginator
+from django.db.models import Count, F, OuterRef, Q, Subquery, Sum
+
+from inventory.models import CustomerActivity, Inventory, Lot, Product, SupplierActivity, Transaction
+
+from .models import ProductClassification, ReplenishmentSuggestion
+
+# Сколько строк классификации показывать на странице и в PDF.
+CLASSIFICATION_ROW_LIMIT = 500
+# Товаров на странице матрицы остатков.
+STOCK_MATRIX_PAGE_SIZE = 50
+# Горизонт отчета по истекающим партиям по умолчанию (дней) и предел строк.
+EXPIRING_SOON_DAYS = 30
+EXPIRING_ROW_LIMIT = 500
+# Отчеты по контрагентам: модель помесячных итогов и поле контрагента.
+COUNTERPARTY_REPORTS = {
+    'suppliers': (SupplierActivity, 'supplier'),
+    'customers': (CustomerActivity, 'customer'),
+}
+
+
+def stock_matrix(warehouses, page_number=None):
+    """
+    Страница матрицы остатков товар × склад. Товары идут по названию, столбцы —
+    склады warehouses. Остатки сводятся в базе условной агрегацией одним
+    запросом по строкам Inventory только товаров страницы, поэтому объем
+    работы не зависит от размера каталога.
+
+    Возвращает (страницу, строки, итоги страницы по складам). Строка — словарь
+    с товаром, списком остатков в порядке warehouses и итогом по строке.
+    """
+    products = Product.objects.order_by('product_name', 'pk').values_list('pk', 'product_name', 'serial_number')
+    page = Paginator(products, STOCK_MATRIX_PAGE_SIZE).get_page(page_number)
+    columns = [f'warehouse_{warehouse.pk}' for warehouse in warehouses]
+    pivot = {
+        row['product_id']: row
+        for row in Inventory.objects
+        .filter(product_id__in=[product[0] for product in page.object_list], warehouse__in=warehouses)
+        .values('product_id')
+        .annotate(**{
+            column: Sum('quantity', filter=Q(warehouse_id=warehouse.pk), default=0)
+            for column, warehouse in zip(columns, warehouses)
+        })
+        .order_by()
+    }
+    rows = []
+    for product_id, product_name, serial_number in page.object_list:
+        quantities = [pivot[product_id][column] for column in columns] if product_id in pivot else [0] * len(columns)
+        rows.append({
+            'product_id': product_id,
+            'product_name': product_name,
+            'serial_number': serial_number,
+            'quantities': quantities,
+            'total': sum(quantities),
+        })
+    page_totals = [sum(column) for column in zip(*(row['quantities'] for row in rows))] or [0] * len(columns)
+    return page, rows, page_totals
+
+
+def warehouse_totals(warehouses):
+    """Остатки по всем товарам на каждом из складов warehouses, в том же порядке."""
+    totals = dict(
+        Inventory.objects.filter(warehouse__in=warehouses)
+        .values_list('warehouse_id')
+        .annotate(total=Sum('quantity'))
+        .order_by()
+    )
+    return [totals.get(warehouse.pk, 0) for warehouse in warehouses]
+
+
+def low_stock():
+    """
+    Остатки, которые пора пополнить. Для пары с расчетом compute_replenishment
+    порог — ее точка заказа (остаток не выше нее), для остальных — минимальный
+    уровень товара (остаток ниже него). reorder_point и order_quantity — из
+    последнего расчета (None, если пара не считалась).
+    """
+    suggestion = ReplenishmentSuggestion.objects.filter(
+        product=OuterRef('product'), warehouse=OuterRef('warehouse')
+    )
+    return Inventory.objects \
+        .annotate(
+            reorder_point=Subquery(suggestion.values('reorder_point')[:1]),
+            order_quantity=Subquery(suggestion.values('order_quantity')[:1]),
+        ) \
+        .filter(
+            Q(reorder_point__isnull=False, quantity__lte=F('reorder_point'))
+            | Q(reorder_point__isnull=True, quantity__lt=F('product__minimum_stock_level'))
+        ) \
+        .select_related('product', 'warehouse')
+
+
+def expiring_lots(until, warehouse=None):
+    """
+    Партии с остатком, срок годности которых истекает не позже until (в том
+    числе уже просроченные), по возрастанию срока. Читает диапазон частичного
+    индекса lot_expiring_idx, а не все партии.
+    """
+    lots = Lot.objects.filter(quantity__gt=0, expiry_date__lte=until)
+    if warehouse is not None:
+        lots = lots.filter(warehouse=warehouse)
+    return lots.select_related('product', 'warehouse').order_by('expiry_date', 'id')[:EXPIRING_ROW_LIMIT]
+
+
+def sales_by_product():
+    """Продажи (расходные транзакции), сгруппированные по товару."""
+    return Transaction.objects.filter(document__document_type='Расход') \
+        .values('product__product_name') \
+        .annotate(
+            total_quantity=Sum('quantity'),
+            total_revenue=Sum(F('quantity') * F('price')),
+            # Для себестоимости нужна цена закупки, которой нет в расходной транзакции.
+            # Это потребует более сложного запроса или денормализации данных.
+            # Пока выведем отчет без себестоимости.
+        ).order_by('-total_quantity')
+
+
+async def classification_matrix():
+    """
+    Сводка ABC/XYZ: строки A/B/C, в каждой ячейки X/Y/Z с числом товаров
+    и выручкой.
+    """
+    cells = {
+        (row['abc_class'], row['xyz_class']): row
+        async for row in ProductClassification.objects.values('abc_class', 'xyz_class')
+        .annotate(products=Count('pk'), revenue=Sum('revenue')).order_by()
+    }
+    return [
+        {
+            'abc_class': abc,
+            'cells': [
+                cells.get((abc, xyz), {'abc_class': abc, 'xyz_class': xyz, 'products': 0, 'revenue': 0})
+                for xyz, _ in ProductClassification.XYZ_CHOICES
+            ],
+        }
+        for abc, _ in ProductClassification.ABC_CHOICES
+    ]
+
+
+def classification_rows(abc_class='', xyz_class=''):
+    """Классифицированные товары (при необходимости одной ячейки) по убыванию выручки."""
+    rows = ProductClassification.objects.select_related('product')
+    if abc_class:
+        rows = rows.filter(abc_class=abc_class)
+    if xyz_class:
+        rows = rows.filter(xyz_class=xyz_class)
+    return rows.order_by('-revenue')[:CLASSIFICATION_ROW_LIMIT]
+
+
+def shift_months(month, count):
+    """Первое число месяца, отстоящего от month на count месяцев."""
+    index = month.year * 12 + month.month - 1 + count
+    return month.replace(year=index // 12, month=index % 12 + 1, day=1)
+
+
+async def counterparty_ranking(kind, start, end, limit):
+    """
+    Топ контрагентов по сумме за месяцы [start, end] из помесячных итогов и
+    сравнение с предыдущим периодом той же длины. Возвращает (строки,
+    итог периода, итог предыдущего периода).
+    """
+    model, field = COUNTERPARTY_REPORTS[kind]
+    previous_start = shift_months(start, -((end.year - start.year) * 12 + end.month - start.month + 1))
+    rows = [
+        row async for row in model.objects.filter(period__range=(start, end))
+        .values(counterparty_id=F(f'{field}_id'), name=F(f'{field}__name'))
+        .annotate(
+            amount=Sum('amount'), quantity=Sum('quantity'), lines=Sum('line_count'),
+            products=Count('product_id', distinct=True),
+        )
+        .order_by('-amount', 'counterparty_id')[:limit]
+    ]
+    previous = {
+        counterparty_id: amount
+        async for counterparty_id, amount in model.objects.filter(
+            period__gte=previous_start, period__lt=start,
+            **{f'{field}_id__in': [row['counterparty_id'] for row in rows]},
+        ).values_list(f'{field}_id').annotate(total=Sum('amount')).order_by()
+    }
+    for row in rows:
+        row['previous_amount'] = previous.get(row['counterparty_id'], 0)
+        row['change'] = _change(row['amount'], row['previous_amount'])
+    totals = await model.objects.filter(period__gte=previous_start, period__lte=end).aaggregate(
+        current=Sum('amount', filter=Q(period__gte=start), default=0),
+        previous=Sum('amount', filter=Q(period__lt=start), default=0),
+    )
+    return rows, totals['current'], totals['previous']
+
+
+async def counterparty_products(kind, counterparty_id, start, end, limit):
+    """Товары одного контрагента за месяцы [start, end] по убыванию суммы."""
+    model, field = COUNTERPARTY_REPORTS[kind]
+    return [
+        row async for row in model.objects.filter(period__range=(start, end), **{f'{field}_id': counterparty_id})
+        .values('product_id', 'product__product_name', 'product__serial_number')
+        .annotate(amount=Sum('amount'), quantity=Sum('quantity'))
+        .order_by('-amount', 'product_id')[:limit]
+    ]
+
+
+def _change(current, previous):
+    """Изменение к предыдущему периоду в процентах; None, если раньше было 0."""
+    return (current - previous) * 100 / previous if previous else None
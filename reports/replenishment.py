@@ -0,0 +1,198 @@
+"""
+Точки заказа и рекомендуемые заказы по парам товар × склад.
+
+Спрос за срок поставки оценивается по истории ежедневных продаж: для каждой
+пары берутся скользящие суммы продаж за окна длиной в срок поставки, их
+среднее и разброс дают точку заказа
+
+    точка заказа = среднее + Z × стандартное отклонение,
+
+где Z соответствует целевому уровню сервиса. Когда остаток опускается до
+точки заказа, рекомендуется дозаказать до уровня "точка заказа + спрос за
+период между заказами". Все расчеты векторные: матрица пары × дни и
+кумулятивные суммы в NumPy.
+"""
+from datetime import timedelta
+from operator import itemgetter
+
+import numpy as np
+from django.db import transaction as db_transaction
+from django.db.models import OuterRef, Subquery, Sum
+
+from inventory.models import Inventory, Product, Supplier, Transaction
+from inventory.services import INCOMING, OUTGOING
+
+from .models import ReplenishmentSuggestion
+
+HISTORY_DAYS = 90
+REVIEW_DAYS = 14  # период между заказами: заказ покрывает спрос на этот срок
+SERVICE_LEVEL_Z = 1.65  # ~95 % окон без дефицита
+DEFAULT_LEAD_TIME_DAYS = Supplier._meta.get_field('lead_time_days').default
+# Ограничение памяти: матрица пары × дни обрабатывается кусками по столько строк.
+CHUNK_ROWS = 20_000
+# Идентификаторов товаров в одном запросе с IN: не больше предела числа
+# параметров запроса SQLite.
+ID_BATCH_SIZE = 900
+
+
+def id_batches(ids):
+    """Уникальные идентификаторы из массива ids пачками по ID_BATCH_SIZE."""
+    ids = np.unique(ids).tolist()
+    return (ids[start:start + ID_BATCH_SIZE] for start in range(0, len(ids), ID_BATCH_SIZE))
+
+
+def daily_sales(start, end):
+    """
+    Расходы за [start, end] по дням: столбцы NumPy
+    (product_ids, warehouse_ids, day_index, quantities).
+    """
+    rows = list(
+        Transaction.objects
+        .filter(document__document_type=OUTGOING, document__date__range=(start, end))
+        .values_list('product_id', 'warehouse_id', 'document__date')
+        .annotate(total_quantity=Sum('quantity'))
+        .order_by()
+    )
+    count = len(rows)
+
+    def column(index, convert=None):
+        values = map(itemgetter(index), rows)
+        return np.fromiter(map(convert, values) if convert else values, dtype=np.int64, count=count)
+
+    offsets = {day: (day - start).days for day in {row[2] for row in rows}}
+    return column(0), column(1), column(2, offsets.__getitem__), column(3)
+
+
+def lead_times(product_ids, since):
+    """
+    Срок поставки по каждому товару: у поставщика его последнего прихода
+    начиная с since, иначе срок по умолчанию. Последний приход находится
+    подзапросом по строкам одного товара, а не выборкой всех приходов.
+    """
+    latest = (
+        Transaction.objects
+        .filter(
+            product=OuterRef('pk'), document__document_type=INCOMING, document__date__gte=since,
+            supplier__isnull=False,
+        )
+        .order_by('-document__date', '-pk')
+        .values('supplier__lead_time_days')[:1]
+    )
+    lead = {}
+    for batch in id_batches(product_ids):
+        lead.update(
+            Product.objects.filter(pk__in=batch).annotate(lead_time_days=Subquery(latest))
+            .exclude(lead_time_days=None).values_list('pk', 'lead_time_days')
+        )
+    return np.fromiter(
+        (lead.get(product_id, DEFAULT_LEAD_TIME_DAYS) for product_id in product_ids.tolist()),
+        dtype=np.int64, count=len(product_ids),
+    )
+
+
+def rolling_lead_demand(demand, lead):
+    """
+    Среднее и стандартное отклонение спроса за срок поставки по скользящим
+    окнам: для строки i — суммы demand[i, t - lead[i]:t] по всем полным окнам.
+    """
+    rows, days = demand.shape
+    cumulative = np.zeros((rows, days + 1))
+    np.cumsum(demand, axis=1, out=cumulative[:, 1:])
+
+    ends = np.arange(days + 1)
+    starts = ends - lead[:, None]
+    full = starts >= 0
+    sums = cumulative - np.take_along_axis(cumulative, np.maximum(starts, 0), axis=1)
+    windows = full.sum(axis=1)
+
+    mean = np.where(full, sums, 0).sum(axis=1) / windows
+    variance = np.where(full, (sums - mean[:, None]) ** 2, 0).sum(axis=1) / windows
+    return mean, np.sqrt(variance)
+
+
+def suggest(product_ids, warehouse_ids, day_index, quantities, days, lead, on_hand):
+    """
+    Точки заказа и заказы по столбцам ежедневных продаж. lead и on_hand —
+    функции, возвращающие срок поставки и остаток для массивов пар.
+    """
+    # Пара кодируется одним целым: уникализация и сортировка по одному
+    # столбцу заметно быстрее, чем по двум.
+    base = int(warehouse_ids.max()) + 1 if len(warehouse_ids) else 1
+    keys, inverse = np.unique(product_ids * base + warehouse_ids, return_inverse=True)
+    pairs = np.stack([keys // base, keys % base], axis=1)
+    count = len(pairs)
+    lead_days = np.clip(lead(pairs[:, 0]), 1, days)
+    stock = on_hand(pairs)
+
+    order = np.argsort(inverse, kind='stable')
+    bounds = np.searchsorted(inverse[order], np.arange(0, count + CHUNK_ROWS, CHUNK_ROWS))
+    mean, std = np.empty(count), np.empty(count)
+    for chunk, (first, last) in zip(range(0, count, CHUNK_ROWS), zip(bounds, bounds[1:])):
+        selected = order[first:last]
+        size = min(CHUNK_ROWS, count - chunk)
+        demand = np.bincount(
+            (inverse[selected] - chunk) * days + day_index[selected],
+            weights=quantities[selected], minlength=size * days,
+        ).reshape(size, days)
+        mean[chunk:chunk + size], std[chunk:chunk + size] = rolling_lead_demand(
+            demand, lead_days[chunk:chunk + size]
+        )
+
+    daily = np.bincount(inverse, weights=quantities, minlength=count) / days
+    safety = np.ceil(SERVICE_LEVEL_Z * std)
+    reorder_point = np.ceil(mean) + safety
+    target = reorder_point + np.ceil(daily * REVIEW_DAYS)
+    order = np.where(stock <= reorder_point, np.maximum(target - stock, 0), 0)
+    return {
+        'product_id': pairs[:, 0],
+        'warehouse_id': pairs[:, 1],
+        'average_daily_demand': daily,
+        'lead_time_days': lead_days,
+        'safety_stock': safety.astype(np.int64),
+        'reorder_point': reorder_point.astype(np.int64),
+        'order_quantity': order.astype(np.int64),
+    }
+
+
+def stock_on_hand(pairs):
+    """Текущие остатки для массива пар (товар, склад); нет строки — ноль."""
+    balances = {}
+    for batch in id_batches(pairs[:, 0]):
+        balances.update(
+            ((product_id, warehouse_id), quantity)
+            for product_id, warehouse_id, quantity in Inventory.objects.filter(product_id__in=batch).values_list(
+                'product_id', 'warehouse_id', 'quantity'
+            )
+        )
+    return np.fromiter(
+        (balances.get(pair, 0) for pair in map(tuple, pairs.tolist())), dtype=np.int64, count=len(pairs)
+    )
+
+
+def save_suggestions(result, batch_size=2000):
+    """Заменяет сохраненные рекомендации новыми одной транзакцией."""
+    names = ('product_id', 'warehouse_id', 'average_daily_demand', 'lead_time_days',
+             'safety_stock', 'reorder_point', 'order_quantity')
+    objects = [
+        ReplenishmentSuggestion(**dict(zip(names, row)))
+        for row in zip(*(result[name].tolist() for name in names))
+    ]
+    with db_transaction.atomic():
+        ReplenishmentSuggestion.objects.all().delete()
+        ReplenishmentSuggestion.objects.bulk_create(objects, batch_size=batch_size)
+    return len(objects)
+
+
+def refresh_suggestions(end, days=HISTORY_DAYS):
+    """
+    Пересчитывает рекомендации по продажам за days дней, заканчивая end.
+    Возвращает число пар товар × склад.
+    """
+    start = end - timedelta(days=days - 1)
+    columns = daily_sales(start, end)
+    result = suggest(
+        *columns, days,
+        lead=lambda products: lead_times(products, start - timedelta(days=365)),
+        on_hand=stock_on_hand,
+    )
+    return save_suggestions(result)
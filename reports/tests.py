@@ -1,3 +1,206 @@
-from django.test import TestCase
+from datetime import date
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
+import numpy as np
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase
+from django.urls import resolve, reverse
+from mysite.db_router import (
+    PIN_COOKIE_NAME, REPLICA_DB_ALIAS, PrimaryReplicaRouter, ReplicaRoutingMiddleware, pin_primary,
+)
+
+from inventory.models import Document, Inventory, Product, Role, Staff, Supplier, Transaction, Warehouse
+from inventory.services import INCOMING, OUTGOING, post_document
+
+from .analytics import classify
+from .models import ReplenishmentSuggestion
+from .queries import low_stock
+from .replenishment import DEFAULT_LEAD_TIME_DAYS, lead_times, stock_on_hand
+
+
+class ReplenishmentTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.warehouse = Warehouse.objects.create(name='Основной')
+        cls.bolt = Product.objects.create(product_name='Болт', serial_number='SN-1', minimum_stock_level=5)
+        cls.nut = Product.objects.create(product_name='Гайка', serial_number='SN-2', minimum_stock_level=5)
+
+    def test_lead_time_comes_from_latest_supplier(self):
+        slow = Supplier.objects.create(name='Медленный', lead_time_days=30)
+        fast = Supplier.objects.create(name='Быстрый', lead_time_days=3)
+        for day, supplier in [(date(2024, 1, 10), fast), (date(2024, 2, 10), slow)]:
+            receipt = Document.objects.create(document_type=INCOMING, date=day)
+            Transaction.objects.create(
+                document=receipt, product=self.bolt, quantity=1, price=Decimal('1'), warehouse=self.warehouse,
+                supplier=supplier,
+            )
+        lead = lead_times(np.array([self.bolt.pk, self.nut.pk]), date(2024, 1, 1))
+        self.assertEqual(lead.tolist(), [30, DEFAULT_LEAD_TIME_DAYS])
+
+    def test_stock_on_hand_reads_only_given_products(self):
+        Inventory.objects.create(product=self.bolt, warehouse=self.warehouse, quantity=8)
+        Inventory.objects.create(product=self.nut, warehouse=self.warehouse, quantity=4)
+        pairs = np.array([[self.bolt.pk, self.warehouse.pk], [self.bolt.pk, self.warehouse.pk + 1]])
+        with self.assertNumQueries(1):
+            self.assertEqual(stock_on_hand(pairs).tolist(), [8, 0])
+
+    def test_low_stock_uses_reorder_point_when_computed(self):
+        # Болт выше минимума, но не выше точки заказа; гайка без расчета ниже минимума.
+        Inventory.objects.create(product=self.bolt, warehouse=self.warehouse, quantity=12)
+        Inventory.objects.create(product=self.nut, warehouse=self.warehouse, quantity=4)
+        ReplenishmentSuggestion.objects.create(
+            product=self.bolt, warehouse=self.warehouse, average_daily_demand=2, lead_time_days=5,
+            safety_stock=3, reorder_point=13, order_quantity=29,
+        )
+        rows = {item.product_id: item for item in low_stock()}
+        self.assertEqual(set(rows), {self.bolt.pk, self.nut.pk})
+        self.assertEqual(rows[self.bolt.pk].order_quantity, 29)
+
+        ReplenishmentSuggestion.objects.update(reorder_point=2)
+        Inventory.objects.filter(product=self.nut).update(quantity=5)
+        self.assertFalse(low_stock().exists())
+
+
+class AsyncReportViewTests(TestCase):
+    """Асинхронные отчеты через ASGI-клиент: права, запросы и рендеринг."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.manager = Staff.objects.create_user('manager', password='secret', role=Role.objects.create(role_name='Менеджер'))
+        cls.storekeeper = Staff.objects.create_user(
+            'storekeeper', password='secret', role=Role.objects.create(role_name='Кладовщик'),
+        )
+        cls.warehouse = Warehouse.objects.create(name='Основной')
+        cls.product = Product.objects.create(product_name='Болт', serial_number='SN-1', minimum_stock_level=5)
+        items = [{'product': cls.product, 'quantity': 4, 'price': Decimal('2.50')}]
+        post_document(INCOMING, cls.warehouse, items)
+        post_document(OUTGOING, cls.warehouse, [dict(items[0], quantity=1)])
+
+    def setUp(self):
+        cache.clear()
+
+    async def test_reports_render_for_manager(self):
+        await self.async_client.aforce_login(self.manager)
+        for name, text in [
+            ('stock_report', 'Болт'),
+            ('low_stock_report', 'Болт'),
+            ('expiring_report', 'Истекающие сроки годности'),
+            ('sales_profitability_report', 'Болт'),
+            ('inventory_turnover_report', 'Отгрузки'),
+            ('abc_xyz_report', 'ABC/XYZ'),
+            ('supplier_report', 'Закупки по поставщикам'),
+        ]:
+            with self.subTest(name):
+                response = await self.async_client.get(reverse(f'reports:{name}'))
+                self.assertContains(response, text)
+
+    async def test_reports_require_manager(self):
+        await self.async_client.aforce_login(self.storekeeper)
+        response = await self.async_client.get(reverse('reports:stock_report'))
+        self.assertEqual(response.status_code, 302)
+
+
+def demand_columns(demand, revenue):
+    """Столбцы продаж для classify из матрицы спроса товар × период и выручки товаров."""
+    demand = np.asarray(demand, dtype=np.float64)
+    products, periods = np.nonzero(np.ones_like(demand))
+    # Выручка товара целиком приходится на его первый период.
+    revenues = np.where(periods == 0, np.repeat(revenue, demand.shape[1]), 0.0)
+    return products + 1, periods, demand.ravel(), revenues, demand.shape[1]
+
+
+class ClassifyTests(SimpleTestCase):
+    def test_abc_boundaries(self):
+        # Доли 60/20/15/5 %: перед третьим товаром набрано ровно 80 %, перед
+        # четвертым — ровно 95 %; граница относится к следующему классу.
+        result = classify(*demand_columns([[1], [1], [1], [1]], [60.0, 20.0, 15.0, 5.0]))
+        self.assertEqual(result['abc_class'].tolist(), ['A', 'A', 'B', 'C'])
+        np.testing.assert_allclose(result['revenue_share'], [0.6, 0.2, 0.15, 0.05])
+
+    def test_abc_order_does_not_depend_on_product_ids(self):
+        result = classify(*demand_columns([[1], [1], [1]], [5.0, 15.0, 80.0]))
+        self.assertEqual(result['abc_class'].tolist(), ['C', 'B', 'A'])
+
+    def test_xyz_boundaries(self):
+        result = classify(*demand_columns(
+            [[10, 10], [9, 11], [10, 14], [4, 0]],
+            [1.0, 1.0, 1.0, 1.0],
+        ))
+        # Коэффициенты вариации: 0, ровно 0.10, 1/6 и 1.
+        np.testing.assert_allclose(result['demand_cv'], [0.0, 0.1, 1 / 6, 1.0])
+        self.assertEqual(result['xyz_class'].tolist(), ['X', 'X', 'Y', 'Z'])
+
+    def test_zero_demand_product(self):
+        with np.errstate(all='raise'):
+            result = classify(*demand_columns([[0, 0], [3, 3]], [0.0, 0.0]))
+        self.assertEqual(result['demand_cv'][0], np.inf)
+        self.assertEqual(result['xyz_class'].tolist(), ['Z', 'X'])
+        # Без выручки доли нулевые, а не NaN.
+        self.assertEqual(result['revenue_share'].tolist(), [0.0, 0.0])
+        self.assertEqual(result['quantity'].tolist(), [0.0, 6.0])
+
+    def test_single_period(self):
+        result = classify(*demand_columns([[7], [2]], [85.0, 15.0]))
+        self.assertEqual(result['demand_cv'].tolist(), [0.0, 0.0])
+        self.assertEqual(result['xyz_class'].tolist(), ['X', 'X'])
+        self.assertEqual(result['abc_class'].tolist(), ['A', 'B'])
+
+
+# Реплика объявляется только на время теста: роутер смотрит на ее наличие в
+# настройках, а сами тесты в базу не ходят.
+@mock.patch.dict(settings.DATABASES, {REPLICA_DB_ALIAS: settings.DATABASES[DEFAULT_DB_ALIAS]})
+class ReplicaRoutingTests(SimpleTestCase):
+    def setUp(self):
+        self.factory = RequestFactory()
+        self.router = PrimaryReplicaRouter()
+        self.middleware = ReplicaRoutingMiddleware(lambda request: HttpResponse())
+
+    def route(self, request, during_view=None):
+        """Прогоняет запрос через слой маршрутизации; возвращает базу чтения товаров и ответ."""
+        match = resolve(request.path)
+        self.middleware.process_view(request, match.func, match.args, match.kwargs)
+        if during_view:
+            during_view()
+        alias = self.router.db_for_read(Product)
+        return alias, self.middleware.process_response(request, HttpResponse())
+
+    def test_safe_report_request_reads_from_replica(self):
+        request = self.factory.get(reverse('reports:stock_report'))
+        alias, response = self.route(request)
+        self.assertEqual(alias, REPLICA_DB_ALIAS)
+        self.assertNotIn(PIN_COOKIE_NAME, response.cookies)
+        self.assertEqual(self.router.db_for_read(Product), DEFAULT_DB_ALIAS)
+
+    def test_users_are_read_from_primary(self):
+        request = self.factory.get(reverse('reports:stock_report'))
+        match = resolve(request.path)
+        self.middleware.process_view(request, match.func, match.args, match.kwargs)
+        self.assertEqual(self.router.db_for_read(Staff), DEFAULT_DB_ALIAS)
+        self.middleware.process_response(request, HttpResponse())
+
+    def test_unsafe_request_pins_reads_to_primary(self):
+        request = self.factory.post(reverse('reports:stock_report'))
+        alias, response = self.route(request)
+        self.assertEqual(alias, DEFAULT_DB_ALIAS)
+        self.assertEqual(response.cookies[PIN_COOKIE_NAME]['max-age'], settings.REPLICA_PIN_SECONDS)
+
+    def test_pin_cookie_is_honored_on_next_get(self):
+        request = self.factory.get(reverse('reports:stock_report'))
+        request.COOKIES[PIN_COOKIE_NAME] = '1'
+        alias, _ = self.route(request)
+        self.assertEqual(alias, DEFAULT_DB_ALIAS)
+
+    def test_write_during_safe_request_pins_explicitly(self):
+        request = self.factory.get(reverse('reports:stock_report'))
+        alias, response = self.route(request, during_view=pin_primary)
+        self.assertEqual(alias, DEFAULT_DB_ALIAS)
+        self.assertIn(PIN_COOKIE_NAME, response.cookies)
+
+    def test_write_routing_does_not_change_read_database(self):
+        request = self.factory.get(reverse('reports:stock_report'))
+        alias, _ = self.route(request, during_view=lambda: self.router.db_for_write(Product))
+        self.assertEqual(alias, REPLICA_DB_ALIAS)
@@ -7,8 +7,12 @@ urlpatterns = [
     path('', views.report_list, name='report_list'),
     path('stock/', views.stock_report, name='stock_report'),
     path('low-stock/', views.low_stock_report, name='low_stock_report'),
+    path('expiring/', views.expiring_report, name='expiring_report'),
     path('inventory-turnover/', views.inventory_turnover_report, name='inventory_turnover_report'),
     path('sales-profitability/', views.sales_profitability_report, name='sales_profitability_report'),
+    path('abc-xyz/', views.abc_xyz_report, name='abc_xyz_report'),
+    path('suppliers/', views.counterparty_report, {'kind': 'suppliers'}, name='supplier_report'),
+    path('customers/', views.counterparty_report, {'kind': 'customers'}, name='customer_report'),
 
     # PDF reports (временно отключены для исправления запуска сервера)
     # path('stock/pdf/', views.StockReportPDF.as_view(), name='stock_report_pdf'),
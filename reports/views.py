@@ -2,77 +2,195 @@ from django.shortcuts import render
 from django.contrib.auth.decorators import login_required, user_passes_test
 from django.db.models import Sum, F, ExpressionWrapper, DecimalField, Value, CharField
 from django.db.models.functions import Concat
-from inventory.models import Inventory, Transaction, Product
+from inventory.models import Inventory, Transaction, Product, Warehouse
+from .models import ProductClassification
+from .queries import (
+    EXPIRING_ROW_LIMIT, EXPIRING_SOON_DAYS, classification_matrix, classification_rows, counterparty_products,
+    counterparty_ranking, expiring_lots, low_stock, sales_by_product, shift_months, stock_matrix, warehouse_totals,
+)
 from django.views.generic import ListView, View
 from django.http import HttpResponse
 from django.template.loader import get_template
-from xhtml2pdf import pisa
+from django.template.response import TemplateResponse
+from asgiref.sync import sync_to_async
 import os
+from datetime import datetime, timedelta
 from django.conf import settings
+from django.utils import timezone
 
 def is_manager(user):
-    return user.is_authenticated and hasattr(user, 'role') and user.role.role_name == 'Менеджер'
+    return user.is_authenticated and hasattr(user, 'role') and user.role is not None and user.role.role_name == 'Менеджер'
 
 @login_required
 @user_passes_test(is_manager)
 def report_list(request):
     return render(request, 'reports/report_list.html')
 
-# ИСПРАВЛЕНО: Использует новую модель Inventory
+# Отчеты только читают данные, поэтому выполняются асинхронно: медленный отчет
+# не занимает поток воркера, пока ждет базу данных.
+# Матрица товар × склад: ?warehouse=1&warehouse=3 ограничивает столбцы
+# выбранными складами (по умолчанию все), ?page= листает товары. Страница
+# читает остатки только своих товаров.
 @login_required
 @user_passes_test(is_manager)
-def stock_report(request):
-    stocks = Inventory.objects.select_related('product', 'warehouse').order_by('warehouse__name', 'product__product_name')
+async def stock_report(request):
+    all_warehouses = [warehouse async for warehouse in Warehouse.objects.order_by('name')]
+    selected = {value for value in request.GET.getlist('warehouse') if value.isdigit()}
+    warehouses = [warehouse for warehouse in all_warehouses if str(warehouse.pk) in selected] or all_warehouses
+    page, rows, page_totals = await sync_to_async(stock_matrix)(warehouses, request.GET.get('page'))
+    # Итоги по всем товарам требуют прохода по всем остаткам выбранных складов,
+    # поэтому считаются только по запросу (?totals=1).
+    totals = await sync_to_async(warehouse_totals)(warehouses) if request.GET.get('totals') else None
+
+    filters = request.GET.copy()
+    filters.pop('page', None)
     context = {
-        'stocks': stocks
+        'report_title': 'Остатки по складам',
+        'all_warehouses': all_warehouses,
+        'warehouses': warehouses,
+        'selected_ids': {warehouse.pk for warehouse in warehouses} if selected else set(),
+        'page_obj': page,
+        'page_range': page.paginator.get_elided_page_range(page.number),
+        'rows': rows,
+        'page_totals': page_totals,
+        'page_grand_total': sum(page_totals),
+        'totals': totals,
+        'grand_total': sum(totals) if totals is not None else None,
+        'filters': filters.urlencode(),
     }
-    return render(request, 'reports/stock_report.html', context)
+    return TemplateResponse(request, 'reports/stock_report.html', context)
 
 # ИСПРАВЛЕНО: Использует новую модель Inventory
 @login_required
 @user_passes_test(is_manager)
-def low_stock_report(request):
-    low_stocks = Inventory.objects.filter(quantity__lt=F('product__minimum_stock_level')).select_related('product', 'warehouse')
+async def low_stock_report(request):
+    context = {
+        'low_stocks': [stock async for stock in low_stock()]
+    }
+    return TemplateResponse(request, 'reports/low_stock_report.html', context)
+
+# Партии, срок годности которых истекает в ближайшие ?days= дней (по
+# умолчанию EXPIRING_SOON_DAYS), включая просроченные; ?warehouse= — один склад.
+@login_required
+@user_passes_test(is_manager)
+async def expiring_report(request):
+    days = request.GET.get('days', '')
+    days = int(days) if days.isdigit() else EXPIRING_SOON_DAYS
+    warehouses = [warehouse async for warehouse in Warehouse.objects.order_by('name')]
+    warehouse = next((w for w in warehouses if str(w.pk) == request.GET.get('warehouse')), None)
+    today = timezone.localdate()
     context = {
-        'low_stocks': low_stocks
+        'report_title': 'Истекающие сроки годности',
+        'lots': [lot async for lot in expiring_lots(today + timedelta(days=days), warehouse)],
+        'row_limit': EXPIRING_ROW_LIMIT,
+        'days': days,
+        'today': today,
+        'warehouses': warehouses,
+        'warehouse': warehouse,
     }
-    return render(request, 'reports/low_stock_report.html', context)
+    return TemplateResponse(request, 'reports/expiring_report.html', context)
 
 # ИСПРАВЛЕНО: Логика отчета переписана под модель Transaction
 @login_required
 @user_passes_test(is_manager)
-def sales_profitability_report(request):
-    # Фильтруем только расходные транзакции
-    sales_transactions = Transaction.objects.filter(document__document_type='Расход') \
-        .values('product__product_name') \
-        .annotate(
-            total_quantity=Sum('quantity'),
-            total_revenue=Sum(F('quantity') * F('price')),
-            # Для себестоимости нужна цена закупки, которой нет в расходной транзакции.
-            # Это потребует более сложного запроса или денормализации данных.
-            # Пока выведем отчет без себестоимости.
-        ).order_by('-total_quantity')
-
-    # Расчет общих показателей
-    total_revenue = sales_transactions.aggregate(total=Sum('total_revenue'))['total'] or 0
-    total_sales_count = sales_transactions.count()
+async def sales_profitability_report(request):
+    sales_data = [row async for row in sales_by_product()]
+
+    # Расчет общих показателей по уже загруженным строкам, без повторных запросов
+    total_revenue = sum(row['total_revenue'] for row in sales_data)
 
     context = {
-        'sales_data': sales_transactions,
+        'sales_data': sales_data,
         'total_revenue': total_revenue,
-        'total_sales': total_sales_count,
+        'total_sales': len(sales_data),
         'gross_profit': 'N/A',
         'total_cogs': 'N/A', # Себестоимость пока не считаем
-        'top_selling_products': sales_transactions[:5]
+        'top_selling_products': sales_data[:5]
     }
-    return render(request, 'reports/sales_profitability_report.html', context)
+    return TemplateResponse(request, 'reports/sales_profitability_report.html', context)
 
 
 # ЗАГЛУШКА: Этот отчет требует сложной логики, временно отключен
 @login_required
 @user_passes_test(is_manager)
-def inventory_turnover_report(request):
+async def inventory_turnover_report(request):
     context = {
         'turnover_ratio': 'N/A' # Расчет требует данных о закупках
     }
-    return render(request, 'reports/inventory_turnover_report.html', context)
+    return TemplateResponse(request, 'reports/inventory_turnover_report.html', context)
+
+
+# Сама классификация считается командой classify_products; здесь только
+# читаются сохраненные результаты.
+@login_required
+@user_passes_test(is_manager)
+async def abc_xyz_report(request):
+    abc_class = request.GET.get('abc', '')
+    xyz_class = request.GET.get('xyz', '')
+    context = {
+        'report_title': 'ABC/XYZ-анализ',
+        'matrix': await classification_matrix(),
+        'items': [row async for row in classification_rows(abc_class, xyz_class)],
+        'abc_class': abc_class,
+        'xyz_class': xyz_class,
+        'period': await ProductClassification.objects.values('period_start', 'period_end', 'computed_at').afirst(),
+    }
+    if request.GET.get('pdf'):
+        return await sync_to_async(render_pdf)(
+            'reports/pdf/abc_xyz_report_pdf.html', context, 'abc_xyz_report.pdf'
+        )
+    return TemplateResponse(request, 'reports/abc_xyz_report.html', context)
+
+
+COUNTERPARTY_REPORT_TITLES = {'suppliers': 'Закупки по поставщикам', 'customers': 'Продажи по клиентам'}
+COUNTERPARTY_REPORT_LIMIT = 20
+
+
+# Отчеты по поставщикам и клиентам читают только помесячные итоги
+# (SupplierActivity, CustomerActivity), которые ведет проведение документов.
+# ?month=2024-05 — последний месяц периода (по умолчанию текущий),
+# ?months=3 — длина периода, ?counterparty=<id> — товары контрагента.
+@login_required
+@user_passes_test(is_manager)
+async def counterparty_report(request, kind):
+    try:
+        end = datetime.strptime(request.GET['month'], '%Y-%m').date()
+    except (KeyError, ValueError):
+        end = timezone.localdate().replace(day=1)
+    months = request.GET.get('months', '')
+    months = min(max(int(months), 1), 24) if months.isdigit() else 1
+    start = shift_months(end, 1 - months)
+
+    rows, total, previous_total = await counterparty_ranking(kind, start, end, COUNTERPARTY_REPORT_LIMIT)
+    counterparty = request.GET.get('counterparty', '')
+    selected = next((row for row in rows if str(row['counterparty_id']) == counterparty), None)
+    context = {
+        'report_title': COUNTERPARTY_REPORT_TITLES[kind],
+        'kind': kind,
+        'start': start,
+        'end': end,
+        'months': months,
+        'month': end.strftime('%Y-%m'),
+        'rows': rows,
+        'total': total,
+        'previous_total': previous_total,
+        'selected': selected,
+        'products': (
+            await counterparty_products(kind, selected['counterparty_id'], start, end, COUNTERPARTY_REPORT_LIMIT)
+            if selected else []
+        ),
+    }
+    return TemplateResponse(request, 'reports/counterparty_report.html', context)
+
+
+def render_pdf(template_name, context, filename):
+    # xhtml2pdf загружается при первом PDF, а не при импорте модуля представлений.
+    from xhtml2pdf import pisa
+
+    html = get_template(template_name).render(context)
+    response = HttpResponse(content_type='application/pdf')
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    pisa_status = pisa.CreatePDF(html, dest=response)
+    if pisa_status.err:
+        return HttpResponse('We had some errors <pre>' + html + '</pre>')
+    return response
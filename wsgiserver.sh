@@ -0,0 +1,10 @@
+#!/bin/sh
+# Боевой профиль по умолчанию: WSGI-сервер gunicorn, процессы с потоками.
+# На замере (README, «Нагрузочный тест») он быстрее ASGI на всех уровнях нагрузки.
+source .venv/bin/activate
+PYTHONPATH=. gunicorn mysite.wsgi:application \
+    --chdir mysite \
+    --bind 0.0.0.0:${PORT:-8000} \
+    --workers ${WEB_CONCURRENCY:-4} \
+    --threads ${WEB_THREADS:-8} \
+    --backlog 2048